@@ -0,0 +1,226 @@
+"""Benchmark the fetch, parse, join, search, route and map stages against synthetic GBFS feeds.
+
+Runs every stage for each helpers variant at several system sizes and reports the
+best and median wall time and the peak Python memory (tracemalloc; Arrow buffers
+are not counted). Results can be saved as a baseline and later compared to it:
+
+    python benchmark.py --sizes 500 5000 100000 --save benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json
+
+The comparison exits with status 1 when a stage is slower than baseline by more
+than --tolerance. Feeds and OSRM are served from a local HTTP server so the fetch
+and route stages go through the real transport (see stand_in.py); no outside
+network is used. Walking routes come from a contraction hierarchy built over a
+synthetic street grid (see local_routing.py). The route stages run with a cold
+route cache (emptied before every timed run) and a warm one.
+"""
+
+import argparse  # Import argparse for the command line
+import importlib.util  # Import importlib to load the deploy variants side by side
+import json  # Import json for the baseline file
+import os  # Import os for paths and the cache directory
+import socket  # Import socket to find a free port for the stand-in
+import statistics  # Import statistics for the median
+import sys  # Import sys for the exit status
+import tempfile  # Import tempfile to keep benchmark caches out of the app's cache
+import time  # Import time for timing
+import tracemalloc  # Import tracemalloc for peak memory
+
+import numpy as np  # Import numpy for synthetic data
+
+os.environ.setdefault('BIKESHARE_CACHE_DIR', tempfile.mkdtemp(prefix='bikeshare-bench-'))  # Before the app modules load
+os.environ['BIKESHARE_ROUTING_DIR'] = tempfile.mkdtemp(prefix='bikeshare-bench-routing-')  # Only the synthetic graph
+with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    STAND_IN_PORT = s.getsockname()[1]  # Every size's stand-in listens here
+os.environ['BIKESHARE_OSRM_URL'] = 'http://127.0.0.1:{}'.format(STAND_IN_PORT)  # Route through the stand-in
+
+import folium  # Import folium for the deploy variant's map
+import feeds  # Import the feed cache so each fetch starts cold
+import maps  # Import the map builders
+import routing  # Import the route cache so each cold run starts empty
+from geo import StationIndex  # Import the spatial index
+from local_routing import ContractionHierarchy, graph_path  # Import the offline router
+from stand_in import CENTER, StandInServer  # Import the local feed server
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIZES = [500, 5000, 20000, 100000]
+QUERIES = 50  # Searches per availability measurement
+GRID_NODES = 45  # Street grid of GRID_NODES x GRID_NODES intersections for the local router
+GRID_SPACING_M = 100.0  # Meters between intersections; the grid covers every query point
+
+
+# Define the function to time a stage and measure its peak memory
+def measure(function, repeat):
+    """Return {'best_s', 'median_s', 'peak_mb'}; setup work belongs outside function"""
+    function()  # Warm up imports and caches that are not part of the stage
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'best_s': min(times), 'median_s': statistics.median(times), 'peak_mb': peak / 2 ** 20}
+
+
+# Define the function to load a helpers module from a deploy folder
+def load_variant(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Define the function to build the walking graph of a synthetic street grid once
+def build_local_graph(center=CENTER, n=GRID_NODES, spacing_m=GRID_SPACING_M, profile='foot'):
+    """Contract an n x n grid of two-way streets around center and save it as profile's graph"""
+    path = graph_path(profile)
+    if os.path.exists(path):
+        return path
+    dlat = spacing_m / 111320.0
+    dlon = dlat / np.cos(np.radians(center[0]))
+    rows, cols = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    lat = center[0] + (rows.ravel() - n / 2) * dlat
+    lon = center[1] + (cols.ravel() - n / 2) * dlon
+    ids = np.arange(n * n).reshape(n, n)
+    a = np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()])
+    b = np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()])
+    seconds = np.full(2 * len(a), spacing_m / 1.4)  # Walking pace
+    ContractionHierarchy.build(lat, lon, np.concatenate([a, b]), np.concatenate([b, a]), seconds, 1.4).save(path)
+    return path
+
+
+# Define the function to time routes with an empty route cache
+def cold_routes(run_osrm, trips, profile):
+    routing._route_cache = routing.RouteCache(os.path.join(tempfile.mkdtemp(dir=os.environ['BIKESHARE_CACHE_DIR']),
+                                                           'routes.sqlite'))  # Cold: nothing cached
+    return [run_osrm(station, origin, profile) for origin, station in trips]
+
+
+# Define the function to list the stages of the root app
+def root_stages(status_url, latlon_url, points):
+    import helpers  # Root helpers (Streamlit caching works without a running app)
+
+    def query_station_status():
+        feeds._feed_cache = feeds.FeedCache()  # Cold: download and parse
+        return helpers.query_station_status(status_url)
+
+    status, latlon = query_station_status(), helpers.get_station_latlon(latlon_url)
+    data = helpers.StationJoiner()(status, latlon)
+    index = StationIndex.from_frame(latlon)
+    positions = index.positions(data['station_id'])  # Snapshot.index_positions
+    trips = [(p, helpers.get_dock_availability(p, data, index, positions=positions)) for p in points]
+    trips = [(p, station) for p, station in trips if station is not None]
+    build_local_graph()
+    estimator = helpers.get_travel_time_estimator()
+    warm = lambda profile: [helpers.run_osrm(station, p, profile) for p, station in trips]  # Cache filled by the warm-up run
+    return {
+        'query_station_status': query_station_status,
+        'join_latlon': lambda: helpers.join_latlon(status, latlon),
+        'join_station_table': lambda: helpers.StationJoiner()(status, latlon),
+        'build_station_index': lambda: StationIndex.from_frame(latlon),
+        'get_bike_availability': lambda: [helpers.get_bike_availability(p, data, [], index, positions=positions) for p in points],
+        'get_dock_availability': lambda: [helpers.get_dock_availability(p, data, index, positions=positions) for p in points],
+        'route_osrm_cold': lambda: cold_routes(helpers.run_osrm, trips, 'driving'),
+        'route_osrm_warm': lambda: warm('driving'),
+        'route_local_cold': lambda: cold_routes(helpers.run_osrm, trips, 'foot'),
+        'route_local_warm': lambda: warm('foot'),
+        'route_estimate': lambda: [estimator.estimate(p, station[1:], 'foot') for p, station in trips],
+        'build_map': lambda: maps.render_base_map(data),
+        'build_map_geojson': lambda: maps.render_base_map(data, lazy_popups=False),
+        'build_deck_layer': lambda: maps.station_deck_layer(data),
+    }
+
+
+# Define the function to list the stages of the Hugging Face deploy
+def huggingface_stages(status_url, latlon_url, points):
+    hf = load_variant('huggingface_helpers', os.path.join(ROOT, 'streamlit_app_for_Huggingface', 'helpers.py'))
+    status, latlon = hf.query_station_status(status_url), hf.get_station_latlon(latlon_url)
+    data = hf.join_latlon(status, latlon)
+
+    def build_map():
+        m = folium.Map(location=CENTER, zoom_start=13)
+        hf.station_layer(data).add_to(m)
+        return m.get_root().render()
+
+    return {
+        'query_station_status': lambda: hf.query_station_status(status_url),
+        'join_latlon': lambda: hf.join_latlon(status, latlon),
+        'get_bike_availability': lambda: [hf.get_bike_availability(p, data, []) for p in points],
+        'get_dock_availability': lambda: [hf.get_dock_availability(p, data) for p in points],
+        'build_map': build_map,
+    }
+
+
+VARIANTS = {'root': root_stages, 'huggingface': huggingface_stages}
+
+
+# Define the function to run every stage of the chosen variants at every size
+def run(sizes=SIZES, variants=tuple(VARIANTS), repeat=3, queries=QUERIES, osrm_latency_ms=0.0):
+    """Return {'variant/stage/n': measurement}"""
+    results = {}
+    for n in sizes:
+        server = StandInServer(STAND_IN_PORT, stations=n, ttl=None,
+                               latency_ms={'osrm': osrm_latency_ms}).start()  # Fixed synthetic feeds
+        rng = np.random.default_rng(1)
+        points = [(CENTER[0] + dlat, CENTER[1] + dlon) for dlat, dlon in rng.uniform(-0.02, 0.02, (queries, 2))]
+        try:
+            for variant in variants:
+                stages = VARIANTS[variant](server.url('/gbfs/station_status.json'),
+                                           server.url('/gbfs/station_information.json'), points)
+                for stage, function in stages.items():
+                    key = '{}/{}/{}'.format(variant, stage, n)
+                    results[key] = measure(function, repeat)
+                    print('{:<45} {:>10.2f} ms {:>10.2f} ms {:>9.1f} MB'.format(
+                        key, results[key]['best_s'] * 1000, results[key]['median_s'] * 1000, results[key]['peak_mb']))
+        finally:
+            server.close()
+    return results
+
+
+# Define the function to compare results with a saved baseline
+def compare(results, baseline, tolerance=1.25):
+    """Print the time and memory ratio of every stage in both runs; return the keys slower than tolerance"""
+    regressions = []
+    print('\n{:<45} {:>10} {:>10}'.format('stage', 'time x', 'memory x'))
+    for key in sorted(set(results) & set(baseline)):
+        time_ratio = results[key]['best_s'] / max(baseline[key]['best_s'], 1e-9)
+        memory_ratio = results[key]['peak_mb'] / max(baseline[key]['peak_mb'], 1e-9)
+        flag = ''
+        if time_ratio > tolerance:
+            regressions.append(key)
+            flag = '  <-- slower'
+        print('{:<45} {:>10.2f} {:>10.2f}{}'.format(key, time_ratio, memory_ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='station counts to generate')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage')
+    parser.add_argument('--osrm-latency-ms', type=float, default=0.0, help='delay of every stand-in OSRM answer')
+    parser.add_argument('--save', help='write the results to this baseline file')
+    parser.add_argument('--compare', help='compare with this baseline file')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed slowdown before failing')
+    args = parser.parse_args(argv)
+
+    print('{:<45} {:>13} {:>13} {:>12}'.format('variant/stage/stations', 'best', 'median', 'peak'))
+    results = run(args.sizes, args.variants, args.repeat, osrm_latency_ms=args.osrm_latency_ms)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\n{} stage(s) slower than the baseline'.format(len(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
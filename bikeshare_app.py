@@ -9,38 +9,36 @@ from helpers import *  # Import custom helper functions
 import folium  # Import folium for creating interactive maps
 from streamlit_folium import folium_static  # Import folium_static to render Folium maps in Streamlit
 
-# Example URL to fetch bike share data (replace with the actual URL from the resource_urls list)
-station_url = 'https://tor.publicbikesystem.net/ube/gbfs/v1/en/station_status.json'  
-latlon_url = "https://tor.publicbikesystem.net/ube/gbfs/v1/en/station_information"
+start_metrics_server()  # Prometheus /metrics when BIKESHARE_METRICS_PORT is set
+
+# Bike share systems from the configured gbfs.json auto-discovery URLs (Toronto by default)
+registry = get_system_registry()  # One background poller per system, shared by every session
+systems = list(registry.systems.values())
+system = st.sidebar.selectbox("Bike share system", systems, format_func=lambda s: s.name)  # Selection box for the system shown
+station_url = system.station_status_url  # Identifies the system's cached maps
 
 # Streamlit app setup
-st.title('Toronto Bike Share Station Status')  # Set the title of the app
-st.markdown('This dashboard tracks bike availability at each bike share station in Toronto.')  # Add a description
+st.title('{} Station Status'.format(system.name))  # Set the title of the app
+st.markdown('This dashboard tracks bike availability at each {} station.'.format(system.name))  # Add a description
 
 # Fetch data for initial visualization
-data_df = query_station_status(station_url)  # Get station status data
-latlon_df = get_station_latlon(latlon_url)  # Get station latitude and longitude data
-data = join_latlon(data_df, latlon_df)  # Join the status data with the location data
+snapshot = registry.snapshot(system.system_id)  # Latest data shared by every session
+data = snapshot.data  # Station status joined with location data
+station_index = snapshot.index  # Spatial index used by the bike and dock searches
+center = system_center(snapshot)  # Where the city-wide map opens
 
 # Display initial metrics
+headline = snapshot.metrics  # Headline numbers computed once per snapshot
+deltas = snapshot.changes.deltas if snapshot.changes is not None else {}  # Change since the previous refresh
 col1, col2, col3 = st.columns(3)  # Create three columns for metrics
 with col1:
-    st.metric(label="Bikes Available Now", value=sum(data['num_bikes_available']))  # Display total number of bikes available
-    st.metric(label="E-Bikes Available Now", value=sum(data["ebike"]))  # Display total number of e-bikes available
+    st.metric(label="Bikes Available Now", value=headline['bikes'], delta=deltas.get('bikes') or None)  # Display total number of bikes available
+    st.metric(label="E-Bikes Available Now", value=headline['ebikes'], delta=deltas.get('ebikes') or None)  # Display total number of e-bikes available
 with col2:
-    st.metric(label="Stations w Available Bikes", value=len(data[data['num_bikes_available'] > 0]))  # Display number of stations with available bikes
-    st.metric(label="Stations w Available E-Bikes", value=len(data[data['ebike'] > 0]))  # Display number of stations with available e-bikes
+    st.metric(label="Stations w Available Bikes", value=headline['stations_with_bikes'], delta=deltas.get('stations_with_bikes') or None)  # Display number of stations with available bikes
+    st.metric(label="Stations w Available E-Bikes", value=headline['stations_with_ebikes'], delta=deltas.get('stations_with_ebikes') or None)  # Display number of stations with available e-bikes
 with col3:
-    st.metric(label="Stations w Empty Docks", value=len(data[data['num_docks_available'] > 0]))  # Display number of stations with empty docks
-
-# Track metrics for delta calculation
-deltas = [
-    sum(data['num_bikes_available']),
-    sum(data["ebike"]),
-    len(data[data['num_bikes_available'] > 0]),
-    len(data[data['ebike'] > 0]),
-    len(data[data['num_docks_available'] > 0])
-]
+    st.metric(label="Stations w Empty Docks", value=headline['stations_with_docks'], delta=deltas.get('stations_with_docks') or None)  # Display number of stations with empty docks
 
 # Initialize variables for user input and state
 iamhere = 0
@@ -48,10 +46,13 @@ iamhere_return = 0
 findmeabike = False
 findmeadock = False
 input_bike_modes = []
+profile = 'foot'  # Travel mode to the station; walking unless the user drives there
 
 # Add sidebar selection for user inputs
 with st.sidebar:
     bike_method = st.selectbox("Are you looking to rent or return a bike?", ("Rent", "Return"))  # Selection box for rent or return
+    map_backend = st.selectbox("Map renderer", MAP_BACKENDS, help="pydeck draws with WebGL and stays smooth with many stations")  # Selection box for the map backend
+    show_all_stations = st.checkbox("Show all stations on the result map", help="Otherwise only the stations around you are drawn")  # Toggle viewport culling
     if bike_method == "Rent":
         input_bike_modes = st.multiselect("What kind of bikes are you looking to rent?", ["ebike", "mechanical"])  # Multi-select box for bike types
         st.subheader('Where are you located?')
@@ -59,7 +60,9 @@ with st.sidebar:
         input_city = st.text_input("City", "Toronto")  # Text input for city
         input_country = st.text_input("Country", "Canada")  # Text input for country
         drive = st.checkbox("I'm driving there.")  # Checkbox for driving option
-        findmeabike = st.button("Find me a bike!", type="primary")  # Button to find a bike
+        profile = 'driving' if drive else 'foot'  # Rank and route by the way the user gets to the bike
+        rank_by_time = st.checkbox("Compare nearby stations by travel time")  # Rank the closest stations with OSRM
+        findmeabike = st.button("Find me a bike!", type="primary") or st.session_state.pop("routed_rent", False)  # Button to find a bike; also set when its route arrives
         if findmeabike:
             if input_street != "":
                 iamhere = geocode(input_street + " " + input_city + " " + input_country)  # Geocode the input address
@@ -72,7 +75,9 @@ with st.sidebar:
         input_street_return = st.text_input("Street", "")  # Text input for street for return
         input_city_return = st.text_input("City", "Toronto")  # Text input for city for return
         input_country_return = st.text_input("Country", "Canada")  # Text input for country for return
-        findmeadock = st.button("Find me a dock!", type="primary")  # Button to find a dock
+        profile = 'cycling'  # The user rides the bike to the dock
+        rank_by_time_return = st.checkbox("Compare nearby stations by travel time")  # Rank the closest stations with OSRM
+        findmeadock = st.button("Find me a dock!", type="primary") or st.session_state.pop("routed_return", False)  # Button to find a dock; also set when its route arrives
         if findmeadock:
             if input_street_return != "":
                 iamhere_return = geocode(input_street_return + " " + input_city_return + " " + input_country_return)  # Geocode the return address
@@ -83,121 +88,68 @@ with st.sidebar:
 
 # Initial map setup based on user selection
 if bike_method == "Return" and findmeadock == False:
-    center = [43.65306613746548, -79.38815311015]  # Coordinates for Toronto
-    m = folium.Map(location=center, zoom_start=13, tiles='cartodbpositron')  # Create a map with a grey background
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])  # Determine marker color based on bikes available
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=2,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.7,
-            popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                               f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                               f"Mechanical Bike Available: {row['mechanical']}<br>"
-                               f"eBike Available: {row['ebike']}", max_width=300)
-        ).add_to(m)
-    folium_static(m)  # Display the map in the Streamlit app
+    show_station_map(station_url, snapshot, backend=map_backend, center=center)  # Cached city-wide map for the current snapshot
 
 if bike_method == "Rent" and findmeabike == False:
-    center = [43.65306613746548, -79.38815311015]  # Coordinates for Toronto
-    m = folium.Map(location=center, zoom_start=13, tiles='cartodbpositron')  # Create a map with a grey background
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])  # Determine marker color based on bikes available
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=2,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.7,
-            popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                               f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                               f"Mechanical Bike Available: {row['mechanical']}<br>"
-                               f"eBike Available: {row['ebike']}", max_width=300)
-        ).add_to(m)
-    folium_static(m)  # Display the map in the Streamlit app
+    show_station_map(station_url, snapshot, backend=map_backend, center=center)  # Cached city-wide map for the current snapshot
 
 # Logic for finding a bike
 if findmeabike:
     if input_street != "":
         if iamhere != "":
-            chosen_station = get_bike_availability(iamhere, data, input_bike_modes)  # Get bike availability (id, lat, lon)
-            center = iamhere  # Center the map on user's location
-            m1 = folium.Map(location=center, zoom_start=16, tiles='cartodbpositron')  # Create a detailed map
-            for _, row in data.iterrows():
-                marker_color = get_marker_color(row['num_bikes_available'])  # Determine marker color based on bikes available
-                folium.CircleMarker(
-                    location=[row['lat'], row['lon']],
-                    radius=2,
-                    color=marker_color,
-                    fill=True,
-                    fill_color=marker_color,
-                    fill_opacity=0.7,
-                    popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                                       f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                                       f"Mechanical Bike Available: {row['mechanical']}<br>"
-                                       f"eBike Available: {row['ebike']}", max_width=300)
-                ).add_to(m1)
-            folium.Marker(
-                location=iamhere,
-                popup="You are here.",
-                icon=folium.Icon(color="blue", icon="person", prefix="fa")
-            ).add_to(m1)
-            folium.Marker(location=(chosen_station[1], chosen_station[2]),
-                          popup="Rent your bike here.",
-                          icon=folium.Icon(color="red", icon="bicycle", prefix="fa")
-                          ).add_to(m1)
-            coordinates, duration = run_osrm(chosen_station, iamhere)  # Get route coordinates and duration
-            folium.PolyLine(
-                locations=coordinates,
-                color="blue",
-                weight=5,
-                tooltip="it'll take you {} to get here.".format(duration),
-            ).add_to(m1)
-            folium_static(m1)  # Display the map in the Streamlit app
-            with col3:
-                st.metric(label=":green[Travel Time (min)]", value=duration)  # Display travel time
+            search_system, search_snapshot = system_for_location(registry, iamhere, system)  # The system that serves this location
+            if search_system != system:
+                st.info('Showing {} stations, the system closest to you.'.format(search_system.name))
+            chosen_station = get_bike_availability(iamhere, search_snapshot.data, input_bike_modes, search_snapshot.index, k=5 if rank_by_time else 1, profile=profile, positions=search_snapshot.index_positions)  # Get bike availability (id, lat, lon)
+            if chosen_station is None:
+                st.subheader(':red[No station with the bikes you want was found.]')  # Every matching station is empty or out of service
+            else:
+                coordinates, duration, estimated, pending = route_or_estimate(chosen_station, iamhere, profile)  # Cached route, or an estimate while it is routed
+                if estimated:
+                    duration = "~{}".format(duration)  # Estimated from the straight-line distance
+                if pending is not None:
+                    rerun_when_routed(pending, "routed_rent")  # Show the real route as soon as it arrives
+                show_station_map(
+                    search_system.station_status_url, search_snapshot,
+                    view=(iamhere, 16),  # Center the detailed map on user's location
+                    markers=[(iamhere, "You are here.", "blue", "person"),
+                             ((chosen_station[1], chosen_station[2]), "Rent your bike here.", "red", "bicycle")],
+                    route=(coordinates, "it'll take you {} to get here.".format(duration)),
+                    backend=map_backend,
+                    show_all=show_all_stations,
+                )  # Cached base map plus this search's overlays
+                with col3:
+                    st.metric(label=":green[Travel Time (min)]", value=duration)  # Display travel time
 
 # Logic for finding a dock
 if findmeadock:
     if input_street_return != "":
         if iamhere_return != "":
-            chosen_station = get_dock_availability(iamhere_return, data)  # Get dock availability (id, lat, lon)
-            center = iamhere_return  # Center the map on user's location
-            m1 = folium.Map(location=center, zoom_start=16, tiles='cartodbpositron')  # Create a detailed map
-            for _, row in data.iterrows():
-                marker_color = get_marker_color(row['num_bikes_available'])  # Determine marker color based on bikes available
-                folium.CircleMarker(
-                    location=[row['lat'], row['lon']],
-                    radius=2,
-                    color=marker_color,
-                    fill=True,
-                    fill_color=marker_color,
-                    fill_opacity=0.7,
-                    popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                                       f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                                       f"Mechanical Bike Available: {row['mechanical']}<br>"
-                                       f"eBike Available: {row['ebike']}", max_width=300)
-                ).add_to(m1)
-            folium.Marker(
-                location=iamhere_return,
-                popup="You are here.",
-                icon=folium.Icon(color="blue", icon="person", prefix="fa")
-            ).add_to(m1)
-            folium.Marker(location=(chosen_station[1], chosen_station[2]),
-                          popup="Return your bike here.",
-                          icon=folium.Icon(color="red", icon="bicycle", prefix="fa")
-                          ).add_to(m1)
-            coordinates, duration = run_osrm(chosen_station, iamhere_return)  # Get route coordinates and duration
-            folium.PolyLine(
-                locations=coordinates,
-                color="blue",
-                weight=5,
-                tooltip="it'll take you {} to get here.".format(duration),
-            ).add_to(m1)
-            folium_static(m1)  # Display the map in the Streamlit app
-            with col3:
-                st.metric(label=":green[Travel Time (min)]", value=duration)  # Display travel time
\ No newline at end of file
+            search_system, search_snapshot = system_for_location(registry, iamhere_return, system)  # The system that serves this location
+            if search_system != system:
+                st.info('Showing {} stations, the system closest to you.'.format(search_system.name))
+            chosen_station = get_dock_availability(iamhere_return, search_snapshot.data, search_snapshot.index, k=5 if rank_by_time_return else 1, profile=profile, positions=search_snapshot.index_positions)  # Get dock availability (id, lat, lon)
+            if chosen_station is None:
+                st.subheader(':red[No station with a free dock was found.]')  # Every station is full or out of service
+            else:
+                coordinates, duration, estimated, pending = route_or_estimate(chosen_station, iamhere_return, profile)  # Cached route, or an estimate while it is routed
+                if estimated:
+                    duration = "~{}".format(duration)  # Estimated from the straight-line distance
+                if pending is not None:
+                    rerun_when_routed(pending, "routed_return")  # Show the real route as soon as it arrives
+                show_station_map(
+                    search_system.station_status_url, search_snapshot,
+                    view=(iamhere_return, 16),  # Center the detailed map on user's location
+                    markers=[(iamhere_return, "You are here.", "blue", "person"),
+                             ((chosen_station[1], chosen_station[2]), "Return your bike here.", "red", "bicycle")],
+                    route=(coordinates, "it'll take you {} to get here.".format(duration)),
+                    backend=map_backend,
+                    show_all=show_all_stations,
+                )  # Cached base map plus this search's overlays
+                with col3:
+                    st.metric(label=":green[Travel Time (min)]", value=duration)  # Display travel time
+
+# Optional debug panel with stage timings and cache counters
+with st.sidebar:
+    if st.checkbox("Show performance metrics"):
+        show_metrics_panel()  # Process-wide timings, hit rates and a Prometheus export
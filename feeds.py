@@ -0,0 +1,99 @@
+"""GBFS feed cache that follows each document's own ttl and last_updated."""
+
+import threading  # Import threading to guard the shared state
+import time  # Import time for expiry bookkeeping
+from collections import OrderedDict  # Import OrderedDict for the bounded cache
+
+import gbfs  # Import the JSON decoders
+import metrics  # Import the stage timings and cache counters
+import transport  # Import the shared HTTP transport
+
+MIN_TTL = 5  # Seconds; floor for feeds that publish ttl=0 or run behind their own clock
+
+
+class FeedEntry:
+    """Decoded frame of one feed plus the validators needed to revalidate it"""
+
+    def __init__(self):
+        self.frame = None
+        self.etag = None
+        self.last_modified = None
+        self.last_updated = None
+        self.ttl = 0
+        self.expires_at = 0.0
+        self.lock = threading.Lock()  # One download per feed at a time
+
+
+class FeedCache:
+    """Bounded cache of parsed GBFS feeds
+
+    A feed is served from memory until last_updated + ttl. After that it is
+    revalidated with If-None-Match / If-Modified-Since, and a 304 keeps the
+    decoded frame instead of downloading and parsing it again.
+    """
+
+    def __init__(self, max_entries=32, min_ttl=MIN_TTL):
+        self.max_entries = max_entries
+        self.min_ttl = min_ttl
+        self._entries = OrderedDict()  # (url, parser) -> FeedEntry
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = FeedEntry()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # Drop the least recently used feed
+            return entry
+
+    def _expiry(self, document, now):
+        ttl = document.get('ttl', 0) or 0
+        last_updated = document.get('last_updated') or now
+        return max(last_updated + ttl, now + self.min_ttl)
+
+    def get(self, url, parse, decode=gbfs.loads):
+        """Return parse(decode(body)) for url, downloading only when the feed may have changed"""
+        entry = self._entry((url, parse))
+        with entry.lock:
+            now = time.time()
+            if entry.frame is not None and now < entry.expires_at:
+                metrics.lookup('feed', hit=True)
+                return entry.frame
+            headers = {}
+            if entry.frame is not None:
+                if entry.etag:
+                    headers['If-None-Match'] = entry.etag
+                if entry.last_modified:
+                    headers['If-Modified-Since'] = entry.last_modified
+            with metrics.timed('fetch'):
+                response = transport.get(url, headers=headers)
+            if response.status_code == 304 and entry.frame is not None:
+                metrics.lookup('feed', hit=True)  # Revalidated without downloading
+                entry.expires_at = now + max(entry.ttl, self.min_ttl)  # Unchanged; check again after one more ttl
+                return entry.frame
+            metrics.lookup('feed', hit=False)
+            response.raise_for_status()
+            with metrics.timed('parse'):
+                document = decode(response.content)
+                entry.frame = parse(document)
+            entry.etag = response.headers.get('ETag')
+            entry.last_modified = response.headers.get('Last-Modified')
+            entry.last_updated = document.get('last_updated')
+            entry.ttl = document.get('ttl', 0) or 0
+            entry.expires_at = self._expiry(document, now)
+            return entry.frame
+
+
+_feed_cache = None
+_feed_cache_lock = threading.Lock()
+
+
+# Define the function to get the process-wide feed cache
+def get_feed_cache():
+    global _feed_cache
+    with _feed_cache_lock:
+        if _feed_cache is None:
+            _feed_cache = FeedCache()
+    return _feed_cache
@@ -0,0 +1,148 @@
+"""Vectorized parsing of GBFS station_status documents.
+
+Every app builds its station status frame with the same schema:
+
+==========================  ========================  ==========================================
+column                      dtype                     meaning
+==========================  ========================  ==========================================
+``time`` (index)            datetime64[ns, UTC]       feed ``last_updated``
+``station_id``              object (str)              GBFS station id
+``num_bikes_available``     int64                     bikes ready to rent
+``num_docks_available``     int64                     empty docks
+``mechanical``              int64                     classic bikes available
+``ebike``                   int64                     e-bikes available
+``last_reported``           datetime64[ns, UTC]       station's own report time
+``is_renting``              int64                     1 when renting (always 1 after filtering)
+``is_returning``            int64                     1 when returning (always 1 after filtering)
+==========================  ========================  ==========================================
+
+Other flat fields of the feed are passed through; nested fields are expanded or dropped.
+Any further vehicle type found in ``num_bikes_available_types`` gets its own int64 column.
+
+Feeds can be decoded straight from the response bytes with decode_feed, which
+builds Arrow columns for the station list and hands them to pandas without
+going through one Python dict per station. Everything else uses the fastest
+installed JSON backend (orjson, then ujson, then the standard library).
+"""
+
+import importlib  # Import importlib to load optional JSON backends
+import json  # Import json as the fallback JSON backend
+
+import numpy as np  # Import numpy for array construction
+import pandas as pd  # Import pandas for data manipulation
+import pyarrow as pa  # Import pyarrow for columnar decoding
+import pyarrow.json as pa_json  # Import the Arrow JSON reader
+
+TYPES_FIELD = 'num_bikes_available_types'  # GBFS 1.x: {"mechanical": 3, "ebike": 1}
+VEHICLE_TYPES_FIELD = 'vehicle_types_available'  # GBFS 2.1+: [{"vehicle_type_id": "1", "count": 3}, ...]
+NESTED_FIELDS = [TYPES_FIELD, VEHICLE_TYPES_FIELD, 'vehicle_docks_available']
+
+JSON_BACKENDS = ['orjson', 'ujson', 'json']  # Tried in order; the first importable one wins
+_json_backend = None
+
+
+# Define the function to choose the JSON backend
+def set_json_backend(name=None):
+    """Use the named backend, or the first importable one from JSON_BACKENDS; return the module"""
+    global _json_backend
+    for candidate in ([name] if name else JSON_BACKENDS):
+        try:
+            _json_backend = json if candidate == 'json' else importlib.import_module(candidate)
+            return _json_backend
+        except ImportError:
+            continue
+    raise ImportError('No JSON backend available from {}'.format(name or JSON_BACKENDS))
+
+
+# Define the function to decode JSON bytes with the selected backend
+def loads(content):
+    if _json_backend is None:
+        set_json_backend()
+    return _json_backend.loads(content)
+
+
+# Define the function to decode a GBFS station feed into Arrow columns
+def decode_feed(content):
+    """Decode feed bytes into a document whose data.stations is a flattened pyarrow.Table
+
+    Nested structs such as num_bikes_available_types become dotted columns
+    (num_bikes_available_types.ebike). Feeds that are not a station list, or that
+    Arrow cannot type, fall back to loads().
+    """
+    try:
+        table = pa_json.read_json(pa.BufferReader(content),
+                                  read_options=pa_json.ReadOptions(block_size=len(content) + 1),  # One block, whatever the size
+                                  parse_options=pa_json.ParseOptions(newlines_in_values=True))
+        stations = table.column('data').combine_chunks().field('stations').flatten()  # Station structs
+        stations = pa.Table.from_struct_array(stations).flatten()
+    except (pa.ArrowInvalid, pa.ArrowTypeError, KeyError, ValueError):
+        return loads(content)
+    document = {name: table.column(name)[0].as_py() for name in table.column_names if name != 'data'}
+    document['data'] = {'stations': stations}
+    return document
+
+
+# Define the function to get the station list of a decoded document as a DataFrame
+def stations_frame(document):
+    stations = document['data']['stations']
+    if isinstance(stations, pa.Table):
+        return stations.to_pandas(split_blocks=True, self_destruct=True)  # Numeric columns are not copied
+    return pd.DataFrame(stations)
+
+
+# Define the function to expand the per-station bike type breakdown into columns
+def vehicle_type_counts(stations, vehicle_types=None):
+    """Return a frame of per-type bike counts aligned with stations
+
+    vehicle_types optionally maps GBFS 2.x vehicle_type_id values to column names
+    such as 'ebike' and 'mechanical'; unmapped ids keep their own name.
+    """
+    prefix = TYPES_FIELD + '.'
+    flattened = [c for c in stations.columns if c.startswith(prefix)]
+    if flattened:  # Already columnar from decode_feed
+        counts = stations[flattened].rename(columns=lambda c: c[len(prefix):])
+        return counts.fillna(0).astype(np.int64)
+    if TYPES_FIELD in stations.columns:
+        records = stations[TYPES_FIELD].tolist()
+        if stations[TYPES_FIELD].isna().any():
+            records = [r if isinstance(r, dict) else {} for r in records]  # Stations without a breakdown
+        return pd.DataFrame.from_records(records, index=stations.index).fillna(0).astype(np.int64)
+    if VEHICLE_TYPES_FIELD in stations.columns:
+        exploded = stations[VEHICLE_TYPES_FIELD].explode().dropna()  # One row per (station, vehicle type)
+        rows = pd.DataFrame(exploded.tolist(), index=exploded.index)
+        if len(rows) == 0:
+            return pd.DataFrame(index=stations.index)
+        names = rows['vehicle_type_id'].astype(str)
+        if vehicle_types:
+            names = names.replace(vehicle_types)
+        counts = rows['count'].groupby([rows.index, names]).sum().unstack(fill_value=0)
+        return counts.reindex(stations.index, fill_value=0).astype(np.int64)
+    return pd.DataFrame(index=stations.index)
+
+
+# Define the function to turn a station_status document into the shared schema
+def parse_station_status(document, vehicle_types=None):
+    """Return the station status frame described in the module docstring"""
+    stations = stations_frame(document)  # Convert the data to a DataFrame
+    keep = np.ones(len(stations), dtype=bool)
+    for flag in ('is_renting', 'is_returning'):
+        if flag in stations.columns:
+            keep &= stations[flag].to_numpy() == 1  # Filter out stations that are not renting or returning
+    stations = stations.loc[keep]
+    stations = stations.drop_duplicates(['station_id', 'last_reported'])  # Remove duplicate records
+
+    counts = vehicle_type_counts(stations, vehicle_types)
+    if 'ebike' not in counts.columns:
+        counts['ebike'] = stations['num_ebikes_available'] if 'num_ebikes_available' in stations.columns else 0
+    if 'mechanical' not in counts.columns:
+        counts['mechanical'] = stations['num_bikes_available'] - counts['ebike']  # Whatever is not electric
+    nested = [c for c in stations.columns if c.split('.')[0] in NESTED_FIELDS]
+    stations = stations.drop(columns=nested + [c for c in counts.columns if c in stations.columns])
+
+    df = pd.concat([stations, counts.astype(np.int64)], axis=1)  # Expand the bike types columns
+    df['station_id'] = df['station_id'].astype(str)
+    df['last_reported'] = pd.to_datetime(df['last_reported'], unit='s', utc=True)  # Convert timestamps to datetime
+    df.index = pd.DatetimeIndex(
+        pd.to_datetime(np.full(len(df), document['last_updated']), unit='s', utc=True), name='time'
+    )  # Feed time as the index
+    return df
@@ -0,0 +1,128 @@
+"""Vectorized distance helpers shared by the bike share apps."""
+
+import numpy as np  # Import numpy for vectorized math
+import pandas as pd  # Import pandas for fast id lookups
+
+EARTH_RADIUS_KM = 6371.0088  # Mean earth radius in kilometers
+
+
+# Define the function to compute haversine distances from one point to many
+def haversine_km(lat, lon, lats, lons):
+    """Return the great-circle distance in km from (lat, lon) to every (lats[i], lons[i])"""
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Define a grid-based spatial index over station locations
+class StationIndex:
+    """Uniform grid over projected station coordinates for k-nearest and radius queries
+
+    Build it once per station_information refresh; queries only look at the grid
+    cells around the user instead of scanning every station.
+    """
+
+    def __init__(self, station_ids, lats, lons, cell_m=250.0):
+        self.station_ids = np.asarray(station_ids).astype(str)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.cell_m = float(cell_m)
+        self._positions = pd.Index(self.station_ids)  # station_id -> index position
+        self._lat0 = np.radians(np.nanmean(self.lats)) if len(self.lats) else 0.0  # Projection reference latitude
+        cx, cy = self._cell(self.lats, self.lons)
+        keys = self._key(cx, cy)
+        self._order = np.argsort(keys, kind='stable')  # Station positions sorted by cell
+        self._keys = keys[self._order]
+
+    @classmethod
+    def from_frame(cls, df, cell_m=250.0):
+        """Build an index from a frame with station_id, lat and lon columns"""
+        df = df.dropna(subset=['lat', 'lon'])
+        return cls(df['station_id'].to_numpy(), df['lat'].to_numpy(), df['lon'].to_numpy(), cell_m=cell_m)
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    def _cell(self, lat, lon):
+        x = np.radians(lon) * np.cos(self._lat0) * EARTH_RADIUS_KM * 1000  # Equirectangular projection in meters
+        y = np.radians(lat) * EARTH_RADIUS_KM * 1000
+        return np.floor(x / self.cell_m).astype(np.int64), np.floor(y / self.cell_m).astype(np.int64)
+
+    @staticmethod
+    def _key(cx, cy):
+        return (cx << 32) + (cy & 0xFFFFFFFF)  # Pack both cell coordinates into one sortable int64
+
+    def _block(self, lat, lon, radius_cells):
+        """Return the positions of every station in the square of cells around (lat, lon)"""
+        cx, cy = self._cell(lat, lon)
+        offsets = np.arange(-radius_cells, radius_cells + 1, dtype=np.int64)
+        gx, gy = np.meshgrid(cx + offsets, cy + offsets, indexing='ij')
+        block_keys = self._key(gx.ravel(), gy.ravel())
+        starts = np.searchsorted(self._keys, block_keys, side='left')
+        ends = np.searchsorted(self._keys, block_keys, side='right')
+        counts = ends - starts
+        if counts.sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        runs = np.repeat(starts - np.cumsum(counts) + counts, counts)  # Expand each [start, end) run
+        return self._order[runs + np.arange(counts.sum())]
+
+    def positions(self, station_ids):
+        """Map station ids to index positions (-1 for stations without a location)"""
+        return self._positions.get_indexer(np.asarray(station_ids).astype(str))
+
+    def mask(self, station_ids, values, positions=None):
+        """Spread a boolean filter computed on another frame (e.g. station_status) onto index order
+
+        positions, when given, is self.positions(station_ids) computed earlier
+        (e.g. once per snapshot), so no station id is hashed again.
+        """
+        if positions is None:
+            positions = self.positions(station_ids)
+        values = np.asarray(values, dtype=bool)
+        known = positions >= 0
+        result = np.zeros(len(self), dtype=bool)
+        result[positions[known]] = values[known]
+        return result
+
+    def nearest(self, lat, lon, k=1, predicate=None):
+        """Return (positions, distances_km) of the k closest stations where predicate is True
+
+        predicate is an optional boolean array in index order (see mask()).
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        radius_cells = 1
+        while radius_cells <= 16:
+            candidates = self._block(lat, lon, radius_cells)
+            if predicate is not None:
+                candidates = candidates[predicate[candidates]]
+            if len(candidates) >= k:
+                distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+                best = np.argsort(distances, kind='stable')[:k]
+                if distances[best[-1]] * 1000 <= radius_cells * self.cell_m:  # Nothing outside the block can be closer
+                    return candidates[best], distances[best]
+            radius_cells *= 2
+        # Sparse matches: fall back to one vectorized pass over every station
+        distances = haversine_km(lat, lon, self.lats, self.lons)
+        if predicate is not None:
+            distances = np.where(predicate, distances, np.inf)
+        best = np.argsort(distances, kind='stable')[:k]
+        best = best[np.isfinite(distances[best])]
+        return best, distances[best]
+
+    def within(self, lat, lon, radius_m):
+        """Return (positions, distances_km) of every station within radius_m meters, closest first"""
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        candidates = self._block(lat, lon, int(np.ceil(radius_m / self.cell_m)))
+        distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        keep = distances * 1000 <= radius_m
+        order = np.argsort(distances[keep], kind='stable')
+        return candidates[keep][order], distances[keep][order]
+
+    def station(self, position):
+        """Return [station_id, lat, lon] for an index position"""
+        return [str(self.station_ids[position]), float(self.lats[position]), float(self.lons[position])]
@@ -0,0 +1,161 @@
+"""Cached, rate-limited geocoding shared by every session of the app."""
+
+import os  # Import os for the cache location
+import re  # Import re for address normalization
+import sqlite3  # Import sqlite3 for the on-disk cache
+import threading  # Import threading to guard the shared state
+import time  # Import time for TTL bookkeeping
+import unicodedata  # Import unicodedata to fold accents and widths
+from collections import OrderedDict  # Import OrderedDict for the in-memory LRU
+from urllib.parse import urlsplit  # Import urlsplit to point Nominatim at another server
+
+from geopy.adapters import RequestsAdapter  # Import the requests adapter to plug in the shared session
+from geopy.extra.rate_limiter import RateLimiter  # Import RateLimiter to respect Nominatim's policy
+from geopy.geocoders import Nominatim  # Import Nominatim for geocoding
+
+import metrics  # Import the cache counters
+import transport  # Import the shared HTTP transport
+
+CACHE_DIR = os.environ.get('BIKESHARE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+USER_AGENT = transport.USER_AGENT  # Nominatim requires an identifying user agent
+NOMINATIM_URL = os.environ.get('BIKESHARE_NOMINATIM_URL')  # e.g. the local stand-in; nominatim.openstreetmap.org by default
+
+# Common street suffixes folded to one spelling so "King Street" and "king st." share an entry
+_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'drive': 'dr',
+    'crescent': 'cres', 'court': 'ct', 'place': 'pl', 'square': 'sq', 'lane': 'ln',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+}
+
+
+# Define the function to turn an address into a stable cache key
+def normalize_address(address):
+    """Lowercase, strip accents and punctuation, collapse whitespace and fold street suffixes"""
+    address = unicodedata.normalize('NFKD', address)
+    address = ''.join(c for c in address if not unicodedata.combining(c)).lower()
+    address = re.sub(r"[^\w\s]", ' ', address)  # Drop commas, periods and other punctuation
+    words = [_ABBREVIATIONS.get(word, word) for word in address.split()]
+    return ' '.join(words)
+
+
+class GeocodeCache:
+    """In-memory LRU in front of a SQLite table with per-entry expiry
+
+    Entries store (lat, lon), or None for addresses Nominatim could not resolve;
+    misses expire sooner so a typo fixed upstream is picked up again.
+    """
+
+    def __init__(self, path=None, max_entries=1024, ttl=30 * 24 * 3600, negative_ttl=24 * 3600):
+        self.path = path or os.path.join(CACHE_DIR, 'geocode.sqlite')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS geocode '
+                         '(key TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL)')
+        self._db.commit()
+        self.purge_expired()  # Opened once per process, so expired rows do not pile up on disk
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)  # Evict the least recently used entry
+
+    def get(self, key):
+        """Return (hit, value) for a normalized address"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                return True, entry[1]
+            row = self._db.execute('SELECT lat, lon, expires_at FROM geocode WHERE key = ?', (key,)).fetchone()
+            if row is None or row[2] <= now:
+                return False, None
+            value = None if row[0] is None else (row[0], row[1])
+            self._remember(key, row[2], value)
+            return True, value
+
+    def set(self, key, value):
+        """Store (lat, lon) or None for a normalized address"""
+        expires_at = time.time() + (self.ttl if value is not None else self.negative_ttl)
+        lat, lon = value if value is not None else (None, None)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._db.execute('INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)', (key, lat, lon, expires_at))
+            self._db.commit()
+
+    def purge_expired(self):
+        """Delete expired rows from disk"""
+        with self._lock:
+            self._db.execute('DELETE FROM geocode WHERE expires_at <= ?', (time.time(),))
+            self._db.commit()
+
+
+class SharedSessionAdapter(RequestsAdapter):
+    """geopy adapter that sends requests through the shared transport session"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.session.close()  # Drop geopy's private session and pools
+        self.session = transport.get_session()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass  # The shared session outlives any one geocoder
+
+    def __del__(self):
+        pass
+
+
+class Geocoder:
+    """One Nominatim client for the whole process, throttled to one request per second
+
+    With url set (NOMINATIM_URL) requests go to that server instead, without
+    throttling unless min_delay_seconds is given.
+    """
+
+    def __init__(self, cache=None, min_delay_seconds=None, timeout=transport.DEFAULT_TIMEOUT[1], url=NOMINATIM_URL):
+        self.cache = cache or GeocodeCache()
+        server = {}
+        if url:
+            parts = urlsplit(url)
+            server = {'domain': parts.netloc + parts.path.rstrip('/'), 'scheme': parts.scheme}
+        if min_delay_seconds is None:
+            min_delay_seconds = 0.0 if url else 1.0  # Nominatim's usage policy: at most one request per second
+        self._client = Nominatim(user_agent=USER_AGENT, timeout=timeout, adapter_factory=SharedSessionAdapter, **server)
+        self._geocode = RateLimiter(self._client.geocode, min_delay_seconds=min_delay_seconds,
+                                    max_retries=2, swallow_exceptions=False)
+        self._lock = threading.Lock()  # RateLimiter is not safe to share across threads on its own
+
+    def geocode(self, address):
+        """Return (lat, lon) for an address, or None if it cannot be found"""
+        key = normalize_address(address)
+        hit, value = self.cache.get(key)
+        metrics.lookup('geocode', hit)
+        if hit:
+            return value
+        with self._lock:
+            hit, value = self.cache.get(key)  # Another session may have resolved it while we waited
+            if hit:
+                return value
+            location = self._geocode(address)
+        value = None if location is None else (location.latitude, location.longitude)
+        self.cache.set(key, value)
+        return value
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+# Define the function to get the process-wide geocoder
+def get_geocoder():
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Geocoder()
+    return _geocoder
@@ -1,36 +1,43 @@
-import urllib  # Import module for working with URLs
-import json  # Import module for working with JSON data
 import pandas as pd  # Import pandas for data manipulation
 import folium  # Import folium for creating interactive maps
-import datetime as dt  # Import datetime for working with dates and times
-from geopy.distance import geodesic  # Import geodesic for calculating distances
-from geopy.geocoders import Nominatim  # Import Nominatim for geocoding
+from geo import StationIndex  # Import the spatial index for nearest-station search
+from geocoding import get_geocoder  # Import the shared geocoding client
 import streamlit as st  # Import Streamlit for creating web apps
+import threading  # Import threading to guard the background route jobs
+from concurrent.futures import ThreadPoolExecutor  # Import ThreadPoolExecutor for the background route jobs
+import transport  # Import the shared HTTP transport
+import gbfs  # Import the shared GBFS parsing stage
+from feeds import get_feed_cache  # Import the ttl-aware GBFS feed cache
+from snapshot import StationPoller  # Import the process-wide station poller
+from history import HISTORY_DIR, HistoryWriter  # Import the Parquet history store
+from systems import SystemRegistry, discover_all, system_center  # Import multi-system support
+import os  # Import os for per-system history folders
+import re  # Import re to make system ids safe as folder names
+from station_table import StationTable  # Import the compact station table
+from maps import TORONTO_CENTER, PatchedBaseMap, render_base_map, with_overlays  # Import the map renderer
+from maps import marker_overlay, route_overlay, view_overlay  # Import the map overlays
+from maps import build_station_deck, station_deck_layer  # Import the WebGL renderer
+from maps import visible_radius_m  # Import the view size for culling
+import streamlit.components.v1 as components  # Import components to show the cached map HTML
+import metrics  # Import the stage timings and cache counters
 
-@st.cache_data  # Cache the function's output to improve performance
 # Define the function to query station status from a given URL
 def query_station_status(url):
-    with urllib.request.urlopen(url) as data_url:  # Open the URL
-        data = json.loads(data_url.read().decode())  # Read and decode the JSON data
-
-    df = pd.DataFrame(data['data']['stations'])  # Convert the data to a DataFrame
-    df = df[df.is_renting == 1]  # Filter out stations that are not renting
-    df = df[df.is_returning == 1]  # Filter out stations that are not returning
-    df = df.drop_duplicates(['station_id', 'last_reported'])  # Remove duplicate records
-    df.last_reported = df.last_reported.map(lambda x: dt.datetime.utcfromtimestamp(x))  # Convert timestamps to datetime
-    df['time'] = data['last_updated']  # Add the last updated time to the DataFrame
-    df.time = df.time.map(lambda x: dt.datetime.utcfromtimestamp(x))  # Convert timestamps to datetime
-    df = df.set_index('time')  # Set the time as the index
-    df.index = df.index.tz_localize('UTC')  # Localize the index to UTC
-    df = pd.concat([df, df['num_bikes_available_types'].apply(pd.Series)], axis=1)  # Expand the bike types column
-
-    return df  # Return the DataFrame
+    """Return the station status frame, refreshed at the feed's own ttl (shared, treat as read-only)"""
+    return get_feed_cache().get(url, parse_station_status, decode=gbfs.decode_feed)
+
+# Define the function to turn a station_status document into a DataFrame
+def parse_station_status(data):
+    return gbfs.parse_station_status(data)  # Vectorized parse into the shared schema (see gbfs.py)
 
 # Define the function to get station latitude and longitude from a given URL
 def get_station_latlon(url):
-    with urllib.request.urlopen(url) as data_url:  # Open the URL
-        latlon = json.loads(data_url.read().decode())  # Read and decode the JSON data
-    latlon = pd.DataFrame(latlon['data']['stations'])  # Convert the data to a DataFrame
+    """Return the station information frame, refreshed at the feed's own ttl (shared, treat as read-only)"""
+    return get_feed_cache().get(url, parse_station_latlon, decode=gbfs.decode_feed)
+
+# Define the function to turn a station_information document into a DataFrame
+def parse_station_latlon(latlon):
+    latlon = gbfs.stations_frame(latlon)  # Convert the data to a DataFrame
     return latlon  # Return the DataFrame
 
 # Define the function to join two DataFrames on station_id
@@ -40,6 +47,105 @@ def join_latlon(df1, df2):
                 on='station_id')  # Merge the DataFrames on station_id
     return df  # Return the merged DataFrame
 
+# Define a join that keeps a compact station table per station information frame
+class StationJoiner:
+    """Callable join(status_df, latlon_df) that rebuilds its StationTable only when latlon_df changes"""
+
+    def __init__(self):
+        self._latlon = None
+        self._table = None
+
+    def __call__(self, status_df, latlon_df):
+        if latlon_df is not self._latlon:
+            self._table = StationTable(latlon_df)  # Typed arrays and id lookup built once
+            self._latlon = latlon_df
+        return self._table.join(status_df)
+
+# Define the function to render the base map once per snapshot version
+@st.cache_resource(max_entries=8)  # Shared by every session until the stations change
+def get_base_map(key, version, _data, lazy_popups=True, center=None):
+    metrics.REGISTRY.inc(metrics.CACHE_MISSES, cache='base_map')
+    with metrics.timed('map_build'):
+        return render_base_map(_data, center or TORONTO_CENTER, lazy_popups=lazy_popups)  # (html, map_name)
+
+# Define the function to get the base map that follows a system's snapshots by patching changed markers
+@st.cache_resource(max_entries=8)  # One per system, shared by every session
+def get_patched_base_map(key, center=None):
+    def render(data, center):
+        metrics.REGISTRY.inc(metrics.CACHE_MISSES, cache='base_map')
+        with metrics.timed('map_build'):
+            return render_base_map(data, center)  # (html, map_name)
+    return PatchedBaseMap(center or TORONTO_CENTER, render=render)
+
+# Define the function to build the WebGL station layer once per snapshot version
+@st.cache_resource(max_entries=8)  # Shared by every session until the stations change
+def get_station_deck_layer(key, version, _data):
+    metrics.REGISTRY.inc(metrics.CACHE_MISSES, cache='deck_layer')
+    with metrics.timed('map_build', backend='pydeck'):
+        return station_deck_layer(_data)
+
+MAP_BACKENDS = ('folium', 'pydeck')  # Leaflet markers, or WebGL for large station sets
+
+# Define the function to keep only the stations around a zoomed-in view
+def stations_in_view(snapshot, view, width=700, height=500, margin=0.5):
+    """Return the rows of snapshot.data inside the view's bounding circle plus margin"""
+    (lat, lon), zoom = view
+    positions, _ = snapshot.index.within(lat, lon, visible_radius_m(lat, zoom, width, height, margin))
+    return snapshot.data[snapshot.data['station_id'].isin(snapshot.index.station_ids[positions])]
+
+# Define the function to show the station map with this session's search results
+def show_station_map(key, snapshot, view=None, markers=(), route=None, backend='folium', lazy_popups=True,
+                     show_all=False, center=None, width=700, height=500):
+    """key identifies the system (e.g. its station_url); view is (center, zoom),
+    markers are (location, popup, color, icon) and route is (coordinates, tooltip).
+    lazy_popups builds the folium station popups on click from one shared table.
+    With a view and not show_all only the stations around it are drawn.
+    center is where the city-wide map opens (Toronto by default)."""
+    with metrics.timed('map', backend=backend):
+        _show_station_map(key, snapshot, view, markers, route, backend, lazy_popups, show_all, center, width, height)
+
+def _show_station_map(key, snapshot, view, markers, route, backend, lazy_popups, show_all, center, width, height):
+    cull = view is not None and not show_all and snapshot.index is not None
+    if backend == 'pydeck':
+        if cull:
+            layer = station_deck_layer(stations_in_view(snapshot, view, width, height))
+        else:
+            metrics.REGISTRY.inc(metrics.CACHE_LOOKUPS, cache='deck_layer')
+            layer = get_station_deck_layer(key, snapshot.version, snapshot.data)
+        st.pydeck_chart(build_station_deck(layer, view if view is not None else (center or TORONTO_CENTER, 13), markers, route))
+        return
+    overlays = [marker_overlay(*marker) for marker in markers]
+    if route is not None:
+        overlays.append(route_overlay(*route))
+    if cull:
+        html, map_name = render_base_map(stations_in_view(snapshot, view, width, height), view[0], view[1], lazy_popups)
+    else:
+        metrics.REGISTRY.inc(metrics.CACHE_LOOKUPS, cache='base_map')
+        if lazy_popups:
+            html, map_name = get_patched_base_map(key, center).page(snapshot)  # Redraws only the changed stations
+        else:
+            html, map_name = get_base_map(key, snapshot.version, snapshot.data, lazy_popups, center)
+        if view is not None:
+            overlays.insert(0, view_overlay(*view))
+    components.html(with_overlays(html, map_name, overlays), width=width, height=height + 10)
+
+# Define the function to serve Prometheus metrics when BIKESHARE_METRICS_PORT is set
+@st.cache_resource  # One server per process
+def start_metrics_server():
+    port = os.environ.get('BIKESHARE_METRICS_PORT')
+    return metrics.start_http_server(int(port)) if port else None
+
+# Define the function to show stage timings and cache hit rates in the sidebar
+def show_metrics_panel():
+    """Debug panel with the process-wide metrics (every session of this server)"""
+    stages = pd.DataFrame(metrics.REGISTRY.stages())
+    caches = pd.DataFrame(metrics.REGISTRY.caches())
+    st.caption('Stage latency (ms, estimated from histogram buckets)')
+    st.dataframe(stages.round(1) if len(stages) else stages, hide_index=True)
+    st.caption('Cache hit rate')
+    st.dataframe(caches.round(2) if len(caches) else caches, hide_index=True)
+    st.download_button('Prometheus metrics', metrics.REGISTRY.render(), file_name='metrics.txt', mime='text/plain')
+
 # Function to determine marker color based on the number of bikes available
 def get_marker_color(num_bikes_available):
     if num_bikes_available > 3:
@@ -51,74 +157,210 @@ def get_marker_color(num_bikes_available):
 
 # Define the function to geocode an address
 def geocode(address):
-    geolocator = Nominatim(user_agent="clicked-demo")  # Create a geolocator object
-    location = geolocator.geocode(address)  # Geocode the address
+    with metrics.timed('geocode'):
+        location = get_geocoder().geocode(address)  # Shared, cached and rate-limited Nominatim client
     if location is None:
         return ''  # Return an empty string if the address is not found
     else:
-        return (location.latitude, location.longitude)  # Return the latitude and longitude
+        return location  # Return the latitude and longitude
+
+# Define the function to build the spatial index for a station information frame
+def build_station_index(latlon_df):
+    get_route_cache().invalidate_moved(latlon_df)  # Forget cached routes to stations that moved
+    return StationIndex.from_frame(latlon_df)  # Grid index over station coordinates
+
+# Define the function to build the poller of one system's feeds
+def make_station_poller(fetch, interval=10.0, history=True, history_root=HISTORY_DIR):
+    """Return an unstarted StationPoller; with history=True new snapshots are appended under history_root"""
+    listeners = [HistoryWriter(history_root).start().append_snapshot] if history else []
+    return StationPoller(
+        fetch=fetch,
+        join=StationJoiner(),
+        build_index=build_station_index,
+        interval=interval,
+        listeners=listeners,
+    )
+
+# Define the function to start one poller per auto-discovered system
+@st.cache_resource  # Shared by every session and rerun
+def get_system_registry(discovery_urls=None, interval=10.0, history=True):
+    """Return the running SystemRegistry for the gbfs.json URLs (systems.DISCOVERY_URLS by default)
+
+    Feeds are downloaded and parsed in a sharded process pool; each system has
+    its own snapshot and its own history folder. Returns once the first system
+    is loaded; slower ones appear in registry.systems when they are ready.
+    """
+    def make_poller(system, fetch):
+        folder = re.sub(r'[^\w.-]', '_', system.system_id)
+        return make_station_poller(fetch, interval, history, os.path.join(HISTORY_DIR, folder))
+    return SystemRegistry(discover_all(discovery_urls), make_poller).start()
+
+# Define the function to find the system that serves a location
+def system_for_location(registry, latlon, default):
+    """Return (system, snapshot) of the system whose stations are closest to latlon"""
+    system = registry.system_for(latlon[0], latlon[1]) or default
+    return system, registry.snapshot(system.system_id)
+
+# Define the function to pick the closest stations that satisfy a filter
+def _closest_stations(latlon, df, mask, index, k, positions=None):
+    """Return up to k [station_id, lat, lon] entries where mask is True, closest first
+
+    positions is the index position of every df row (Snapshot.index_positions);
+    without it the station ids are looked up in the index on every call.
+    """
+    if index is None:
+        index = StationIndex.from_frame(df)  # Ad-hoc index when the caller has none
+        positions = None
+    with metrics.timed('nearest'):
+        predicate = index.mask(df['station_id'], mask, positions)  # Align the status filter with the index
+        positions, _ = index.nearest(latlon[0], latlon[1], k=k, predicate=predicate)
+    return [index.station(position) for position in positions]
+
+# Define the function to choose among candidate stations
+def _choose_station(latlon, candidates, profile='foot'):
+    """Return the candidate with the shortest travel time for profile (or the closest one when k is 1)"""
+    if len(candidates) == 0:
+        return None
+    if len(candidates) == 1:
+        return candidates[0]
+    durations = run_osrm_table(candidates, latlon, profile)  # One batched request for every candidate
+    if durations is None:
+        return candidates[0]  # Fall back to the closest station as the crow flies
+    reachable = [(d, i) for i, d in enumerate(durations) if d is not None]
+    if len(reachable) == 0:
+        return candidates[0]
+    return candidates[min(reachable)[1]]
 
 # Define the function to get bike availability near a location
-def get_bike_availability(latlon, df, input_bike_modes):
-    """Calculate distance from each station to the user and return a single station id, lat, lon"""
+def get_bike_availability(latlon, df, input_bike_modes, index=None, k=1, profile='foot', positions=None):
+    """Find the best station with the requested bikes and return a single station id, lat, lon
+
+    With k > 1 the k closest stations are ranked by OSRM travel time for profile
+    (walking unless the user drives there) instead of straight-line distance.
+    """
     if len(input_bike_modes) == 0 or len(input_bike_modes) == 2:  # If no mode selected, assume both bikes are selected
-        i = 0
-        df['distance'] = ''
-        while i < len(df):
-            df.loc[i, 'distance'] = geodesic(latlon, (df['lat'][i], df['lon'][i])).km  # Calculate distance to each station
-            i = i + 1
-        df = df.loc[(df['ebike'] > 0) | (df['mechanical'] > 0)]  # Remove stations with no available bikes
-        chosen_station = []
-        chosen_station.append(df[df['distance'] == min(df['distance'])]['station_id'].iloc[0])  # Get closest station
-        chosen_station.append(df[df['distance'] == min(df['distance'])]['lat'].iloc[0])
-        chosen_station.append(df[df['distance'] == min(df['distance'])]['lon'].iloc[0])
+        mask = (df['ebike'] > 0) | (df['mechanical'] > 0)  # Keep stations with any available bike
     else:
-        i = 0
-        df['distance'] = ''
-        while i < len(df):
-            df.loc[i, 'distance'] = geodesic(latlon, (df['lat'][i], df['lon'][i])).km  # Calculate distance to each station
-            i = i + 1
-        df = df.loc[df[input_bike_modes[0]] > 0]  # Remove stations without the selected mode available
-        chosen_station = []
-        chosen_station.append(df[df['distance'] == min(df['distance'])]['station_id'].iloc[0])  # Get closest station
-        chosen_station.append(df[df['distance'] == min(df['distance'])]['lat'].iloc[0])
-        chosen_station.append(df[df['distance'] == min(df['distance'])]['lon'].iloc[0])
-    return chosen_station  # Return the chosen station
+        mask = df[input_bike_modes[0]] > 0  # Keep stations with the selected mode available
+    candidates = _closest_stations(latlon, df, mask.to_numpy(), index, k, positions)
+    return _choose_station(latlon, candidates, profile)  # Return the chosen station
 
 # Define the function to get dock availability near a location
-def get_dock_availability(latlon, df):
-    """Calculate distance from each station to the user and return a single station id, lat, lon"""
-    i = 0
-    df['distance'] = ''
-    while i < len(df):
-        df.loc[i, 'distance'] = geodesic(latlon, (df['lat'][i], df['lon'][i])).km  # Calculate distance to each station
-        i = i + 1
-    df = df.loc[df['num_docks_available'] > 0]  # Remove stations without available docks
-    chosen_station = []
-    chosen_station.append(df[df['distance'] == min(df['distance'])]['station_id'].iloc[0])  # Get closest station
-    chosen_station.append(df[df['distance'] == min(df['distance'])]['lat'].iloc[0])
-    chosen_station.append(df[df['distance'] == min(df['distance'])]['lon'].iloc[0])
-    return chosen_station  # Return the chosen station
+def get_dock_availability(latlon, df, index=None, k=1, profile='foot', positions=None):
+    """Find the best station with an empty dock and return a single station id, lat, lon
+
+    With k > 1 the k closest stations are ranked by OSRM travel time for profile instead of straight-line distance.
+    """
+    mask = df['num_docks_available'] > 0  # Keep stations with available docks
+    candidates = _closest_stations(latlon, df, mask.to_numpy(), index, k, positions)
+    return _choose_station(latlon, candidates, profile)  # Return the chosen station
 
 import requests  # Import requests for making HTTP requests
+import time  # Import time to expire failed background routes
+from routing import RouteCache, decode_polyline, get_route_cache, osrm_url  # Import the route cache
+from travel_time import get_travel_time_estimator  # Import the calibrated travel-time estimate
+from local_routing import get_local_router  # Import the offline road graph
+
+# Define the function to look up a route in the shared route cache
+def _cached_route(chosen_station, iamhere, profile):
+    cached = get_route_cache().get(iamhere, chosen_station, profile)  # Nearby users share routes to the same station
+    metrics.lookup('route', cached is not None)
+    return cached
+
+# Define the function to compute a route and remember it
+def _fetch_route(chosen_station, iamhere, profile):
+    """Return (coordinates, seconds) from the local graph or OSRM, and store it in the route cache"""
+    found = None
+    router = get_local_router(profile)  # Route on the prebuilt graph when there is one
+    if router is not None:
+        with metrics.timed('route', engine='local'):
+            found = router.route(iamhere, (chosen_station[1], chosen_station[2]))
+
+    if found is None:
+        start = "{},{}".format(iamhere[1], iamhere[0])  # Format the start coordinates
+        end = "{},{}".format(chosen_station[2], chosen_station[1])  # Format the end coordinates
+        url = '{}/route/v1/{}/{};{}?geometries=polyline'.format(osrm_url(profile), profile, start, end)  # Create the OSRM API URL
+
+        headers = {'Content-type': 'application/json'}
+        with metrics.timed('route'):
+            r = transport.get(url, headers=headers)  # Make the API request
+            routejson = r.json()  # Parse the JSON response
+        metrics.REGISTRY.inc(metrics.HTTP_RESPONSES, service='osrm', status=r.status_code)  # Count the status code
+        found = decode_polyline(routejson['routes'][0]['geometry']), routejson['routes'][0]['duration']
+
+    coordinates, seconds = found
+    get_route_cache().set(iamhere, chosen_station, profile, coordinates, seconds)
+    get_travel_time_estimator().observe(iamhere, (chosen_station[1], chosen_station[2]), profile, seconds)  # Calibrate
+    return coordinates, seconds
 
 # Define the function to run OSRM and get route coordinates and duration
-def run_osrm(chosen_station, iamhere):
-    start = "{},{}".format(iamhere[1], iamhere[0])  # Format the start coordinates
-    end = "{},{}".format(chosen_station[2], chosen_station[1])  # Format the end coordinates
-    url = 'http://router.project-osrm.org/route/v1/driving/{};{}?geometries=geojson'.format(start, end)  # Create the OSRM API URL
-
-    headers = {'Content-type': 'application/json'}
-    r = requests.get(url, headers=headers)  # Make the API request
-    print("Calling API ...:", r.status_code)  # Print the status code
-
-    routejson = r.json()  # Parse the JSON response
-    coordinates = []
-    i = 0
-    lst = routejson['routes'][0]['geometry']['coordinates']
-    while i < len(lst):
-        coordinates.append([lst[i][1], lst[i][0]])  # Extract coordinates
-        i = i + 1
-    duration = round(routejson['routes'][0]['duration'] / 60, 1)  # Convert duration to minutes
-
-    return coordinates, duration  # Return the coordinates and duration
\ No newline at end of file
+def run_osrm(chosen_station, iamhere, profile='driving'):
+    cached = _cached_route(chosen_station, iamhere, profile)
+    coordinates, seconds = cached if cached is not None else _fetch_route(chosen_station, iamhere, profile)
+    return coordinates, round(seconds / 60, 1)  # Return the coordinates and duration in minutes
+
+ROUTE_RETRY_SECONDS = 60  # A failed background route is not requested again before this
+_route_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='route')  # Shared by every session
+_route_jobs = {}  # Route cache key -> (future, started)
+_route_jobs_lock = threading.Lock()
+
+# Define the function to get a travel time without waiting on a routing call
+def route_or_estimate(chosen_station, iamhere, profile='driving'):
+    """Return (coordinates, minutes, estimated, pending) right away
+
+    A cached route is returned with estimated False and pending None. Otherwise
+    the route is computed in the background and a straight line with the
+    calibrated estimate is returned; pending is the Future of that route, or None
+    when it failed in the last ROUTE_RETRY_SECONDS and the estimate is all there is.
+    """
+    cached = _cached_route(chosen_station, iamhere, profile)
+    if cached is not None:
+        coordinates, seconds = cached
+        return coordinates, round(seconds / 60, 1), False, None
+
+    destination = [float(chosen_station[1]), float(chosen_station[2])]
+    with metrics.timed('estimate'):
+        seconds = get_travel_time_estimator().estimate(iamhere, destination, profile)
+    key = RouteCache.key(iamhere, chosen_station[0], profile)
+    now = time.monotonic()
+    with _route_jobs_lock:
+        for stale in [k for k, (f, started) in _route_jobs.items() if f.done() and now - started > ROUTE_RETRY_SECONDS]:
+            del _route_jobs[stale]
+        job = _route_jobs.get(key)
+        if job is None or (job[0].done() and job[0].exception() is None):
+            job = _route_jobs[key] = (_route_pool.submit(_fetch_route, chosen_station, iamhere, profile), now)
+    pending = None if job[0].done() and job[0].exception() is not None else job[0]
+    return [list(iamhere), destination], round(seconds / 60, 1), True, pending
+
+# Define the function to show a search again once its route has arrived
+def rerun_when_routed(pending, flag, interval=0.5):
+    """Poll pending from a fragment; when it is done set st.session_state[flag] and rerun the app"""
+    fragment = getattr(st, 'fragment', None) or st.experimental_fragment  # st.fragment is Streamlit 1.37+; requirements.txt pins 1.35
+    @fragment(run_every=interval)
+    def wait_for_route():
+        if pending.done():
+            st.session_state[flag] = True  # Tells the app to repeat the search, now from the route cache
+            st.rerun()
+    wait_for_route()
+
+# Define the function to get travel times to several stations with one OSRM table request
+def run_osrm_table(stations, iamhere, profile='driving'):
+    """Return a list of durations in seconds (None when unreachable), or None if the request fails"""
+    router = get_local_router(profile)
+    if router is not None:
+        with metrics.timed('route_table', engine='local'):
+            return router.table(iamhere, [(station[1], station[2]) for station in stations])
+
+    coords = ["{},{}".format(iamhere[1], iamhere[0])]  # The user is source 0
+    coords += ["{},{}".format(station[2], station[1]) for station in stations]  # Every candidate is a destination
+    url = '{}/table/v1/{}/{}?sources=0&annotations=duration'.format(osrm_url(profile), profile, ';'.join(coords))
+
+    try:
+        with metrics.timed('route_table'):
+            r = transport.get(url)  # Make the API request
+            tablejson = r.json()  # Parse the JSON response
+    except (requests.RequestException, ValueError):
+        return None
+    if tablejson.get('code') != 'Ok':
+        return None
+    return tablejson['durations'][0][1:]  # Durations from the user to each candidate
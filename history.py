@@ -0,0 +1,140 @@
+"""Append-only Parquet history of station status snapshots, partitioned by date and hour."""
+
+import datetime as dt  # Import datetime for partition names
+import logging  # Import logging to report failed compactions
+import os  # Import os for file handling
+import threading  # Import threading for the background compactor
+import uuid  # Import uuid for unique part file names
+
+import pyarrow as pa  # Import pyarrow for columnar tables
+import pyarrow.dataset as ds  # Import dataset for partitioned reads with predicate pushdown
+import pyarrow.parquet as pq  # Import parquet for reading and writing files
+
+from geocoding import CACHE_DIR  # Reuse the shared cache directory
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = os.environ.get('BIKESHARE_HISTORY_DIR', os.path.join(CACHE_DIR, 'history'))
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string()), ('hour', pa.string())]), flavor='hive')
+COMPACTED_NAME = 'compacted.parquet'
+
+
+class HistoryWriter:
+    """Write each station status snapshot as a small Parquet part, then compact closed hours
+
+    Files live under root/date=YYYY-MM-DD/hour=HH/. Parts of the hour being
+    written stay separate; once an hour is over its parts are merged into one
+    file sorted by station_id and time so readers can skip row groups.
+    """
+
+    def __init__(self, root=HISTORY_DIR, compact_interval=600):
+        self.root = root
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def to_table(status):
+        """Flatten a station status frame into an Arrow table, dropping nested columns"""
+        df = status.reset_index()  # Keep the feed time as a column
+        nested = [c for c in df.columns if df[c].map(lambda v: isinstance(v, (dict, list))).any()]
+        df = df.drop(columns=nested).sort_values(['station_id', 'time'])
+        df['station_id'] = df['station_id'].astype(str)
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    def _partition(self, when):
+        when = when.astimezone(dt.timezone.utc)
+        return os.path.join(self.root, 'date={:%Y-%m-%d}'.format(when), 'hour={:%H}'.format(when))
+
+    def append(self, status):
+        """Write one snapshot to its date/hour partition"""
+        if len(status) == 0:
+            return None
+        when = status.index.max().to_pydatetime()  # Feed last_updated
+        folder = self._partition(when)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, 'part-{:%Y%m%dT%H%M%S}-{}.parquet'.format(when, uuid.uuid4().hex[:8]))
+        with self._lock:
+            pq.write_table(self.to_table(status), path, compression='zstd')
+        return path
+
+    def append_snapshot(self, snapshot):
+        """StationPoller listener: store the status frame of every new snapshot"""
+        if snapshot.changes is None or snapshot.changes.changed or snapshot.changes.added:
+            self.append(snapshot.status)
+
+    def compact(self, now=None):
+        """Merge the parts of every closed hour into a single file; return the number of hours compacted"""
+        current = self._partition(now or dt.datetime.now(dt.timezone.utc))
+        compacted = 0
+        for folder, _, files in os.walk(self.root):
+            parts = sorted(f for f in files if f.startswith('part-'))
+            if folder == current or len(parts) == 0:
+                continue
+            paths = [os.path.join(folder, f) for f in parts]
+            if COMPACTED_NAME in files:
+                paths.append(os.path.join(folder, COMPACTED_NAME))
+            with self._lock:
+                table = pa.concat_tables([pq.read_table(p, partitioning=None) for p in paths], promote_options='default')
+                table = table.sort_by([('station_id', 'ascending'), ('time', 'ascending')])
+                tmp = os.path.join(folder, COMPACTED_NAME + '.tmp')
+                pq.write_table(table, tmp, compression='zstd', row_group_size=64 * 1024)
+                os.replace(tmp, os.path.join(folder, COMPACTED_NAME))  # Atomic swap for readers
+                for path in paths:
+                    if not path.endswith(COMPACTED_NAME):
+                        os.remove(path)
+            compacted += 1
+        return compacted
+
+    def _run(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception:
+                logger.exception('History compaction failed')
+
+    def start(self):
+        """Compact closed hours in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='history-compactor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+# Define the function to read station history with predicate pushdown
+def read_history(root=HISTORY_DIR, station_ids=None, start=None, end=None, columns=None):
+    """Return a DataFrame of stored snapshots, filtered on station_id and a [start, end) time range
+
+    Partitions outside the time range are skipped from their directory names and
+    the remaining filters are pushed down to Parquet row-group statistics.
+    """
+    if not os.path.isdir(root):
+        return pa.table({}).to_pandas()
+    dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING,
+                         exclude_invalid_files=True, ignore_prefixes=['.', '_', COMPACTED_NAME + '.tmp'])
+    conditions = []
+    if station_ids is not None:
+        conditions.append(ds.field('station_id').isin([str(s) for s in station_ids]))
+    if start is not None:
+        start = _utc(start)
+        conditions.append(ds.field('date') >= '{:%Y-%m-%d}'.format(start))  # Prune whole days
+        conditions.append(ds.field('time') >= pa.scalar(start, type=pa.timestamp('ns', tz='UTC')))
+    if end is not None:
+        end = _utc(end)
+        conditions.append(ds.field('date') <= '{:%Y-%m-%d}'.format(end))
+        conditions.append(ds.field('time') < pa.scalar(end, type=pa.timestamp('ns', tz='UTC')))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+
+def _utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt.timezone.utc)
+    return value.astimezone(dt.timezone.utc)
@@ -0,0 +1,205 @@
+"""Run concurrent headless sessions of the app against the local stand-in services.
+
+Every session loads the app, then alternates "Find me a bike!" and "Find me a
+dock!" searches for new addresses. Each session runs in its own spawned process,
+since AppTest is not safe to drive from several threads at once; the sessions
+share the stand-in services and the on-disk caches, not the in-memory ones.
+Reports p50/p95/p99 seconds per rerun kind, the reruns served per second and
+the share of sessions that failed:
+
+    python loadgen.py --sessions 20 --searches 5 --stations 5000 --latency osrm=200
+
+Without --server a stand-in (stand_in.py) is started in this process. The exit
+status is 1 when more than --max-error-rate of the sessions failed.
+"""
+
+import argparse  # Import argparse for the command line
+import multiprocessing  # Import multiprocessing to run every session in its own process
+import os  # Import os to point the app at the stand-in
+import queue  # Import queue for the result timeout
+import socket  # Import socket to find a free port
+import sys  # Import sys for the exit status
+import tempfile  # Import tempfile for throwaway caches
+import time  # Import time for timing
+from collections import defaultdict  # Import defaultdict to group the timings
+
+import numpy as np  # Import numpy for percentiles
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bikeshare_app.py')
+STREETS = ['Queen St W', 'King St E', 'Bloor St W', 'Dundas St W', 'College St', 'Yonge St', 'Spadina Ave']
+
+
+# Define the function to find a free local port
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Define the function to find a sidebar widget by its label
+def widget(elements, label):
+    return next(element for element in elements if element.label == label)
+
+
+class Session:
+    """One simulated user; records (kind, seconds) for every rerun"""
+
+    def __init__(self, number, searches, timeout, address_pool=0):
+        from streamlit.testing.v1 import AppTest  # Imported after the environment is set
+        self.app = AppTest.from_file(APP, default_timeout=timeout)
+        self.number = number
+        self.searches = searches
+        self.address_pool = address_pool
+        self.timings = []
+        self.errors = []
+
+    def address(self, i):
+        n = self.number * self.searches + i
+        if self.address_pool:
+            n %= self.address_pool  # Reuse addresses to exercise the geocode and route caches
+        return '{} {}'.format(10 + n // len(STREETS), STREETS[n % len(STREETS)])
+
+    def _run(self, kind):
+        start = time.perf_counter()
+        self.app.run()
+        self.timings.append((kind, time.perf_counter() - start))
+        if self.app.exception:
+            self.errors.extend(str(e.message) for e in self.app.exception)
+
+    def search(self, i):
+        method = 'Rent' if i % 2 == 0 else 'Return'
+        selectbox = widget(self.app.sidebar.selectbox, 'Are you looking to rent or return a bike?')
+        if selectbox.value != method:
+            selectbox.select(method)
+            self._run('switch')
+        widget(self.app.sidebar.text_input, 'Street').input(self.address(i))
+        widget(self.app.sidebar.button, 'Find me a bike!' if method == 'Rent' else 'Find me a dock!').click()
+        self._run('search')
+
+    def __call__(self):
+        try:
+            self._run('load')
+            for i in range(self.searches):
+                self.search(i)
+        except Exception as error:  # Reported with the others instead of ending the run
+            self.errors.append(repr(error))
+        return self
+
+
+# Define the function one session process runs
+def session_process(number, searches, timeout, address_pool, delay, barrier, results):
+    """Warm up, wait for every other session, then run one session and put (number, timings, errors) on results"""
+    try:
+        try:
+            Session(-1, 0, timeout)()  # Start the pollers and warm imports outside the measurement
+        finally:
+            barrier.wait()  # A session that fails to warm up still lets the others start
+        time.sleep(delay)  # Ramp
+        session = Session(number, searches, timeout, address_pool)()
+        results.put((number, session.timings, session.errors))
+    except Exception as error:
+        results.put((number, [], [repr(error)]))
+
+
+# Define the function to run every session in its own process
+def run_sessions(count, searches, timeout, address_pool=0, ramp=0.0):
+    """Return ({session: (timings, errors)}, wall seconds); a session that never reports counts as failed"""
+    context = multiprocessing.get_context('spawn')  # No copies of the parent's threads or sockets
+    barrier = context.Barrier(count + 1)
+    results = context.Queue()
+    processes = [context.Process(target=session_process, name='session-{}'.format(i),  # Not daemonic: the app starts shard workers
+                                 args=(i, searches, timeout, address_pool, ramp * i / count, barrier, results))
+                 for i in range(count)]
+    for process in processes:
+        process.start()
+    sessions = {}
+    try:
+        barrier.wait(timeout=timeout + 60)  # Every session has loaded the app once
+    except Exception:
+        sessions.update((i, ([], ['session did not start'])) for i in range(count))
+        return sessions, 0.0
+    start = time.perf_counter()
+    deadline = time.monotonic() + ramp + timeout * (2 * searches + 1) + 60  # Slowest possible session
+    while len(sessions) < count:
+        try:
+            number, timings, errors = results.get(timeout=max(deadline - time.monotonic(), 0.1))
+        except queue.Empty:
+            break
+        sessions[number] = (timings, errors)
+    wall = time.perf_counter() - start
+    for i, process in enumerate(processes):
+        process.join(timeout=5)
+        if i not in sessions:
+            sessions[i] = ([], ['session process exited with {}'.format(process.exitcode)])
+        if process.is_alive():
+            process.terminate()
+    return sessions, wall
+
+
+# Define the function to summarize the timings of every session
+def report(sessions, wall):
+    """Print the timings of {session: (timings, errors)}; return the share of sessions with errors"""
+    grouped = defaultdict(list)
+    for timings, _ in sessions.values():
+        for kind, seconds in timings:
+            grouped[kind].append(seconds)
+    print('{:<8} {:>7} {:>9} {:>9} {:>9} {:>9}'.format('rerun', 'count', 'p50 s', 'p95 s', 'p99 s', 'max s'))
+    for kind in ('load', 'switch', 'search'):
+        values = np.array(grouped.get(kind, []))
+        if len(values) == 0:
+            continue
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        print('{:<8} {:>7} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}'.format(kind, len(values), p50, p95, p99, values.max()))
+    total = sum(len(v) for v in grouped.values())
+    errors = [error for _, session_errors in sessions.values() for error in session_errors]
+    failed = sum(1 for _, session_errors in sessions.values() if session_errors)
+    error_rate = failed / len(sessions) if sessions else 0.0
+    print('\n{} sessions, {} reruns in {:.1f} s: {:.1f} reruns/s, {} errors, {} failed sessions ({:.0%})'.format(
+        len(sessions), total, wall, total / wall if wall else 0.0, len(errors), failed, error_rate))
+    for error in sorted(set(errors))[:5]:
+        print('  ' + error.splitlines()[0])
+    return error_rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10, help='concurrent sessions')
+    parser.add_argument('--searches', type=int, default=4, help='searches per session')
+    parser.add_argument('--ramp', type=float, default=0.0, help='seconds over which sessions start')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds before a rerun fails')
+    parser.add_argument('--address-pool', type=int, default=0, help='reuse this many addresses (0 = all new)')
+    parser.add_argument('--server', help='base URL of a running stand_in.py; otherwise one is started here')
+    parser.add_argument('--stations', type=int, default=5000, help='size of the in-process stand-in')
+    parser.add_argument('--latency', action='append', metavar='[SERVICE=]MS', help='stand-in delay; repeatable')
+    parser.add_argument('--failure-rate', action='append', metavar='[SERVICE=]P', help='stand-in 503 share; repeatable')
+    parser.add_argument('--max-error-rate', type=float, default=0.0, help='share of failed sessions that still passes')
+    args = parser.parse_args(argv)
+
+    base_url = args.server.rstrip('/') if args.server else 'http://127.0.0.1:{}'.format(free_port())
+    os.environ.update({  # Read by the app's modules when they are first imported
+        'BIKESHARE_GBFS_URLS': base_url + '/gbfs/gbfs.json',
+        'BIKESHARE_NOMINATIM_URL': base_url,
+        'BIKESHARE_OSRM_URL': base_url,
+    })
+    os.environ.setdefault('BIKESHARE_CACHE_DIR', tempfile.mkdtemp(prefix='bikeshare-load-'))
+
+    import stand_in  # Imports app modules, so only now
+    server = None
+    if not args.server:
+        port = int(base_url.rsplit(':', 1)[1])
+        server = stand_in.StandInServer(port, args.stations, stand_in.per_service(args.latency),
+                                        failure_rate=stand_in.per_service(args.failure_rate)).start()
+
+    sessions, wall = run_sessions(args.sessions, args.searches, args.timeout, args.address_pool, args.ramp)
+    error_rate = report(sessions, wall)
+    if server is not None:
+        print('stand-in requests: ' + ', '.join('{} {}'.format(k, v) for k, v in server.requests.items()))
+        server.close()
+    if error_rate > args.max_error_rate:
+        print('FAILED: {:.0%} of the sessions failed (allowed {:.0%})'.format(error_rate, args.max_error_rate))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""In-process routing over a local OpenStreetMap extract with contraction hierarchies.
+
+Build a graph once per profile (this takes a while for a city):
+
+    python local_routing.py build toronto.osm.pbf --profile driving cycling foot
+
+The result is saved as ROUTING_DIR/<profile>.npz. run_osrm then answers from it
+in a few milliseconds and only falls back to the OSRM server when no graph is
+built for the profile or the points cannot be routed.
+
+.osm and .osm.gz/.osm.bz2 XML extracts are read with the standard library;
+.osm.pbf needs the optional osmium package.
+"""
+
+import argparse  # Import argparse for the build command
+import bz2  # Import bz2 for compressed XML extracts
+import gzip  # Import gzip for compressed XML extracts
+import heapq  # Import heapq for the Dijkstra searches
+import os  # Import os for the graph files
+import re  # Import re to parse maxspeed tags
+import threading  # Import threading to guard the loaded graphs
+import time  # Import time to report build progress
+import xml.etree.ElementTree as ET  # Import ElementTree to stream OSM XML
+
+import numpy as np  # Import numpy for the graph arrays
+
+from geo import StationIndex, haversine_km  # Import the grid index to snap points to the graph
+
+# Same default cache folder as geocoding.CACHE_DIR, without importing the geocoder, so this module
+# only needs geo.py and numpy and can be copied next to the single-file apps
+CACHE_DIR = os.environ.get('BIKESHARE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+ROUTING_DIR = os.environ.get('BIKESHARE_ROUTING_DIR', os.path.join(CACHE_DIR, 'routing'))
+
+_CITY_STREETS = ['primary', 'primary_link', 'secondary', 'secondary_link', 'tertiary', 'tertiary_link',
+                 'unclassified', 'residential', 'living_street', 'service']
+PROFILES = {
+    'driving': {
+        'speeds': {'motorway': 90, 'motorway_link': 45, 'trunk': 70, 'trunk_link': 40, 'primary': 50,
+                   'primary_link': 30, 'secondary': 45, 'secondary_link': 30, 'tertiary': 40, 'tertiary_link': 25,
+                   'unclassified': 30, 'residential': 30, 'living_street': 10, 'service': 15},  # km/h
+        'access': ['motor_vehicle', 'motorcar'], 'oneway': True, 'maxspeed': True, 'snap_speed': 5.0,
+    },
+    'cycling': {
+        'speeds': dict(dict.fromkeys(_CITY_STREETS, 16), cycleway=18, path=12, track=10),
+        'access': ['bicycle'], 'oneway': True, 'maxspeed': False, 'snap_speed': 4.0,
+    },
+    'foot': {
+        'speeds': dict(dict.fromkeys(_CITY_STREETS + ['footway', 'pedestrian', 'path', 'track', 'cycleway'], 5),
+                       steps=2),
+        'access': ['foot'], 'oneway': False, 'maxspeed': False, 'snap_speed': 1.4,
+    },
+}
+ALIASES = {'car': 'driving', 'bike': 'cycling', 'bicycle': 'cycling', 'walking': 'foot', 'walk': 'foot'}
+NO_ACCESS = {'no', 'private'}
+WITNESS_SETTLE_LIMIT = 500  # Nodes a witness search may settle before a shortcut is added anyway
+
+
+# Define the function to read the nodes and ways of an OSM extract
+def read_osm(path):
+    """Return ({node_id: (lat, lon)}, [(node_ids, tags)]) for every way with a highway tag"""
+    if path.endswith('.pbf'):
+        return _read_pbf(path)
+    opener = gzip.open if path.endswith('.gz') else bz2.open if path.endswith('.bz2') else open
+    nodes, ways = {}, []
+    with opener(path, 'rb') as f:
+        refs, tags = [], {}
+        for event, element in ET.iterparse(f, events=('end',)):
+            if element.tag == 'node':
+                nodes[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+            elif element.tag == 'nd':
+                refs.append(int(element.get('ref')))
+            elif element.tag == 'tag':
+                tags[element.get('k')] = element.get('v')
+            elif element.tag == 'way':
+                if 'highway' in tags:
+                    ways.append((refs, tags))
+            if element.tag in ('node', 'way', 'relation'):
+                refs, tags = [], {}
+                element.clear()  # Keep memory flat on large extracts
+    return nodes, ways
+
+
+def _read_pbf(path):
+    try:
+        import osmium  # Optional: only needed for .pbf extracts
+    except ImportError:
+        raise ImportError('Reading {} needs the osmium package (pip install osmium), or convert it to .osm'.format(path))
+
+    class Handler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.nodes, self.ways = {}, []
+
+        def node(self, n):
+            self.nodes[n.id] = (n.location.lat, n.location.lon)
+
+        def way(self, w):
+            if 'highway' in w.tags:
+                self.ways.append(([n.ref for n in w.nodes], {t.k: t.v for t in w.tags}))
+
+    handler = Handler()
+    handler.apply_file(path)
+    return handler.nodes, handler.ways
+
+
+# Define the function to read a maxspeed tag in km/h
+def _maxspeed(value):
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', value or '')
+    if not match:
+        return None
+    speed = float(match.group(1))
+    return speed * 1.609 if match.group(2) else speed
+
+
+# Define the function to turn OSM ways into a directed, weighted graph for one profile
+def build_graph(nodes, ways, profile):
+    """Return (lat, lon, src, dst, seconds) arrays over the nodes used by routable ways"""
+    config = PROFILES[profile]
+    index, lat, lon, src, dst, seconds = {}, [], [], [], [], []
+    for refs, tags in ways:
+        speed = config['speeds'].get(tags.get('highway'))
+        if speed is None or tags.get('access') in NO_ACCESS or tags.get('area') == 'yes':
+            continue
+        if any(tags.get(key) in NO_ACCESS for key in config['access']):
+            continue
+        if config['maxspeed']:
+            speed = _maxspeed(tags.get('maxspeed')) or speed
+        forward = backward = True
+        if config['oneway']:
+            oneway = tags.get('oneway', 'yes' if tags.get('junction') == 'roundabout' else 'no')
+            if profile == 'cycling' and tags.get('oneway:bicycle') == 'no':
+                oneway = 'no'
+            forward, backward = oneway != '-1', oneway in ('no', 'false', '0')
+        points = [ref for ref in refs if ref in nodes]
+        for a, b in zip(points, points[1:]):
+            for ref in (a, b):
+                if ref not in index:
+                    index[ref] = len(lat)
+                    lat.append(nodes[ref][0])
+                    lon.append(nodes[ref][1])
+            ia, ib = index[a], index[b]
+            cost = float(haversine_km(lat[ia], lon[ia], lat[ib], lon[ib])) * 3600 / speed
+            if forward:
+                src.append(ia); dst.append(ib); seconds.append(cost)
+            if backward:
+                src.append(ib); dst.append(ia); seconds.append(cost)
+    return (np.array(lat), np.array(lon), np.array(src, dtype=np.int64),
+            np.array(dst, dtype=np.int64), np.array(seconds))
+
+
+# Define the function to find the largest connected part of the graph
+def largest_component(n, src, dst):
+    """Boolean mask of the nodes in the largest weakly connected component"""
+    parent = list(range(n))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for a, b in zip(src.tolist(), dst.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+    roots = np.array([find(x) for x in range(n)])
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    return roots == np.bincount(roots).argmax()
+
+
+# Define the function to precompute the contraction hierarchy
+def contract(n, src, dst, weight, settle_limit=WITNESS_SETTLE_LIMIT, progress=None):
+    """Contract every node in edge-difference order
+
+    Returns (rank, edge_a, edge_b, edge_w, child1, child2, keep): all original
+    edges and shortcuts, where child1/child2 are the two edges a shortcut
+    replaces (-1 for original edges) and keep marks the edges of the final graph.
+    """
+    out = [dict() for _ in range(n)]  # a -> {b: best edge id}, kept for the final graph
+    active_out = [dict() for _ in range(n)]  # Same, between nodes not contracted yet
+    active_in = [dict() for _ in range(n)]
+    edge_a, edge_b, edge_w, child1, child2 = [], [], [], [], []
+
+    def add_edge(a, b, w, c1=-1, c2=-1):
+        current = out[a].get(b)
+        if a == b or (current is not None and edge_w[current] <= w):
+            return
+        out[a][b] = active_out[a][b] = active_in[b][a] = len(edge_w)
+        edge_a.append(a); edge_b.append(b); edge_w.append(w); child1.append(c1); child2.append(c2)
+
+    for a, b, w in zip(src.tolist(), dst.tolist(), weight.tolist()):
+        add_edge(a, b, w)
+
+    def witness(source, skip, targets, limit):
+        """Distances from source over uncontracted nodes other than skip, until targets are settled or limit"""
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled, remaining = 0, len(targets)
+        while heap and settled < settle_limit and remaining:
+            d, u = heapq.heappop(heap)
+            if d > limit:
+                break
+            if d > dist[u]:
+                continue
+            settled += 1
+            if u in targets:
+                remaining -= 1
+            for v, e in active_out[u].items():
+                if v == skip:
+                    continue
+                nd = d + edge_w[e]
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist
+
+    def shortcuts(v):
+        ins, outs = list(active_in[v].items()), list(active_out[v].items())
+        needed = []
+        for u, e1 in ins:
+            targets = [(x, e2, edge_w[e1] + edge_w[e2]) for x, e2 in outs if x != u]
+            if not targets:
+                continue
+            dist = witness(u, v, {t[0] for t in targets}, max(t[2] for t in targets))
+            needed += [(u, x, w, e1, e2) for x, e2, w in targets if dist.get(x, float('inf')) > w]
+        return needed, len(ins) + len(outs)
+
+    contracted = bytearray(n)
+    deleted_neighbors = [0] * n
+    def priority(v):
+        needed, degree = shortcuts(v)
+        return len(needed) - degree + deleted_neighbors[v], needed
+
+    heap = [(priority(v)[0], v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.zeros(n, dtype=np.int64)
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if contracted[v]:
+            continue
+        p, needed = priority(v)  # Lazy update
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, v))
+            continue
+        for shortcut in needed:
+            add_edge(*shortcut)
+        for u in active_in[v]:
+            del active_out[u][v]
+            deleted_neighbors[u] += 1
+        for x in active_out[v]:
+            del active_in[x][v]
+            if x not in active_in[v]:
+                deleted_neighbors[x] += 1
+        active_in[v], active_out[v] = {}, {}
+        contracted[v] = 1
+        rank[v] = order
+        order += 1
+        if progress and order % 10000 == 0:
+            progress(order, n, len(edge_w))
+
+    keep = np.zeros(len(edge_w), dtype=bool)
+    for a in range(n):
+        keep[list(out[a].values())] = True  # The best edge between each pair
+    return (rank, np.array(edge_a, dtype=np.int64), np.array(edge_b, dtype=np.int64), np.array(edge_w),
+            np.array(child1, dtype=np.int64), np.array(child2, dtype=np.int64), keep)
+
+
+class ContractionHierarchy:
+    """Shortest-time routes between coordinates on a contracted road graph"""
+
+    def __init__(self, lat, lon, rank, edge_a, edge_b, edge_w, child1, child2, keep, routable, snap_speed):
+        self.lat, self.lon = np.asarray(lat), np.asarray(lon)
+        self.edge_a, self.edge_b, self.edge_w = edge_a.tolist(), edge_b.tolist(), edge_w.tolist()
+        self.child1, self.child2 = child1.tolist(), child2.tolist()
+        self.rank, self.keep, self.routable = np.asarray(rank), np.asarray(keep), np.asarray(routable)
+        self.snap_speed = float(snap_speed)  # m/s to reach the graph from the exact point
+        upward = self.rank[edge_b] > self.rank[edge_a]
+        self._up = self._adjacency(edge_a, np.flatnonzero(self.keep & upward))  # Forward search: a -> higher b
+        self._down = self._adjacency(edge_b, np.flatnonzero(self.keep & ~upward))  # Backward search: b -> higher a
+        nodes = np.flatnonzero(self.routable)
+        self._snap = StationIndex(nodes, self.lat[nodes], self.lon[nodes])
+        self._snap_nodes = nodes
+
+    def _adjacency(self, owner, edges):
+        lists = [[] for _ in range(len(self.lat))]
+        for e, node in zip(edges.tolist(), owner[edges].tolist()):
+            lists[node].append(e)
+        return lists
+
+    @classmethod
+    def build(cls, lat, lon, src, dst, seconds, snap_speed, progress=None):
+        routable = largest_component(len(lat), src, dst)
+        parts = contract(len(lat), src, dst, seconds, progress=progress)
+        return cls(lat, lon, *parts, routable=routable, snap_speed=snap_speed)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez_compressed(path, lat=self.lat, lon=self.lon, rank=self.rank,
+                            edge_a=np.array(self.edge_a), edge_b=np.array(self.edge_b), edge_w=np.array(self.edge_w),
+                            child1=np.array(self.child1), child2=np.array(self.child2),
+                            keep=self.keep, routable=self.routable, snap_speed=self.snap_speed)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['lat'], f['lon'], f['rank'], f['edge_a'], f['edge_b'], f['edge_w'],
+                       f['child1'], f['child2'], f['keep'], f['routable'], float(f['snap_speed']))
+
+    def snap(self, latlon):
+        """Return (node, meters) of the routable graph node closest to latlon"""
+        positions, km = self._snap.nearest(latlon[0], latlon[1], k=1)
+        return int(self._snap_nodes[positions[0]]), float(km[0]) * 1000
+
+    def _search(self, s, t):
+        """Bidirectional upward Dijkstra; return (seconds, edge ids from s to t) or None"""
+        if s == t:
+            return 0.0, []
+        dist = ({s: 0.0}, {t: 0.0})
+        parent = ({s: -1}, {t: -1})
+        heaps = ([(0.0, s)], [(0.0, t)])
+        graphs = (self._up, self._down)
+        nexts = (self.edge_b, self.edge_a)
+        best, meet = float('inf'), None
+        while True:
+            side = None
+            for i in (0, 1):
+                if heaps[i] and heaps[i][0][0] < best and (side is None or heaps[i][0][0] < heaps[side][0][0]):
+                    side = i
+            if side is None:
+                break
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side][u]:
+                continue
+            own, other = dist[side], dist[1 - side]
+            if u in other and d + other[u] < best:
+                best, meet = d + other[u], u
+            for e in graphs[side][u]:
+                v = nexts[side][e]
+                nd = d + self.edge_w[e]
+                if nd < own.get(v, float('inf')):
+                    own[v] = nd
+                    parent[side][v] = e
+                    heapq.heappush(heaps[side], (nd, v))
+        if meet is None:
+            return None
+        forward, node = [], meet
+        while parent[0][node] != -1:
+            e = parent[0][node]
+            forward.append(e)
+            node = self.edge_a[e]
+        backward, node = [], meet
+        while parent[1][node] != -1:
+            e = parent[1][node]
+            backward.append(e)
+            node = self.edge_b[e]
+        return best, forward[::-1] + backward
+
+    def _unpack(self, edges):
+        """Expand shortcuts into the original node sequence"""
+        if not edges:
+            return []
+        nodes = [self.edge_a[edges[0]]]
+        stack = list(reversed(edges))
+        while stack:
+            e = stack.pop()
+            if self.child1[e] == -1:
+                nodes.append(self.edge_b[e])
+            else:
+                stack.append(self.child2[e])
+                stack.append(self.child1[e])
+        return nodes
+
+    def route(self, origin, destination):
+        """Return ([[lat, lon], ...], seconds) from origin to destination, or None if unreachable"""
+        s, s_m = self.snap(origin)
+        t, t_m = self.snap(destination)
+        found = self._search(s, t)
+        if found is None:
+            return None
+        seconds, edges = found
+        nodes = self._unpack(edges) or [s]
+        coordinates = [[float(origin[0]), float(origin[1])]]
+        coordinates += [[float(self.lat[v]), float(self.lon[v])] for v in nodes]
+        coordinates.append([float(destination[0]), float(destination[1])])
+        return coordinates, seconds + (s_m + t_m) / self.snap_speed
+
+    def table(self, origin, destinations):
+        """Return the seconds from origin to each destination (None when unreachable)"""
+        s, s_m = self.snap(origin)
+        durations = []
+        for destination in destinations:
+            t, t_m = self.snap(destination)
+            found = self._search(s, t)
+            durations.append(None if found is None else found[0] + (s_m + t_m) / self.snap_speed)
+        return durations
+
+
+# Define the function to get the graph file of a profile
+def graph_path(profile, root=ROUTING_DIR):
+    return os.path.join(root, '{}.npz'.format(ALIASES.get(profile, profile)))
+
+
+_routers = {}  # Graph file -> (modification time, ContractionHierarchy)
+_routers_lock = threading.Lock()
+
+
+# Define the function to get the process-wide router of a profile
+def get_local_router(profile='driving'):
+    """Return the ContractionHierarchy for profile, or None when no graph has been built
+
+    The graph file is checked on every call, so a graph built or rebuilt while
+    the app runs is loaded on the next route without a restart.
+    """
+    path = graph_path(profile)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None  # Not built (yet)
+    with _routers_lock:
+        entry = _routers.get(path)
+        if entry is None or entry[0] != mtime:
+            entry = _routers[path] = (mtime, ContractionHierarchy.load(path))
+        return entry[1]
+
+
+# Define the function to build and save the graphs of an extract
+def build(extract, profiles=('driving',), root=ROUTING_DIR):
+    print('Reading {}'.format(extract))
+    nodes, ways = read_osm(extract)
+    for profile in profiles:
+        profile = ALIASES.get(profile, profile)
+        start = time.time()
+        lat, lon, src, dst, seconds = build_graph(nodes, ways, profile)
+        print('{}: {} nodes, {} edges; contracting'.format(profile, len(lat), len(src)))
+        report = lambda done, total, edges: print('  {}/{} nodes contracted, {} edges'.format(done, total, edges))
+        hierarchy = ContractionHierarchy.build(lat, lon, src, dst, seconds, PROFILES[profile]['snap_speed'], report)
+        path = graph_path(profile, root)
+        hierarchy.save(path)
+        print('{}: saved {} in {:.0f} s'.format(profile, path, time.time() - start))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build local routing graphs from an OSM extract')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_command = commands.add_parser('build', help='contract an extract and save one graph per profile')
+    build_command.add_argument('extract', help='.osm, .osm.gz, .osm.bz2 or .osm.pbf file')
+    build_command.add_argument('--profile', nargs='+', action='extend', choices=sorted(PROFILES) + sorted(ALIASES),
+                               help='one or more profiles, repeatable (default: driving)')
+    build_command.add_argument('--out', default=ROUTING_DIR, help='folder for the <profile>.npz graphs')
+    args = parser.parse_args(argv)
+    build(args.extract, args.profile or ['driving'], args.out)
+
+
+if __name__ == '__main__':
+    main()
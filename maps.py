@@ -0,0 +1,288 @@
+"""Folium map rendering for the station layer."""
+
+import json  # Import json to embed overlay data in the page
+import threading  # Import threading to guard the patched base map
+
+import folium  # Import folium for creating interactive maps
+import numpy as np  # Import numpy for vectorized color classification
+import pandas as pd  # Import pandas for the compact pydeck frame
+import pydeck as pdk  # Import pydeck for WebGL rendering
+
+TORONTO_CENTER = [43.65306613746548, -79.38815311015]  # Coordinates for Toronto
+COLOR_FIELD = 'color'
+POPUP_FIELDS = ['station_id', 'num_bikes_available', 'mechanical', 'ebike']
+POPUP_ALIASES = ['Station ID:', 'Total Bikes Available:', 'Mechanical Bike Available:', 'eBike Available:']
+RGB = {'green': [0, 160, 60], 'yellow': [240, 200, 0], 'red': [220, 30, 30], 'blue': [30, 90, 220]}
+
+
+# Define the function to classify every station's marker color at once
+def marker_colors(num_bikes_available):
+    """Vectorized get_marker_color: green above 3 bikes, yellow for 1-3, red otherwise"""
+    bikes = np.asarray(num_bikes_available)
+    return np.select([bikes > 3, bikes > 0], ['green', 'yellow'], default='red')
+
+
+# Define the function to turn the station frame into one GeoJSON FeatureCollection
+def stations_geojson(data, fields=POPUP_FIELDS):
+    """Return a FeatureCollection with one Point per located station and fields + color as properties"""
+    data = data[data['lat'].notna() & data['lon'].notna()]
+    columns = {field: data[field].astype(str if field == 'station_id' else int).tolist() for field in fields}
+    columns[COLOR_FIELD] = marker_colors(data['num_bikes_available']).tolist()
+    lons = np.round(data['lon'].to_numpy(dtype=float), 6).tolist()
+    lats = np.round(data['lat'].to_numpy(dtype=float), 6).tolist()
+    names = list(columns)
+    features = [
+        {'type': 'Feature',
+         'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+         'properties': dict(zip(names, values))}
+        for lon, lat, *values in zip(lons, lats, *columns.values())
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+# Define the function to build the station layer as a single GeoJSON layer
+def station_layer(data, radius=2, name='Stations'):
+    """Return one folium.GeoJson layer drawing every station as a colored circle with a shared popup template"""
+    return folium.GeoJson(
+        stations_geojson(data),
+        name=name,
+        marker=folium.CircleMarker(radius=radius, fill=True, fill_opacity=0.7),
+        style_function=lambda feature: {
+            'color': feature['properties'][COLOR_FIELD],
+            'fillColor': feature['properties'][COLOR_FIELD],
+        },
+        popup=folium.GeoJsonPopup(fields=POPUP_FIELDS, aliases=POPUP_ALIASES, max_width=300),
+    )
+
+
+# Define the function to build a map with every station on it
+def build_station_map(data, center=TORONTO_CENTER, zoom_start=13):
+    m = folium.Map(location=center, zoom_start=zoom_start, tiles='cartodbpositron')  # Create a map with a grey background
+    station_layer(data).add_to(m)  # All stations in one layer
+    return m
+
+
+# Define the function to get how far from the center a map view reaches
+def visible_radius_m(lat, zoom, width=700, height=500, margin=0.5):
+    """Half-diagonal in meters of a width x height pixel web-mercator view at zoom, grown by margin"""
+    meters_per_pixel = 156543.03392 * np.cos(np.radians(lat)) / 2 ** zoom
+    return float(np.hypot(width, height) / 2 * meters_per_pixel * (1 + margin))
+
+
+# Define the function to pack the stations into one compact column table
+def station_columns(data, fields=POPUP_FIELDS):
+    """Return {'lat': [...], 'lon': [...], 'c': [...], field: [...]} with one entry per located station
+
+    c is the color class (0 green, 1 yellow, 2 red); the popup fields are only
+    read when a station is clicked.
+    """
+    data = data[data['lat'].notna() & data['lon'].notna()]
+    bikes = data['num_bikes_available'].to_numpy()
+    columns = {
+        'lat': np.round(data['lat'].to_numpy(dtype=float), 5).tolist(),
+        'lon': np.round(data['lon'].to_numpy(dtype=float), 5).tolist(),
+        'c': np.select([bikes > 3, bikes > 0], [0, 1], default=2).tolist(),  # Same classes as marker_colors
+    }
+    for field in fields:
+        columns[field] = data[field].astype(str if field == 'station_id' else int).tolist()
+    return columns
+
+
+# Define the function to draw the stations from a shared table with popups built on click
+def lazy_station_overlay(data, radius=2):
+    """Canvas circle markers that carry only their row number; the popup HTML is built when clicked"""
+    table = json.dumps(station_columns(data), separators=(',', ':'))
+    return """(function() {
+    var s = %s, fields = %s, aliases = %s, colors = ['green', 'yellow', 'red'];
+    var escape = function(v) { return String(v).replace(/[&<>"]/g, function(ch) { return '&#' + ch.charCodeAt(0) + ';'; }); };
+    var layer = L.featureGroup(), renderer = L.canvas(), markers = [];
+    for (var i = 0; i < s.lat.length; i++) {
+        markers.push(L.circleMarker([s.lat[i], s.lon[i]], {renderer: renderer, radius: %d, color: colors[s.c[i]], fill: true, fillOpacity: 0.7, row: i}).addTo(layer));
+    }
+    {map}.stations = {table: s, markers: markers};  // For station_patch_overlay
+    layer.on('click', function(e) {
+        var i = e.layer.options.row, rows = fields.map(function(f, j) { return '<tr><th>' + aliases[j] + '</th><td>' + escape(s[f][i]) + '</td></tr>'; });
+        L.popup({maxWidth: 300}).setLatLng(e.latlng).setContent('<table>' + rows.join('') + '</table>').openOn({map});
+    });
+    layer.addTo({map});
+})();""" % (table, json.dumps(POPUP_FIELDS), json.dumps(POPUP_ALIASES), int(radius))
+
+
+# Define the function to redraw only the stations that changed since the base map
+def station_patch_overlay(rows, columns):
+    """Recolor the lazy_station_overlay markers at rows and update their popup values
+
+    columns is station_columns() of the changed stations, in the order of rows.
+    """
+    patch = dict(columns, row=[int(row) for row in rows])
+    return """(function() {
+    var p = %s, s = {map}.stations.table, markers = {map}.stations.markers, colors = ['green', 'yellow', 'red'];
+    for (var j = 0; j < p.row.length; j++) {
+        var i = p.row[j];
+        for (var f in p) { if (f !== 'row') s[f][i] = p[f][j]; }
+        markers[i].setStyle({color: colors[p.c[j]]});
+    }
+})();""" % json.dumps(patch, separators=(',', ':'))
+
+
+# Define the function to render the city-wide base map once
+def render_base_map(data, center=TORONTO_CENTER, zoom_start=13, lazy_popups=True):
+    """Return (html, map_name) of the station map; overlays are added to it with with_overlays
+
+    With lazy_popups the stations are one shared column table instead of a
+    GeoJSON feature (and popup) per station.
+    """
+    if not lazy_popups:
+        m = build_station_map(data, center, zoom_start)
+        return m.get_root().render(), m.get_name()
+    m = folium.Map(location=center, zoom_start=zoom_start, tiles='cartodbpositron')  # Create a map with a grey background
+    html = with_overlays(m.get_root().render(), m.get_name(), [lazy_station_overlay(data)])
+    return html, m.get_name()
+
+
+class PatchedBaseMap:
+    """City-wide lazy-popup map of one system that follows its snapshots by patching markers
+
+    The stations are rendered once into a base page. A later snapshot whose
+    ChangeSet only changed existing stations reuses that page plus a
+    station_patch_overlay for the stations changed since the base, so a refresh
+    costs O(changed stations). The base is rendered again when stations were
+    added, removed or moved, or when more than max_patch of them are patched.
+    render(data, center) builds the base page (render_base_map by default).
+    """
+
+    def __init__(self, center=TORONTO_CENTER, max_patch=0.25, render=None):
+        self.center = center
+        self.max_patch = max_patch
+        self.render = render or (lambda data, center: render_base_map(data, center))
+        self._version = None
+        self._base = None  # (html, map_name) of the base page
+        self._rows = None  # station_id -> row of the base page's station table
+        self._patched = {}  # station_id -> its current station_columns() values
+        self._page = None  # (html, map_name) for self._version
+        self._lock = threading.Lock()
+
+    def _rebuild(self, data):
+        self._base = self.render(data, self.center)
+        located = data[data['lat'].notna() & data['lon'].notna()]
+        self._rows = pd.Index(located['station_id'].astype(str))
+        self._patched = {}
+        return self._base
+
+    def _patch(self, data, changed):
+        rows = data[data['station_id'].isin(changed)]
+        columns = station_columns(rows)
+        names = list(columns)
+        for values in zip(*columns.values()):
+            self._patched[values[names.index('station_id')]] = values
+        if len(self._patched) > self.max_patch * len(self._rows):
+            return self._rebuild(data)
+        station_ids = list(self._patched)
+        positions = self._rows.get_indexer(station_ids)
+        known = positions >= 0  # Stations without a location are not on the map
+        values = [value for value, keep in zip(self._patched.values(), known) if keep]
+        patch = {name: [row[i] for row in values] for i, name in enumerate(names)}
+        html, map_name = self._base
+        return with_overlays(html, map_name, [station_patch_overlay(positions[known], patch)]), map_name
+
+    def page(self, snapshot):
+        """Return (html, map_name) of the station map for snapshot"""
+        with self._lock:
+            if snapshot.version == self._version:
+                return self._page
+            changes = snapshot.changes
+            if self._version is not None and snapshot.version < self._version:
+                return self.render(snapshot.data, self.center)  # A session still on an older snapshot
+            if (self._version is not None and snapshot.version == self._version + 1 and changes is not None
+                    and not changes.added and not changes.removed):
+                page = self._patch(snapshot.data, changes.changed)
+            else:
+                page = self._rebuild(snapshot.data)
+            self._version, self._page = snapshot.version, page
+            return page
+
+
+# Define the functions that write small Leaflet overlays for a cached base map
+def view_overlay(center, zoom):
+    """Move the map to center at zoom"""
+    return '{{map}}.setView({}, {});'.format(json.dumps([float(center[0]), float(center[1])]), int(zoom))
+
+
+def marker_overlay(location, popup, color, icon):
+    """A font-awesome marker like folium.Marker(icon=folium.Icon(color, icon, prefix='fa'))"""
+    options = {'icon': icon, 'markerColor': color, 'iconColor': 'white', 'prefix': 'fa', 'extraClasses': 'fa-rotate-0'}
+    return 'L.marker({}, {{icon: L.AwesomeMarkers.icon({})}}).bindPopup({}).addTo({{map}});'.format(
+        json.dumps([float(location[0]), float(location[1])]), json.dumps(options), json.dumps(popup))
+
+
+def route_overlay(coordinates, tooltip, color='blue', weight=5):
+    """A polyline like folium.PolyLine(locations, color, weight, tooltip)"""
+    points = [[round(float(lat), 6), round(float(lon), 6)] for lat, lon in coordinates]
+    return 'L.polyline({}, {}).bindTooltip({}, {{sticky: true}}).addTo({{map}});'.format(
+        json.dumps(points), json.dumps({'color': color, 'weight': weight}), json.dumps(tooltip))
+
+
+# Define the function to add overlays to a rendered base map
+def with_overlays(html, map_name, overlays):
+    """Insert the overlay scripts at the end of the map's own script block"""
+    if not overlays:
+        return html
+    script = '\n'.join(overlay.replace('{map}', map_name) for overlay in overlays)
+    end = html.rfind('</script>')
+    return html[:end] + script + '\n' + html[end:]
+
+
+# Define the function to build the WebGL station layer for pydeck
+def station_deck_layer(data, radius_m=12):
+    """Return a pydeck ScatterplotLayer fed by a compact float32/uint8 frame"""
+    data = data[data['lat'].notna() & data['lon'].notna()]
+    bikes = data['num_bikes_available'].to_numpy()
+    palette = np.array([RGB['green'], RGB['yellow'], RGB['red']], dtype=np.uint8)
+    colors = palette[np.select([bikes > 3, bikes > 0], [0, 1], default=2)]  # Same classes as marker_colors
+    tooltip = pd.Series('', index=data.index)
+    for i, (field, alias) in enumerate(zip(POPUP_FIELDS, POPUP_ALIASES)):
+        values = data[field].astype(str) if field == 'station_id' else data[field].astype(int).astype(str)
+        tooltip = tooltip + ('<br>' if i else '') + alias + ' ' + values  # Same lines as the folium popup
+    frame = pd.DataFrame({
+        'lon': data['lon'].to_numpy(dtype=np.float32),
+        'lat': data['lat'].to_numpy(dtype=np.float32),
+        'r': colors[:, 0], 'g': colors[:, 1], 'b': colors[:, 2],
+        'tooltip': tooltip.to_numpy(),
+    })
+    return pdk.Layer(
+        'ScatterplotLayer',
+        frame,
+        get_position='[lon, lat]',
+        get_fill_color='[r, g, b, 180]',
+        get_radius=radius_m,
+        radius_min_pixels=2,
+        pickable=True,
+    )
+
+
+# Define the function to build a pydeck map with optional search overlays
+def build_station_deck(station_layer, view=None, markers=(), route=None):
+    """Return a pydeck.Deck drawing station_layer plus the user/station markers and the route as a PathLayer
+
+    Every layer's data carries its own 'tooltip' html, so one deck template fits
+    stations, markers (their popup text) and the route (its tooltip).
+    """
+    center, zoom = view if view is not None else (TORONTO_CENTER, 13)
+    layers = [station_layer]
+    if route is not None and len(route[0]) > 0:
+        path = [[round(float(lon), 6), round(float(lat), 6)] for lat, lon in route[0]]
+        layers.append(pdk.Layer('PathLayer', [{'path': path, 'tooltip': route[1]}], get_path='path',
+                                get_color=RGB['blue'], width_min_pixels=5, pickable=True))
+    if markers:
+        points = [{'lon': float(loc[1]), 'lat': float(loc[0]), 'color': RGB.get(color, RGB['blue']), 'tooltip': popup}
+                  for loc, popup, color, _ in markers]
+        layers.append(pdk.Layer('ScatterplotLayer', points, get_position='[lon, lat]', get_fill_color='color',
+                                get_radius=20, radius_min_pixels=6, stroked=True, get_line_color=[255, 255, 255],
+                                pickable=True))
+    tooltip = {'html': '{tooltip}'}
+    return pdk.Deck(
+        layers=layers,
+        initial_view_state=pdk.ViewState(latitude=float(center[0]), longitude=float(center[1]), zoom=zoom),
+        map_style='light',
+        tooltip=tooltip,
+    )
@@ -0,0 +1,194 @@
+"""Process-wide stage timings and cache counters, exported in Prometheus text format."""
+
+import bisect  # Import bisect to find histogram buckets
+import http.server  # Import http.server for the /metrics endpoint
+import threading  # Import threading to guard the shared state
+import time  # Import time for timing
+from contextlib import contextmanager  # Import contextmanager for the timing block
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds; +Inf is implied
+STAGE_SECONDS = 'bikeshare_stage_seconds'
+CACHE_LOOKUPS = 'bikeshare_cache_lookups_total'
+CACHE_MISSES = 'bikeshare_cache_misses_total'
+HTTP_RESPONSES = 'bikeshare_http_responses_total'
+HELP = {
+    STAGE_SECONDS: 'Time spent in each stage of a refresh or search.',
+    CACHE_LOOKUPS: 'Cache lookups by cache.',
+    CACHE_MISSES: 'Cache lookups that had to compute or download the value.',
+    HTTP_RESPONSES: 'Responses from outside services by status code.',
+}
+
+
+class Registry:
+    """Counters and latency histograms keyed by (name, sorted label items)
+
+    Values are plain dicts so a worker process can hand its samples to the
+    app process with take() and merge().
+    """
+
+    def __init__(self):
+        self._counters = {}  # (name, labels) -> float
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            values[bisect.bisect_left(BUCKETS, seconds)] += 1
+            values[-1] += seconds
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        """Observe the time spent in the with block as STAGE_SECONDS{stage=...}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage, **labels)
+
+    def lookup(self, cache, hit):
+        """Count one lookup of a cache, and a miss unless hit"""
+        self.inc(CACHE_LOOKUPS, cache=cache)
+        if not hit:
+            self.inc(CACHE_MISSES, cache=cache)
+
+    def take(self):
+        """Return and clear every sample (for a worker process to send to the app process)"""
+        with self._lock:
+            samples = (self._counters, self._histograms)
+            self._counters, self._histograms = {}, {}
+        return samples
+
+    def merge(self, samples):
+        counters, histograms = samples
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, values in histograms.items():
+                current = self._histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+                for i, value in enumerate(values):
+                    current[i] += value
+
+    def stages(self):
+        """Return [{'stage', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'}] estimated from the buckets"""
+        with self._lock:
+            items = [(dict(labels), list(values)) for (name, labels), values in self._histograms.items()
+                     if name == STAGE_SECONDS]
+        rows = []
+        for labels, values in sorted(items, key=lambda item: sorted(item[0].items())):
+            count = sum(values[:-1])
+            extra = ', '.join('{}={}'.format(k, v) for k, v in sorted(labels.items()) if k != 'stage')
+            row = {'stage': labels.get('stage', '') + (' ({})'.format(extra) if extra else ''),
+                   'count': count, 'mean_ms': 1000 * values[-1] / count if count else 0.0}
+            for q in (0.5, 0.95, 0.99):
+                row['p{}_ms'.format(int(q * 100))] = 1000 * quantile(q, values[:-1])
+            rows.append(row)
+        return rows
+
+    def caches(self):
+        """Return [{'cache', 'lookups', 'misses', 'hit_rate'}]"""
+        with self._lock:
+            counters = dict(self._counters)
+        rows = []
+        for (name, labels), lookups in sorted(counters.items()):
+            if name == CACHE_LOOKUPS:
+                misses = counters.get((CACHE_MISSES, labels), 0)
+                rows.append({'cache': dict(labels)['cache'], 'lookups': lookups, 'misses': misses,
+                             'hit_rate': 1 - misses / lookups if lookups else 0.0})
+        return rows
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        lines = []
+        seen = set()
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append('# HELP {} {}'.format(name, HELP.get(name, name)))
+                lines.append('# TYPE {} {}'.format(name, kind))
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+        for (name, labels), values in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), values[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', le),)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), _number(values[-1])))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+# Define the function to estimate a quantile from histogram bucket counts
+def quantile(q, counts):
+    """Linear interpolation inside the bucket that holds the q-th observation, like histogram_quantile()"""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if i == len(BUCKETS):
+                return BUCKETS[-1]  # Beyond the largest bucket
+            lower = BUCKETS[i - 1] if i else 0.0
+            return lower + (BUCKETS[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return BUCKETS[-1]
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in labels) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()  # Shared by every module and session of the process
+timed = REGISTRY.timed
+lookup = REGISTRY.lookup
+
+
+# Define the function to serve the registry on /metrics
+def start_http_server(port, host='0.0.0.0', registry=REGISTRY):
+    """Serve registry.render() on http://host:port/metrics from a daemon thread; return the server"""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
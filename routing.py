@@ -0,0 +1,181 @@
+"""Route caching for OSRM lookups."""
+
+import math  # Import math for grid snapping
+import os  # Import os for the cache location
+import sqlite3  # Import sqlite3 for the on-disk cache
+import threading  # Import threading to guard the shared state
+from collections import OrderedDict  # Import OrderedDict for the in-memory LRU
+
+from geocoding import CACHE_DIR  # Reuse the cache directory of the geocoder
+
+PUBLIC_OSRM_URL = 'http://router.project-osrm.org'  # Public demo server; it only has the car profile
+OSRM_URL = os.environ.get('BIKESHARE_OSRM_URL', PUBLIC_OSRM_URL).rstrip('/')  # OSRM server to route with
+SNAP_METERS = 25.0  # Origins within the same ~25 m cell share a cached route
+_METERS_PER_DEGREE = 111320.0
+
+
+# Define the function to get the OSRM server of a travel profile
+def osrm_url(profile):
+    """Return BIKESHARE_OSRM_URL_<PROFILE> (e.g. BIKESHARE_OSRM_URL_FOOT) when set, else OSRM_URL
+
+    An OSRM server routes with the one profile it was built for, whatever the
+    URL asks for: the public demo answers foot and cycling requests with car
+    routes. Walking and cycling times need a server built with that profile.
+    """
+    return os.environ.get('BIKESHARE_OSRM_URL_' + profile.upper(), OSRM_URL).rstrip('/')
+
+
+# Define the function to snap a location to its grid cell
+def snap_origin(latlon, meters=SNAP_METERS):
+    """Return integer (row, col) of the ~meters-wide grid cell that contains latlon"""
+    lat_step = meters / _METERS_PER_DEGREE
+    lon_step = lat_step / max(math.cos(math.radians(latlon[0])), 1e-6)
+    return int(math.floor(latlon[0] / lat_step)), int(math.floor(latlon[1] / lon_step))
+
+
+# Define the function to get the center of a grid cell
+def cell_center(row, col, meters=SNAP_METERS):
+    """Return [lat, lon] at the middle of the cell snap_origin() returned as (row, col)"""
+    lat_step = meters / _METERS_PER_DEGREE
+    lat = (row + 0.5) * lat_step
+    lon_step = lat_step / max(math.cos(math.radians(lat)), 1e-6)
+    return [lat, (col + 0.5) * lon_step]
+
+
+# Define the functions to compress route geometry with the Google polyline algorithm
+def encode_polyline(coordinates, precision=5):
+    """Encode [[lat, lon], ...] into a polyline string"""
+    factor = 10 ** precision
+    result = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coordinates:
+        lat, lon = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat - prev_lat, lon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                result.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            result.append(chr(value + 63))
+        prev_lat, prev_lon = lat, lon
+    return ''.join(result)
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a polyline string into [[lat, lon], ...]"""
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = value = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                value |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append([lat / factor, lon / factor])
+    return coordinates
+
+
+class RouteCache:
+    """Bounded in-memory LRU in front of a SQLite table of encoded routes
+
+    Entries are keyed by (snapped origin, station_id, profile) and remember the
+    station coordinates they were computed for, so a moved station is a miss.
+    """
+
+    def __init__(self, path=None, max_entries=2048):
+        self.path = path or os.path.join(CACHE_DIR, 'routes.sqlite')
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # key -> (station_lat, station_lon, geometry, duration)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, station_id TEXT, '
+                         'station_lat REAL, station_lon REAL, geometry TEXT, duration REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS routes_station ON routes (station_id)')
+        self._db.commit()
+
+    @staticmethod
+    def key(origin, station_id, profile):
+        row, col = snap_origin(origin)
+        return '{}:{}:{}:{}'.format(row, col, station_id, profile)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)  # Evict the least recently used route
+
+    def get(self, origin, station, profile):
+        """Return (coordinates, duration_seconds) for station [id, lat, lon], or None on a miss"""
+        key = self.key(origin, station[0], profile)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._db.execute('SELECT station_lat, station_lon, geometry, duration FROM routes '
+                                       'WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                entry = tuple(row)
+            if (round(entry[0], 6), round(entry[1], 6)) != (round(station[1], 6), round(station[2], 6)):
+                return None  # The station moved since this route was computed
+            self._remember(key, entry)
+        return decode_polyline(entry[2]), entry[3]
+
+    def set(self, origin, station, profile, coordinates, duration):
+        """Store a route to station [id, lat, lon] given as [[lat, lon], ...] and seconds"""
+        key = self.key(origin, station[0], profile)
+        entry = (float(station[1]), float(station[2]), encode_polyline(coordinates), float(duration))
+        with self._lock:
+            self._remember(key, entry)
+            self._db.execute('INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, str(station[0])) + entry)
+            self._db.commit()
+
+    def samples(self, limit=20000):
+        """Return the limit most recent (origin, [station_lat, station_lon], profile, duration), oldest first
+
+        The origin is the center of the snapped cell, within SNAP_METERS of the real one.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT key, station_lat, station_lon, duration FROM routes '
+                                    'ORDER BY rowid DESC LIMIT ?', (limit,)).fetchall()
+        result = []
+        for key, lat, lon, duration in rows:
+            row, col, rest = key.split(':', 2)
+            result.append((cell_center(int(row), int(col)), [lat, lon], rest.rsplit(':', 1)[1], duration))
+        return result[::-1]
+
+    def invalidate_moved(self, latlon_df):
+        """Drop cached routes to stations whose coordinates differ from station_information"""
+        current = {str(sid): (round(lat, 6), round(lon, 6))
+                   for sid, lat, lon in zip(latlon_df['station_id'], latlon_df['lat'], latlon_df['lon'])}
+        with self._lock:
+            rows = self._db.execute('SELECT DISTINCT station_id, station_lat, station_lon FROM routes').fetchall()
+            moved = [sid for sid, lat, lon in rows if current.get(sid, (None, None)) != (round(lat, 6), round(lon, 6))]
+            self._db.executemany('DELETE FROM routes WHERE station_id = ?', [(sid,) for sid in moved])
+            self._db.commit()
+            moved = set(moved)
+            for key in [k for k in self._memory if k.split(':', 2)[2].rsplit(':', 1)[0] in moved]:
+                del self._memory[key]
+        return len(moved)
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+# Define the function to get the process-wide route cache
+def get_route_cache():
+    global _route_cache
+    with _route_cache_lock:
+        if _route_cache is None:
+            _route_cache = RouteCache()
+    return _route_cache
@@ -0,0 +1,203 @@
+"""Process-wide background poller that publishes immutable station snapshots."""
+
+import logging  # Import logging to report failed refreshes
+import threading  # Import threading for the background poller
+import time  # Import time for timestamps
+from collections import namedtuple  # Import namedtuple for the immutable snapshot
+
+import numpy as np  # Import numpy for vectorized comparisons
+import pandas as pd  # Import pandas for id alignment
+
+from metrics import timed  # Import the stage timer
+
+logger = logging.getLogger(__name__)
+
+# One published view of the system; the frames are shared by every session and must not be modified
+# index_positions[i] is the index position of data row i (-1 without a location), computed once per snapshot
+Snapshot = namedtuple('Snapshot', ['version', 'updated_at', 'status', 'latlon', 'data', 'index', 'index_positions',
+                                   'metrics', 'changes'])
+
+# Stations that changed since the previous snapshot, plus the change of every headline metric
+ChangeSet = namedtuple('ChangeSet', ['changed', 'added', 'removed', 'deltas'])
+
+DIFF_COLUMNS = ['last_reported', 'num_bikes_available', 'num_docks_available']  # last_reported drives the diff
+LOCATION_COLUMNS = ['station_id', 'lat', 'lon']  # What the spatial index is built from
+
+
+# Define the function to compute the headline metrics shown above the map
+def station_metrics(data):
+    return {
+        'bikes': int(data['num_bikes_available'].sum()),
+        'ebikes': int(data['ebike'].sum()),
+        'stations_with_bikes': int((data['num_bikes_available'] > 0).sum()),
+        'stations_with_ebikes': int((data['ebike'] > 0).sum()),
+        'stations_with_docks': int((data['num_docks_available'] > 0).sum()),
+    }
+
+
+# Define the function to check whether a re-downloaded frame holds the same values
+def same_frame(previous, current, columns=None):
+    """Return True when both frames have the same rows, in the same order, in columns (default: all)"""
+    if previous is current:
+        return True
+    if columns is None:
+        if list(previous.columns) != list(current.columns):
+            return False
+        columns = list(current.columns)
+    elif not set(columns) <= set(previous.columns) & set(current.columns):
+        return False
+    return len(previous) == len(current) and all(
+        previous[column].array.equals(current[column].array)  # Same dtype and values; missing equals missing
+        for column in columns)
+
+
+# Define the function to find which stations changed between two status frames
+def diff_status(previous, current):
+    """Return a ChangeSet (without deltas) comparing two station status frames by station_id"""
+    prev = previous.drop_duplicates('station_id', keep='last').set_index('station_id')
+    cur = current.drop_duplicates('station_id', keep='last').set_index('station_id')
+    common = cur.index.intersection(prev.index)
+    changed = np.zeros(len(common), dtype=bool)
+    for column in DIFF_COLUMNS:
+        if column in prev.columns and column in cur.columns:
+            changed |= prev[column].reindex(common).to_numpy() != cur[column].reindex(common).to_numpy()
+    return ChangeSet(
+        changed=list(common[changed]),
+        added=list(cur.index.difference(prev.index)),
+        removed=list(prev.index.difference(cur.index)),
+        deltas={},
+    )
+
+
+# Define the function to patch only the changed rows of the joined frame
+def update_rows(previous_data, status, changed):
+    """Return previous_data with the status columns of the changed stations replaced
+
+    previous_data is shared by every session and never modified: the result is a
+    shallow copy where only the columns with a changed value are new arrays,
+    and every other column (names, coordinates, capacity...) is shared.
+    """
+    data = previous_data.copy(deep=False)
+    if len(changed) == 0:
+        return data
+    positions = pd.Index(data['station_id']).get_indexer(changed)
+    source = pd.Index(status['station_id']).get_indexer(changed)
+    for column in status.columns:
+        if column == 'station_id' or column not in data.columns:
+            continue
+        values = status[column].array[source]
+        if (data[column].array[positions] == values).all():
+            continue  # Leave the shared column untouched
+        patched = data[column].copy()  # Copy this one column only
+        patched.iloc[positions] = values
+        data[column] = patched  # Replaces the column in the copy; previous_data keeps its array
+    return data
+
+
+class StationPoller:
+    """Refresh station data on a schedule and publish a new Snapshot when it changes
+
+    fetch() returns (status_df, latlon_df); join(status_df, latlon_df) builds the
+    joined frame and build_index(latlon_df) the spatial index. The feed loaders
+    decide whether anything is downloaded, so polling often is cheap. When only
+    station_status changed, the stations whose last_reported moved are patched
+    into a shallow copy of the previous joined frame instead of merging again.
+    A station_information download with the same content as before counts as
+    unchanged, and the index is only rebuilt when a station was added or moved.
+    """
+
+    def __init__(self, fetch, join, build_index, interval=10.0, listeners=()):
+        self.fetch = fetch
+        self.join = join
+        self.build_index = build_index
+        self.interval = interval
+        self.listeners = list(listeners)  # Called with every newly published snapshot
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Fetch the feeds once and publish a new snapshot if either frame changed"""
+        status, latlon = self.fetch()
+        current = self._snapshot
+        if current is not None and latlon is not current.latlon and same_frame(current.latlon, latlon):
+            latlon = current.latlon  # Downloaded again, but no station was added, moved or renamed
+        if current is not None and status is current.status and latlon is current.latlon:
+            return current  # Nothing new from either feed
+        changes = None
+        index_positions = None
+        if current is None or latlon is not current.latlon:
+            if current is not None and same_frame(current.latlon, latlon, LOCATION_COLUMNS):
+                index = current.index  # Only names or capacities changed
+            else:
+                with timed('index'):
+                    index = self.build_index(latlon)
+            with timed('join'):
+                data = self.join(status, latlon)  # Joined once for every session
+        else:
+            index = current.index
+            changes = diff_status(current.status, status)
+            if self._can_patch(current, status, changes):
+                with timed('patch'):
+                    data = update_rows(current.data, status, changes.changed)  # Only the stations that reported
+                index_positions = current.index_positions  # Same rows in the same order
+            else:
+                with timed('join'):
+                    data = self.join(status, latlon)
+        if index_positions is None:
+            with timed('index'):
+                index_positions = index.positions(data['station_id'])  # Hashed here, not on every search
+        metrics = station_metrics(data)
+        if changes is not None:
+            deltas = {name: value - current.metrics[name] for name, value in metrics.items()}
+            changes = changes._replace(deltas=deltas)
+        snapshot = Snapshot(
+            version=(current.version + 1) if current is not None else 1,
+            updated_at=time.time(),
+            status=status,
+            latlon=latlon,
+            data=data,
+            index=index,
+            index_positions=index_positions,
+            metrics=metrics,
+            changes=changes,
+        )
+        with self._lock:
+            self._snapshot = snapshot
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception('Snapshot listener %r failed', listener)
+        return snapshot
+
+    @staticmethod
+    def _can_patch(current, status, changes):
+        """Rows can be patched in place when the set of stations and columns is unchanged"""
+        return (not changes.added and not changes.removed
+                and list(status.columns) == list(current.status.columns)
+                and status['station_id'].is_unique and current.data['station_id'].is_unique)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Station refresh failed; keeping snapshot %s', self._snapshot.version)
+
+    def start(self):
+        """Publish the first snapshot synchronously, then keep refreshing in a daemon thread"""
+        if self._thread is None:
+            self.refresh()  # Surface errors from the first load to the caller
+            self._thread = threading.Thread(target=self._run, name='station-poller', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self):
+        """Return the latest published snapshot"""
+        with self._lock:
+            return self._snapshot
@@ -0,0 +1,270 @@
+"""Local stand-in for the GBFS, Nominatim and OSRM services the app depends on.
+
+Serves synthetic (or recorded) feeds, geocodes and routes with configurable
+latency and failure rates, so the app can be load-tested without touching the
+public services:
+
+    python stand_in.py --port 8080 --stations 5000 --latency 20 --latency osrm=250 --failure-rate nominatim=0.02
+
+then start the app with the printed BIKESHARE_* environment variables.
+
+Paths:
+    /gbfs/gbfs.json, /gbfs/system_information.json,
+    /gbfs/station_status.json, /gbfs/station_information.json   GBFS 1.1
+    /search?q=...&format=json                                   Nominatim search
+    /route/v1/<profile>/<lon,lat;lon,lat>                       OSRM route (polyline geometry)
+    /table/v1/<profile>/<lon,lat;...>?sources=0                 OSRM duration table
+"""
+
+import argparse  # Import argparse for the command line
+import http.server  # Import http.server for the server
+import json  # Import json for the responses
+import os  # Import os for recorded feeds
+import random  # Import random for latency jitter and failures
+import threading  # Import threading to run the server in the background
+import time  # Import time for latency and feed timestamps
+import zlib  # Import zlib for stable per-address coordinates
+from urllib.parse import parse_qs, urlsplit  # Import URL parsing for the request paths
+
+import numpy as np  # Import numpy for synthetic data
+
+from routing import encode_polyline  # Import the polyline encoder used by OSRM responses
+
+CENTER = (43.6532, -79.3832)  # Toronto
+SERVICES = ('gbfs', 'nominatim', 'osrm')
+SPEEDS = {'driving': 8.0, 'cycling': 4.5, 'bike': 4.5, 'foot': 1.4, 'walking': 1.4}  # Meters per second in town
+DETOUR = 1.3  # Street distance over straight-line distance
+
+
+# Define the function to build synthetic station_status and station_information documents
+def synthetic_feeds(n, seed=0, now=None, center=CENTER, ttl=10):
+    """Return (status_bytes, information_bytes) for n stations at a constant density around center
+
+    Station locations depend only on n; seed changes the counts, so a new seed
+    looks like the next refresh of the same system.
+    """
+    now = int(time.time()) if now is None else now
+    place = np.random.default_rng(n)
+    half = 0.05 * np.sqrt(n / 600)  # About Toronto's density at any size
+    lats = center[0] + place.uniform(-half, half, n)
+    lons = center[1] + place.uniform(-half, half, n) / np.cos(np.radians(center[0]))
+    rng = np.random.default_rng(seed)
+    bikes = rng.integers(0, 20, n)
+    ebikes = rng.integers(0, bikes + 1)
+    docks = rng.integers(0, 20, n)
+    reported = now - rng.integers(0, 600, n)
+    information = [{'station_id': str(i), 'name': 'Station {}'.format(i), 'lat': round(float(lat), 6),
+                    'lon': round(float(lon), 6), 'capacity': 40} for i, (lat, lon) in enumerate(zip(lats, lons))]
+    status = [{'station_id': str(i), 'num_bikes_available': int(b), 'num_docks_available': int(d),
+               'num_bikes_available_types': {'mechanical': int(b - e), 'ebike': int(e)},
+               'is_installed': 1, 'is_renting': 1, 'is_returning': 1, 'last_reported': int(r)}
+              for i, (b, e, d, r) in enumerate(zip(bikes, ebikes, docks, reported))]
+    wrap = lambda stations: json.dumps({'last_updated': now, 'ttl': ttl, 'data': {'stations': stations}}).encode()
+    return wrap(status), wrap(information)
+
+
+# Define the function to get the straight-line distance in meters
+def distance_m(a, b):
+    lat1, lon1, lat2, lon2 = map(np.radians, (a[0], a[1], b[0], b[1]))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(2 * 6371000 * np.arcsin(np.sqrt(h)))
+
+
+# Define the function to parse "name=value" options, where a bare value applies to every service
+def per_service(values, cast=float, default=0.0):
+    result = dict.fromkeys(SERVICES, default)
+    for value in values or []:
+        name, _, number = value.rpartition('=')
+        for service in ([name] if name else SERVICES):
+            if service not in result:
+                raise ValueError('Unknown service {!r}; expected one of {}'.format(service, ', '.join(SERVICES)))
+            result[service] = cast(number)
+    return result
+
+
+class StandInServer:
+    """Threaded HTTP server answering like GBFS, Nominatim and OSRM
+
+    latency_ms and failure_rate map a service name to a delay and a probability
+    of answering 503. Status refreshes every ttl seconds (ttl=None keeps it
+    fixed). Files named like the feeds in record_dir are served as recorded.
+    """
+
+    def __init__(self, port=0, stations=5000, latency_ms=None, jitter_ms=0.0, failure_rate=None,
+                 ttl=10, record_dir=None, center=CENTER, host='127.0.0.1'):
+        self.stations = stations
+        self.latency_ms = dict.fromkeys(SERVICES, 0.0)
+        self.latency_ms.update(latency_ms or {})
+        self.failure_rate = dict.fromkeys(SERVICES, 0.0)
+        self.failure_rate.update(failure_rate or {})
+        self.jitter_ms = jitter_ms
+        self.ttl = ttl
+        self.record_dir = record_dir
+        self.center = center
+        self.requests = dict.fromkeys(SERVICES, 0)
+        self._feeds = {}  # name -> (generation, bytes)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real services
+            disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait for a delayed ACK
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def url(self, path):
+        return self.base_url + path
+
+    def environment(self):
+        """BIKESHARE_* variables that point the app at this server"""
+        return {
+            'BIKESHARE_GBFS_URLS': self.url('/gbfs/gbfs.json'),
+            'BIKESHARE_NOMINATIM_URL': self.base_url,
+            'BIKESHARE_OSRM_URL': self.base_url,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.httpd.serve_forever, name='stand-in', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Responses
+
+    def handle(self, request):
+        parts = urlsplit(request.path)
+        segments = parts.path.strip('/').split('/')
+        service = {'gbfs': 'gbfs', 'search': 'nominatim', 'route': 'osrm', 'table': 'osrm'}.get(segments[0])
+        if service is None:
+            return self._send(request, 404, {'error': 'not found'})
+        with self._lock:
+            self.requests[service] += 1
+        delay = self.latency_ms[service] + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if random.random() < self.failure_rate[service]:
+            return self._send(request, 503, {'error': 'stand-in failure'}, {'Retry-After': '0'})
+        try:
+            if service == 'gbfs':
+                body = self.feed(segments[-1])
+                if body is None:
+                    return self._send(request, 404, {'error': 'unknown feed'})
+                return self._send(request, 200, body)
+            if service == 'nominatim':
+                return self._send(request, 200, self.search(parse_qs(parts.query).get('q', [''])[0]))
+            points = [tuple(float(v) for v in pair.split(',')) for pair in segments[3].split(';')]  # lon,lat
+            profile = segments[2]
+            if segments[0] == 'route':
+                return self._send(request, 200, self.route(points, profile))
+            return self._send(request, 200, self.table(points, profile, parse_qs(parts.query)))
+        except (IndexError, ValueError) as error:
+            return self._send(request, 400, {'code': 'InvalidQuery', 'message': str(error)})
+
+    def _send(self, request, status, body, headers=None):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def feed(self, name):
+        name = name[:-5] if name.endswith('.json') else name
+        if self.record_dir:
+            path = os.path.join(self.record_dir, name + '.json')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        now = int(time.time())
+        if name == 'gbfs':
+            feeds = [{'name': feed, 'url': self.url('/gbfs/{}.json'.format(feed))}
+                     for feed in ('system_information', 'station_information', 'station_status')]
+            return json.dumps({'last_updated': now, 'ttl': 3600, 'data': {'en': {'feeds': feeds}}}).encode()
+        if name == 'system_information':
+            data = {'system_id': 'stand_in', 'name': 'Stand-in Bike Share', 'language': 'en', 'timezone': 'America/Toronto'}
+            return json.dumps({'last_updated': now, 'ttl': 3600, 'data': data}).encode()
+        if name not in ('station_status', 'station_information'):
+            return None
+        generation = 0 if not self.ttl else now // self.ttl
+        with self._lock:
+            cached = self._feeds.get(name)
+            if cached is None or cached[0] != generation:
+                status, information = synthetic_feeds(self.stations, seed=generation, now=now,
+                                                      center=self.center, ttl=self.ttl or 0)
+                self._feeds['station_status'] = (generation, status)
+                self._feeds['station_information'] = (generation, information)
+            return self._feeds[name][1]
+
+    def search(self, query):
+        """A stable point within ~3 km of center for every address; none for addresses containing 'nowhere'"""
+        if 'nowhere' in query.lower():
+            return []
+        digest = zlib.crc32(query.strip().lower().encode('utf-8'))
+        lat = self.center[0] + ((digest & 0xffff) / 0xffff - 0.5) * 0.05
+        lon = self.center[1] + ((digest >> 16) / 0xffff - 0.5) * 0.07
+        return [{'place_id': digest, 'lat': '{:.7f}'.format(lat), 'lon': '{:.7f}'.format(lon),
+                 'display_name': query, 'class': 'place', 'type': 'house', 'importance': 0.5,
+                 'boundingbox': [str(lat - 1e-4), str(lat + 1e-4), str(lon - 1e-4), str(lon + 1e-4)]}]
+
+    def route(self, points, profile):
+        """A dog-leg route between the first and last point at the profile's town speed"""
+        (lon1, lat1), (lon2, lat2) = points[0], points[-1]
+        path = [[lat1, lon1], [lat1, lon2], [lat2, lon2]]  # Along the street grid
+        meters = distance_m((lat1, lon1), (lat2, lon2)) * DETOUR
+        seconds = meters / SPEEDS.get(profile, SPEEDS['driving'])
+        return {'code': 'Ok', 'waypoints': [], 'routes': [{
+            'geometry': encode_polyline(path), 'duration': round(seconds, 1), 'distance': round(meters, 1),
+            'weight': round(seconds, 1), 'weight_name': 'routability', 'legs': []}]}
+
+    def table(self, points, profile, query):
+        sources = [int(i) for i in query['sources'][0].split(';')] if 'sources' in query else range(len(points))
+        speed = SPEEDS.get(profile, SPEEDS['driving'])
+        durations = [[round(distance_m(points[s][::-1], p[::-1]) * DETOUR / speed, 1) for p in points] for s in sources]
+        return {'code': 'Ok', 'durations': durations}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--stations', type=int, default=5000, help='synthetic system size')
+    parser.add_argument('--ttl', type=int, default=10, help='seconds between station_status refreshes (0 = fixed)')
+    parser.add_argument('--latency', action='append', metavar='[SERVICE=]MS', help='added delay; repeatable')
+    parser.add_argument('--jitter', type=float, default=0.0, metavar='MS', help='extra random delay up to MS')
+    parser.add_argument('--failure-rate', action='append', metavar='[SERVICE=]P', help='share of 503 answers; repeatable')
+    parser.add_argument('--record-dir', help='serve <feed>.json files from this folder instead of synthetic feeds')
+    args = parser.parse_args(argv)
+
+    server = StandInServer(args.port, args.stations, per_service(args.latency), args.jitter,
+                           per_service(args.failure_rate), args.ttl or None, args.record_dir, host=args.host)
+    for name, value in server.environment().items():
+        print('export {}={}'.format(name, value))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
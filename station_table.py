@@ -0,0 +1,59 @@
+"""Compact, typed station table with a precomputed status-to-location join."""
+
+import numpy as np  # Import numpy for typed arrays
+import pandas as pd  # Import pandas for the output frame
+
+COUNT_COLUMNS = ['num_bikes_available', 'num_docks_available', 'mechanical', 'ebike']  # Stored as uint16
+
+
+class StationTable:
+    """Station locations held as float32 arrays plus an id -> row lookup
+
+    Joining a status frame is an array take instead of a merge. The positions
+    for the last status id order are kept, so a refresh with the same stations
+    in the same order does not look any id up again.
+    """
+
+    def __init__(self, latlon_df):
+        latlon_df = latlon_df.drop_duplicates('station_id')
+        self.ids = pd.Index(latlon_df['station_id'].astype(str).to_numpy())
+        self.lat = latlon_df['lat'].to_numpy(dtype=np.float32)
+        self.lon = latlon_df['lon'].to_numpy(dtype=np.float32)
+        self._status_ids = None  # Station id order of the last joined status frame
+        self._positions = None  # Row of each of those ids in this table (-1 if unknown)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, station_ids):
+        """Return the table row of each station id, reusing the last lookup when the order is unchanged"""
+        station_ids = np.asarray(station_ids).astype(str)
+        if self._status_ids is None or not np.array_equal(station_ids, self._status_ids):
+            self._status_ids = station_ids
+            self._positions = self.ids.get_indexer(station_ids)
+        return self._positions
+
+    def join(self, status):
+        """Return a compact frame of status counts with lat/lon taken from this table"""
+        status = status.reset_index(drop=True)
+        positions = self.positions(status['station_id'])
+        known = positions >= 0
+        if known.all():
+            station_id = pd.Categorical.from_codes(positions, categories=self.ids)  # Codes are the table rows
+        else:
+            station_id = pd.Categorical(self._status_ids, categories=self.ids.union(pd.Index(self._status_ids)))
+        lat = np.full(len(status), np.nan, dtype=np.float32)
+        lon = np.full(len(status), np.nan, dtype=np.float32)
+        lat[known] = self.lat.take(positions[known])  # Array take instead of a merge
+        lon[known] = self.lon.take(positions[known])
+        columns = {'station_id': station_id}
+        for column in COUNT_COLUMNS:
+            if column in status.columns:
+                columns[column] = status[column].to_numpy(dtype=np.uint16)
+            else:
+                columns[column] = np.zeros(len(status), dtype=np.uint16)  # Feed has no breakdown by bike type
+        if 'last_reported' in status.columns:
+            columns['last_reported'] = status['last_reported'].array  # Keeps the tz-aware datetime dtype
+        columns['lat'] = lat
+        columns['lon'] = lon
+        return pd.DataFrame(columns)
@@ -96,39 +96,13 @@ with st.sidebar:
 if bike_method == "Return" and findmeadock == False:
     center = [43.65306613746548, -79.38815311015]
     m = folium.Map(location=center, zoom_start=13, tiles='cartodbpositron')
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=2,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.7,
-            popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                               f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                               f"Mechanical Bike Available: {row['mechanical']}<br>"
-                               f"eBike Available: {row['ebike']}", max_width=300)
-        ).add_to(m)
+    station_layer(data).add_to(m)
     folium_static(m)
 
 if bike_method == "Rent" and findmeabike == False:
     center = [43.65306613746548, -79.38815311015]
     m = folium.Map(location=center, zoom_start=13, tiles='cartodbpositron')
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=2,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.7,
-            popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                               f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                               f"Mechanical Bike Available: {row['mechanical']}<br>"
-                               f"eBike Available: {row['ebike']}", max_width=300)
-        ).add_to(m)
+    station_layer(data).add_to(m)
     folium_static(m)
 
 # Logic for finding a bike
@@ -138,20 +112,7 @@ if findmeabike:
             chosen_station = get_bike_availability(iamhere, data, input_bike_modes)
             center = iamhere
             m1 = folium.Map(location=center, zoom_start=16, tiles='cartodbpositron')
-            for _, row in data.iterrows():
-                marker_color = get_marker_color(row['num_bikes_available'])
-                folium.CircleMarker(
-                    location=[row['lat'], row['lon']],
-                    radius=2,
-                    color=marker_color,
-                    fill=True,
-                    fill_color=marker_color,
-                    fill_opacity=0.7,
-                    popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                                       f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                                       f"Mechanical Bike Available: {row['mechanical']}<br>"
-                                       f"eBike Available: {row['ebike']}", max_width=300)
-                ).add_to(m1)
+            station_layer(data).add_to(m1)
             folium.Marker(
                 location=iamhere,
                 popup="You are here.",
@@ -179,20 +140,7 @@ if findmeadock:
             chosen_station = get_dock_availability(iamhere_return, data)
             center = iamhere_return
             m1 = folium.Map(location=center, zoom_start=16, tiles='cartodbpositron')
-            for _, row in data.iterrows():
-                marker_color = get_marker_color(row['num_bikes_available'])
-                folium.CircleMarker(
-                    location=[row['lat'], row['lon']],
-                    radius=2,
-                    color=marker_color,
-                    fill=True,
-                    fill_color=marker_color,
-                    fill_opacity=0.7,
-                    popup=folium.Popup(f"Station ID: {row['station_id']}<br>"
-                                       f"Total Bikes Available: {row['num_bikes_available']}<br>"
-                                       f"Mechanical Bike Available: {row['mechanical']}<br>"
-                                       f"eBike Available: {row['ebike']}", max_width=300)
-                ).add_to(m1)
+            station_layer(data).add_to(m1)
             folium.Marker(
                 location=iamhere_return,
                 popup="You are here.",
@@ -5,9 +5,63 @@ IMPORTANT: This is a template file. You need to replace these placeholder functi
 with your actual implementations from your helpers.py file.
 """
 
+import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import folium
+import threading
+import time
+import numpy as np
 import pandas as pd
-from math import radians, cos, sin, asin, sqrt
+from collections import OrderedDict, deque
+
+try:
+    from local_routing import get_local_router  # Optional offline routing; see DEPLOYMENT_GUIDE.md
+except ImportError:
+    get_local_router = None
+
+# OSRM server with the foot profile; the public demo server only routes cars
+OSRM_URL = os.environ.get('BIKESHARE_OSRM_URL_FOOT', os.environ.get('BIKESHARE_OSRM_URL', 'http://router.project-osrm.org')).rstrip('/')
+WALKING_SPEED = 1.35  # Meters per second along the sidewalk
+DEFAULT_DETOUR = 1.4  # Walking distance over straight-line distance in a street grid
+MIN_DETOUR, MAX_DETOUR = 1.0, 5.0  # Detour factors of plausible walking routes
+ROUTE_TIMEOUT = 3  # Seconds to wait for OSRM before showing the estimate instead
+FEED_TIMEOUT = (3.05, 10)  # (connect, read) seconds for the GBFS feeds
+_detour_samples = deque(maxlen=200)  # Detour factors of the most recent OSRM routes
+GEOCODE_CACHE_SIZE = 1024  # Addresses remembered by geocode()
+_geocode_cache = OrderedDict()  # Normalized address -> [lat, lon] or ''
+_geocode_lock = threading.Lock()  # Guards _geocode_cache; never held during a request
+_nominatim_lock = threading.Lock()  # One Nominatim request at a time for every session
+_last_geocode = [0.0]  # Time of the last Nominatim request
+
+
+def build_session(retries=3, backoff_factor=0.3):
+    """
+    Build a session that reuses connections and retries transient failures
+    
+    Same policy as the root app's transport.py: GETs are retried with backoff
+    on connection errors and 429/5xx responses, honouring Retry-After.
+    
+    Returns:
+        requests.Session: Session with the retry adapter mounted
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = build_session()  # Shared by the feeds, geocoding and routing
 
 
 def query_station_status(station_url):
@@ -21,25 +75,30 @@ def query_station_status(station_url):
         pandas.DataFrame: DataFrame with station status information
     """
     # TODO: Replace with your actual implementation
-    response = requests.get(station_url)
+    response = _session.get(station_url, timeout=FEED_TIMEOUT)
+    response.raise_for_status()
     data = response.json()
     
     # Parse the data and create a DataFrame
     stations = data['data']['stations']
     df = pd.DataFrame(stations)
     
-    # Add bike type counts if available
+    # Add bike type counts if available (same columns as the root app's gbfs.py schema)
     if 'num_bikes_available_types' in df.columns:
-        df['ebike'] = df['num_bikes_available_types'].apply(
-            lambda x: x.get('ebike', 0) if isinstance(x, dict) else 0
-        )
-        df['mechanical'] = df['num_bikes_available_types'].apply(
-            lambda x: x.get('mechanical', 0) if isinstance(x, dict) else 0
-        )
+        records = df.pop('num_bikes_available_types').tolist()
+        if any(not isinstance(r, dict) for r in records):
+            records = [r if isinstance(r, dict) else {} for r in records]
+        types = pd.DataFrame.from_records(records, index=df.index)
+        df['ebike'] = types['ebike'].fillna(0).astype(int) if 'ebike' in types else 0
+        df['mechanical'] = types['mechanical'].fillna(0).astype(int) if 'mechanical' in types else 0
     else:
         df['ebike'] = 0
         df['mechanical'] = df['num_bikes_available']
     
+    # Convert report times in one vectorized step
+    if 'last_reported' in df.columns:
+        df['last_reported'] = pd.to_datetime(df['last_reported'], unit='s', utc=True)
+    
     return df
 
 
@@ -54,7 +113,8 @@ def get_station_latlon(latlon_url):
         pandas.DataFrame: DataFrame with station latitude and longitude
     """
     # TODO: Replace with your actual implementation
-    response = requests.get(latlon_url)
+    response = _session.get(latlon_url, timeout=FEED_TIMEOUT)
+    response.raise_for_status()
     data = response.json()
     
     stations = data['data']['stations']
@@ -98,55 +158,145 @@ def get_marker_color(num_bikes):
         return 'green'
 
 
+def marker_colors(num_bikes):
+    """
+    Vectorized get_marker_color for a whole column of bike counts
+    
+    Args:
+        num_bikes: Array or Series of available bikes per station
+        
+    Returns:
+        numpy.ndarray: Color name per station
+    """
+    num_bikes = np.asarray(num_bikes)
+    return np.select([num_bikes == 0, num_bikes < 5], ['red', 'orange'], default='green')
+
+
+def station_layer(data):
+    """
+    Build every station marker as one GeoJSON layer with a shared popup template
+    
+    Args:
+        data: DataFrame with station_id, lat, lon and bike count columns
+        
+    Returns:
+        folium.GeoJson: Layer to add to a map
+    """
+    data = data[data['lat'].notna() & data['lon'].notna()]
+    fields = ['station_id', 'num_bikes_available', 'mechanical', 'ebike']
+    properties = pd.DataFrame({
+        'station_id': data['station_id'].astype(str),
+        'num_bikes_available': data['num_bikes_available'].astype(int),
+        'mechanical': data['mechanical'].astype(int),
+        'ebike': data['ebike'].astype(int),
+        'color': marker_colors(data['num_bikes_available']),
+    }).to_dict('records')
+    coordinates = np.column_stack([data['lon'].to_numpy(dtype=float), data['lat'].to_numpy(dtype=float)]).tolist()
+    geojson = {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': point}, 'properties': props}
+            for point, props in zip(coordinates, properties)
+        ],
+    }
+    return folium.GeoJson(
+        geojson,
+        marker=folium.CircleMarker(radius=2, fill=True, fill_opacity=0.7),
+        style_function=lambda feature: {
+            'color': feature['properties']['color'],
+            'fillColor': feature['properties']['color'],
+        },
+        popup=folium.GeoJsonPopup(
+            fields=fields,
+            aliases=['Station ID:', 'Total Bikes Available:', 'Mechanical Bike Available:', 'eBike Available:'],
+            max_width=300,
+        ),
+    )
+
+
 def geocode(address):
     """
     Convert address to coordinates using a geocoding service
     
+    Results are cached per normalized address for every session, and requests
+    to Nominatim are throttled to one per second as its usage policy requires.
+    Cached addresses are answered without waiting behind a pending request.
+    
     Args:
         address: Full address string
         
     Returns:
         list or str: [latitude, longitude] or empty string if failed
     """
-    # TODO: Replace with your actual implementation
-    # Example using Nominatim (OpenStreetMap)
-    try:
-        import urllib.parse
-        encoded_address = urllib.parse.quote(address)
-        url = f"https://nominatim.openstreetmap.org/search?q={encoded_address}&format=json&limit=1"
-        
-        headers = {'User-Agent': 'Toronto Bike Share App'}
-        response = requests.get(url, headers=headers)
-        data = response.json()
-        
-        if data:
-            return [float(data[0]['lat']), float(data[0]['lon'])]
-        return ''
-    except:
-        return ''
+    key = ' '.join(address.lower().replace(',', ' ').split())
+    with _geocode_lock:
+        if key in _geocode_cache:
+            _geocode_cache.move_to_end(key)
+            return _geocode_cache[key]
+    with _nominatim_lock:
+        with _geocode_lock:
+            if key in _geocode_cache:  # Another session looked it up while this one waited
+                return _geocode_cache[key]
+        try:
+            time.sleep(max(0.0, _last_geocode[0] + 1.0 - time.monotonic()))
+            _last_geocode[0] = time.monotonic()
+            url = "https://nominatim.openstreetmap.org/search"
+            headers = {'User-Agent': 'Toronto Bike Share App'}
+            response = _session.get(url, params={'q': address, 'format': 'json', 'limit': 1}, headers=headers, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            return ''  # Not cached, so the next click tries again
+    result = [float(data[0]['lat']), float(data[0]['lon'])] if data else ''
+    with _geocode_lock:
+        _geocode_cache[key] = result
+        while len(_geocode_cache) > GEOCODE_CACHE_SIZE:
+            _geocode_cache.popitem(last=False)
+    return result
 
 
 def haversine(lon1, lat1, lon2, lat2):
     """
-    Calculate the great circle distance between two points on earth
+    Calculate the great circle distance between points on earth
+    
+    Works on scalars or numpy arrays, so one call can measure the distance
+    from the user to every station at once.
     
     Args:
-        lon1, lat1: Coordinates of first point
-        lon2, lat2: Coordinates of second point
+        lon1, lat1: Coordinates of first point(s)
+        lon2, lat2: Coordinates of second point(s)
         
     Returns:
-        float: Distance in kilometers
+        float or numpy.ndarray: Distance in kilometers
     """
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
     
     dlon = lon2 - lon1
     dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
     km = 6371 * c
     return km
 
 
+def nearest_station(user_location, data):
+    """
+    Pick the station closest to the user in a single vectorized pass
+    
+    Args:
+        user_location: [latitude, longitude] of user
+        data: DataFrame of candidate stations with lat/lon columns
+        
+    Returns:
+        tuple: (station_id, latitude, longitude)
+    """
+    distances = haversine(user_location[1], user_location[0],
+                          data['lon'].to_numpy(dtype=float), data['lat'].to_numpy(dtype=float))
+    nearest = data.iloc[int(np.argmin(distances))]
+    
+    return (nearest['station_id'], nearest['lat'], nearest['lon'])
+
+
 def get_bike_availability(user_location, data, bike_modes):
     """
     Find the nearest station with available bikes
@@ -160,7 +310,7 @@ def get_bike_availability(user_location, data, bike_modes):
         tuple: (station_id, latitude, longitude)
     """
     # TODO: Replace with your actual implementation
-    filtered_data = data.copy()
+    filtered_data = data
     
     # Filter by bike type if specified
     if bike_modes:
@@ -173,16 +323,8 @@ def get_bike_availability(user_location, data, bike_modes):
     else:
         filtered_data = filtered_data[filtered_data['num_bikes_available'] > 0]
     
-    # Calculate distances
-    filtered_data['distance'] = filtered_data.apply(
-        lambda row: haversine(user_location[1], user_location[0], row['lon'], row['lat']),
-        axis=1
-    )
-    
     # Find nearest station
-    nearest = filtered_data.loc[filtered_data['distance'].idxmin()]
-    
-    return (nearest['station_id'], nearest['lat'], nearest['lon'])
+    return nearest_station(user_location, filtered_data)
 
 
 def get_dock_availability(user_location, data):
@@ -197,18 +339,30 @@ def get_dock_availability(user_location, data):
         tuple: (station_id, latitude, longitude)
     """
     # TODO: Replace with your actual implementation
-    filtered_data = data[data['num_docks_available'] > 0].copy()
-    
-    # Calculate distances
-    filtered_data['distance'] = filtered_data.apply(
-        lambda row: haversine(user_location[1], user_location[0], row['lon'], row['lat']),
-        axis=1
-    )
+    filtered_data = data[data['num_docks_available'] > 0]
     
     # Find nearest station
-    nearest = filtered_data.loc[filtered_data['distance'].idxmin()]
+    return nearest_station(user_location, filtered_data)
+
+
+def estimate_travel_time(destination_station, user_location):
+    """
+    Estimate walking minutes from the straight-line distance, without a routing call
     
-    return (nearest['station_id'], nearest['lat'], nearest['lon'])
+    The detour factor is the median over the routes OSRM returned so far
+    (DEFAULT_DETOUR until there are five), so it adapts to the city's streets.
+    It is never below MIN_DETOUR.
+    
+    Args:
+        destination_station: (station_id, lat, lon)
+        user_location: [lat, lon]
+        
+    Returns:
+        float: Estimated duration in minutes
+    """
+    meters = 1000 * haversine(user_location[1], user_location[0], destination_station[2], destination_station[1])
+    detour = float(np.median(_detour_samples)) if len(_detour_samples) >= 5 else DEFAULT_DETOUR
+    return meters * max(detour, MIN_DETOUR) / WALKING_SPEED / 60
 
 
 def run_osrm(destination_station, user_location):
@@ -219,15 +373,27 @@ def run_osrm(destination_station, user_location):
         destination_station: (station_id, lat, lon)
         user_location: [lat, lon]
         
+    Walking routes come from a prebuilt local graph when local_routing.py is
+    deployed with one (get_local_router('foot')), and from the OSRM server at
+    OSRM_URL otherwise.
+    
     Returns:
-        tuple: (coordinates_list, duration_string)
+        tuple: (coordinates_list, duration_string); a straight line and "~N min"
+        from estimate_travel_time() when OSRM fails or takes longer than ROUTE_TIMEOUT
     """
+    router = get_local_router('foot') if get_local_router is not None else None
+    if router is not None:
+        found = router.route(user_location, (destination_station[1], destination_station[2]))
+        if found is not None:
+            coordinates, duration_seconds = found
+            return coordinates, f"{int(duration_seconds / 60)} min"
+    
     # TODO: Replace with your actual implementation
     try:
         # OSRM API for walking route
-        url = f"http://router.project-osrm.org/route/v1/foot/{user_location[1]},{user_location[0]};{destination_station[2]},{destination_station[1]}?overview=full&geometries=geojson"
+        url = f"{OSRM_URL}/route/v1/foot/{user_location[1]},{user_location[0]};{destination_station[2]},{destination_station[1]}?overview=full&geometries=geojson"
         
-        response = requests.get(url)
+        response = _session.get(url, timeout=(FEED_TIMEOUT[0], ROUTE_TIMEOUT))
         data = response.json()
         
         if data['code'] == 'Ok':
@@ -239,12 +405,17 @@ def run_osrm(destination_station, user_location):
             duration_minutes = int(duration_seconds / 60)
             duration_string = f"{duration_minutes} min"
             
+            # Calibrate the estimate with this route
+            meters = 1000 * haversine(user_location[1], user_location[0], destination_station[2], destination_station[1])
+            if meters > 150:
+                detour = duration_seconds * WALKING_SPEED / meters
+                if MIN_DETOUR <= detour <= MAX_DETOUR:  # Not a car route from a server without the foot profile
+                    _detour_samples.append(detour)
+            
             return coordinates, duration_string
-        else:
-            # Fallback: straight line
-            return [[user_location[0], user_location[1]], 
-                    [destination_station[1], destination_station[2]]], "N/A"
-    except:
-        # Fallback: straight line
-        return [[user_location[0], user_location[1]], 
-                [destination_station[1], destination_station[2]]], "N/A"
+    except Exception:
+        pass
+    
+    # Fallback: straight line with the estimated time
+    return [[user_location[0], user_location[1]], 
+            [destination_station[1], destination_station[2]]], f"~{int(round(estimate_travel_time(destination_station, user_location)))} min"
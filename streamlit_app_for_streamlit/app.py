@@ -1,15 +1,19 @@
 import streamlit as st
+import os
 import requests
 import pandas as pd
 import datetime as dt
 import urllib
 import json
 import time
+import numpy as np
 import folium
 from streamlit_folium import folium_static
 from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
+from geopy.extra.rate_limiter import RateLimiter
+import threading
 import polyline
+from collections import deque
 
 # Configure page
 st.set_page_config(
@@ -27,16 +31,16 @@ def query_station_status(url):
         response.raise_for_status()
         data = response.json()
         
-        stations = []
-        for station in data['data']['stations']:
-            stations.append({
-                'station_id': station['station_id'],
-                'num_bikes_available': station['num_bikes_available'],
-                'num_docks_available': station['num_docks_available'],
-                'ebike': station.get('num_ebikes_available', 0),
-                'mechanical': station['num_bikes_available'] - station.get('num_ebikes_available', 0)
-            })
-        return pd.DataFrame(stations)
+        # Build the frame once and derive the bike type columns vectorized
+        df = pd.DataFrame(data['data']['stations'])
+        ebike = df['num_ebikes_available'].fillna(0).astype(int) if 'num_ebikes_available' in df else 0
+        return pd.DataFrame({
+            'station_id': df['station_id'].astype(str),
+            'num_bikes_available': df['num_bikes_available'],
+            'num_docks_available': df['num_docks_available'],
+            'ebike': ebike,
+            'mechanical': df['num_bikes_available'] - ebike
+        })
     except Exception as e:
         st.error(f"Error fetching station status: {e}")
         return pd.DataFrame()
@@ -49,15 +53,13 @@ def get_station_latlon(url):
         response.raise_for_status()
         data = response.json()
         
-        stations = []
-        for station in data['data']['stations']:
-            stations.append({
-                'station_id': station['station_id'],
-                'lat': station['lat'],
-                'lon': station['lon'],
-                'name': station.get('name', 'Unknown')
-            })
-        return pd.DataFrame(stations)
+        df = pd.DataFrame(data['data']['stations'])
+        return pd.DataFrame({
+            'station_id': df['station_id'].astype(str),
+            'lat': df['lat'],
+            'lon': df['lon'],
+            'name': df['name'].fillna('Unknown') if 'name' in df else 'Unknown'
+        })
     except Exception as e:
         st.error(f"Error fetching station locations: {e}")
         return pd.DataFrame()
@@ -68,14 +70,26 @@ def join_latlon(status_df, latlon_df):
         return pd.DataFrame()
     return pd.merge(status_df, latlon_df, on='station_id', how='inner')
 
+@st.cache_resource
+def get_geolocator():
+    """One Nominatim client for every session, throttled to one request per second"""
+    geolocator = Nominatim(user_agent="toronto_bikeshare_app", timeout=10)
+    return RateLimiter(geolocator.geocode, min_delay_seconds=1, swallow_exceptions=False), threading.Lock()
+
+@st.cache_data(ttl=30 * 24 * 3600, max_entries=1024, show_spinner=False)
+def geocode_normalized(address):
+    """Geocode a normalized address; failures raise and are not cached"""
+    geocode_limited, lock = get_geolocator()
+    with lock:
+        location = geocode_limited(address)
+    if location:
+        return [location.latitude, location.longitude]
+    return ''
+
 def geocode(address):
     """Convert address to coordinates"""
     try:
-        geolocator = Nominatim(user_agent="toronto_bikeshare_app")
-        location = geolocator.geocode(address)
-        if location:
-            return [location.latitude, location.longitude]
-        return ''
+        return geocode_normalized(' '.join(address.lower().replace(',', ' ').split()))
     except Exception as e:
         st.error(f"Geocoding error: {e}")
         return ''
@@ -89,9 +103,54 @@ def get_marker_color(num_bikes):
     else:
         return 'green'
 
+def station_layer(data, fields, aliases):
+    """All stations as one GeoJSON layer; colors are classified vectorized, popups share one template"""
+    data = data[data['lat'].notna() & data['lon'].notna()]
+    bikes = data['num_bikes_available'].to_numpy()
+    colors = np.select([bikes == 0, bikes <= 3], ['red', 'orange'], default='green')
+    properties = data[fields].astype({f: (str if f == 'station_id' else int) for f in fields}).assign(color=colors)
+    coordinates = np.column_stack([data['lon'].to_numpy(dtype=float), data['lat'].to_numpy(dtype=float)]).tolist()
+    geojson = {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': point}, 'properties': props}
+            for point, props in zip(coordinates, properties.to_dict('records'))
+        ]
+    }
+    return folium.GeoJson(
+        geojson,
+        marker=folium.CircleMarker(radius=3, fill=True, fill_opacity=0.7),
+        style_function=lambda feature: {
+            'color': feature['properties']['color'],
+            'fillColor': feature['properties']['color']
+        },
+        popup=folium.GeoJsonPopup(fields=fields, aliases=aliases, max_width=300)
+    )
+
+BIKE_FIELDS = ['station_id', 'num_bikes_available', 'mechanical', 'ebike']
+BIKE_ALIASES = ['Station ID:', 'Total Bikes:', 'Mechanical:', 'E-Bike:']
+DOCK_FIELDS = ['station_id', 'num_docks_available', 'num_bikes_available']
+DOCK_ALIASES = ['Station ID:', 'Docks Available:', 'Bikes Available:']
+
+def haversine_m(lat, lon, lats, lons):
+    """Great-circle distance in meters from one point to arrays of points"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371008.8 * np.arcsin(np.sqrt(a))
+
+def nearest_station(user_location, stations):
+    """Pick the closest station in one vectorized pass over all coordinates"""
+    distances = haversine_m(
+        user_location[0], user_location[1],
+        stations['lat'].to_numpy(dtype=float), stations['lon'].to_numpy(dtype=float)
+    )
+    row = stations.iloc[int(np.argmin(distances))]
+    return (row['station_id'], row['lat'], row['lon'])
+
 def get_bike_availability(user_location, data, bike_modes):
     """Find nearest station with requested bike types"""
-    filtered_data = data.copy()
+    filtered_data = data
     
     # Filter based on bike modes
     if 'ebike' in bike_modes and 'mechanical' not in bike_modes:
@@ -109,17 +168,7 @@ def get_bike_availability(user_location, data, bike_modes):
         st.warning("No bikes available matching your criteria")
         return None
     
-    # Find nearest station
-    min_distance = float('inf')
-    nearest_station = None
-    
-    for _, row in filtered_data.iterrows():
-        distance = geodesic(user_location, (row['lat'], row['lon'])).meters
-        if distance < min_distance:
-            min_distance = distance
-            nearest_station = (row['station_id'], row['lat'], row['lon'])
-    
-    return nearest_station
+    return nearest_station(user_location, filtered_data)
 
 def get_dock_availability(user_location, data):
     """Find nearest station with available docks"""
@@ -129,23 +178,32 @@ def get_dock_availability(user_location, data):
         st.warning("No docks available")
         return None
     
-    # Find nearest station
-    min_distance = float('inf')
-    nearest_station = None
-    
-    for _, row in available_docks.iterrows():
-        distance = geodesic(user_location, (row['lat'], row['lon'])).meters
-        if distance < min_distance:
-            min_distance = distance
-            nearest_station = (row['station_id'], row['lat'], row['lon'])
-    
-    return nearest_station
+    return nearest_station(user_location, available_docks)
+
+# OSRM server with the foot profile; the public demo server only routes cars
+OSRM_URL = os.environ.get('BIKESHARE_OSRM_URL_FOOT', os.environ.get('BIKESHARE_OSRM_URL', 'http://router.project-osrm.org')).rstrip('/')
+WALKING_SPEED = 1.35  # Meters per second along the sidewalk
+DEFAULT_DETOUR = 1.4  # Walking distance over straight-line distance in a street grid
+MIN_DETOUR, MAX_DETOUR = 1.0, 5.0  # Detour factors of plausible walking routes
+ROUTE_TIMEOUT = 3  # Seconds to wait for OSRM before showing the estimate instead
+
+@st.cache_resource
+def detour_samples():
+    """Detour factors of the most recent OSRM routes, shared by every session"""
+    return deque(maxlen=200)
+
+def estimate_travel_time(station, user_location):
+    """Walking minutes from the straight-line distance and the median detour of past routes"""
+    meters = haversine_m(user_location[0], user_location[1], float(station[1]), float(station[2]))
+    samples = detour_samples()
+    detour = float(np.median(samples)) if len(samples) >= 5 else DEFAULT_DETOUR
+    return meters * max(detour, MIN_DETOUR) / WALKING_SPEED / 60
 
 def run_osrm(station, user_location):
-    """Get route from OSRM and calculate duration"""
+    """Get route from OSRM and calculate duration; falls back to a straight line and "~minutes" """
     try:
-        url = f"http://router.project-osrm.org/route/v1/foot/{user_location[1]},{user_location[0]};{station[2]},{station[1]}?overview=full&geometries=polyline"
-        response = requests.get(url, timeout=10)
+        url = f"{OSRM_URL}/route/v1/foot/{user_location[1]},{user_location[0]};{station[2]},{station[1]}?overview=full&geometries=polyline"
+        response = requests.get(url, timeout=ROUTE_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         
@@ -158,11 +216,17 @@ def run_osrm(station, user_location):
             encoded_polyline = route['geometry']
             coordinates = polyline.decode(encoded_polyline)
             
+            # Calibrate the estimate with this route
+            meters = haversine_m(user_location[0], user_location[1], float(station[1]), float(station[2]))
+            if meters > 150:
+                detour = duration_seconds * WALKING_SPEED / meters
+                if MIN_DETOUR <= detour <= MAX_DETOUR:  # Not a car route from a server without the foot profile
+                    detour_samples().append(detour)
+            
             return coordinates, duration_minutes
-        return [], 0
     except Exception as e:
-        st.error(f"Route calculation error: {e}")
-        return [], 0
+        st.caption(f"Route unavailable ({e}); showing an estimated travel time.")
+    return [list(user_location), [station[1], station[2]]], f"~{estimate_travel_time(station, user_location):.1f}"
 
 # URLs
 station_url = 'https://tor.publicbikesystem.net/ube/gbfs/v1/en/station_status.json'
@@ -239,23 +303,7 @@ if bike_method == "Rent":
                     m1 = folium.Map(location=iamhere, zoom_start=15, tiles='cartodbpositron')
                     
                     # Add all stations
-                    for _, row in data.iterrows():
-                        marker_color = get_marker_color(row['num_bikes_available'])
-                        folium.CircleMarker(
-                            location=[row['lat'], row['lon']],
-                            radius=3,
-                            color=marker_color,
-                            fill=True,
-                            fill_color=marker_color,
-                            fill_opacity=0.7,
-                            popup=folium.Popup(
-                                f"<b>Station ID:</b> {row['station_id']}<br>"
-                                f"<b>Total Bikes:</b> {row['num_bikes_available']}<br>"
-                                f"<b>Mechanical:</b> {row['mechanical']}<br>"
-                                f"<b>E-Bike:</b> {row['ebike']}", 
-                                max_width=300
-                            )
-                        ).add_to(m1)
+                    station_layer(data, BIKE_FIELDS, BIKE_ALIASES).add_to(m1)
                     
                     # User location
                     folium.Marker(
@@ -289,23 +337,7 @@ if bike_method == "Rent":
     else:
         # Default map
         m = folium.Map(location=center, zoom_start=13, tiles='cartodbpositron')
-        for _, row in data.iterrows():
-            marker_color = get_marker_color(row['num_bikes_available'])
-            folium.CircleMarker(
-                location=[row['lat'], row['lon']],
-                radius=3,
-                color=marker_color,
-                fill=True,
-                fill_color=marker_color,
-                fill_opacity=0.7,
-                popup=folium.Popup(
-                    f"<b>Station ID:</b> {row['station_id']}<br>"
-                    f"<b>Total Bikes:</b> {row['num_bikes_available']}<br>"
-                    f"<b>Mechanical:</b> {row['mechanical']}<br>"
-                    f"<b>E-Bike:</b> {row['ebike']}", 
-                    max_width=300
-                )
-            ).add_to(m)
+        station_layer(data, BIKE_FIELDS, BIKE_ALIASES).add_to(m)
         folium_static(m, width=1200)
 
 # Return bike logic
@@ -327,22 +359,7 @@ elif bike_method == "Return":
                     m1 = folium.Map(location=iamhere_return, zoom_start=15, tiles='cartodbpositron')
                     
                     # Add all stations
-                    for _, row in data.iterrows():
-                        marker_color = get_marker_color(row['num_bikes_available'])
-                        folium.CircleMarker(
-                            location=[row['lat'], row['lon']],
-                            radius=3,
-                            color=marker_color,
-                            fill=True,
-                            fill_color=marker_color,
-                            fill_opacity=0.7,
-                            popup=folium.Popup(
-                                f"<b>Station ID:</b> {row['station_id']}<br>"
-                                f"<b>Docks Available:</b> {row['num_docks_available']}<br>"
-                                f"<b>Bikes Available:</b> {row['num_bikes_available']}", 
-                                max_width=300
-                            )
-                        ).add_to(m1)
+                    station_layer(data, DOCK_FIELDS, DOCK_ALIASES).add_to(m1)
                     
                     # User location
                     folium.Marker(
@@ -376,23 +393,7 @@ elif bike_method == "Return":
     else:
         # Default map
         m = folium.Map(location=center, zoom_start=13, tiles='cartodbpositron')
-        for _, row in data.iterrows():
-            marker_color = get_marker_color(row['num_bikes_available'])
-            folium.CircleMarker(
-                location=[row['lat'], row['lon']],
-                radius=3,
-                color=marker_color,
-                fill=True,
-                fill_color=marker_color,
-                fill_opacity=0.7,
-                popup=folium.Popup(
-                    f"<b>Station ID:</b> {row['station_id']}<br>"
-                    f"<b>Total Bikes:</b> {row['num_bikes_available']}<br>"
-                    f"<b>Mechanical:</b> {row['mechanical']}<br>"
-                    f"<b>E-Bike:</b> {row['ebike']}", 
-                    max_width=300
-                )
-            ).add_to(m)
+        station_layer(data, BIKE_FIELDS, BIKE_ALIASES).add_to(m)
         folium_static(m, width=1200)
 
 # Footer
@@ -0,0 +1,306 @@
+"""Several GBFS systems found through gbfs.json auto-discovery, each with its own snapshot."""
+
+import hashlib  # Import hashlib for a stable system -> shard mapping
+import logging  # Import logging to report systems that fail to start
+import multiprocessing.context  # Import the spawn process class the shard workers extend
+import multiprocessing.spawn  # Import spawn to leave the app script out of the workers
+import os  # Import os for the configured discovery URLs
+import threading  # Import threading to guard the shard pools
+from collections import namedtuple  # Import namedtuple for the system description
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor  # Import the worker pools
+from concurrent.futures.process import BrokenProcessPool  # Import the error of a pool whose worker died
+
+import gbfs  # Import the shared GBFS parsing stage
+import metrics  # Import the registry that worker samples are merged into
+import transport  # Import the shared HTTP transport
+from feeds import get_feed_cache  # Import the ttl-aware GBFS feed cache
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated gbfs.json URLs; Toronto Bike Share by default
+DISCOVERY_URLS = [url.strip() for url in os.environ.get(
+    'BIKESHARE_GBFS_URLS', 'https://tor.publicbikesystem.net/ube/gbfs/v1/gbfs.json').split(',') if url.strip()]
+
+# One bike share system as announced by its gbfs.json
+System = namedtuple('System', ['system_id', 'name', 'discovery_url', 'station_status_url', 'station_information_url'])
+
+
+# Define the function to list the feeds of a gbfs.json document
+def feed_urls(document, language='en'):
+    """Return {feed name: url} for GBFS 1.x/2.x (feeds per language) and 3.x (one feed list)"""
+    data = document.get('data', {})
+    if 'feeds' in data:
+        feeds = data['feeds']
+    else:
+        feeds = data.get(language) or next(iter(data.values()), {})  # Fall back to the first language
+        feeds = feeds.get('feeds', [])
+    return {feed['name']: feed['url'] for feed in feeds}
+
+
+# Define the function to describe a system from its auto-discovery URL
+def discover(discovery_url, language='en'):
+    """Fetch gbfs.json (and system_information when listed) and return a System"""
+    urls = feed_urls(transport.get_json(discovery_url), language)
+    missing = {'station_status', 'station_information'} - set(urls)
+    if missing:
+        raise ValueError('{} does not list {}'.format(discovery_url, ', '.join(sorted(missing))))
+    system_id, name = discovery_url, discovery_url
+    if 'system_information' in urls:
+        info = transport.get_json(urls['system_information']).get('data', {})
+        system_id = info.get('system_id', system_id)
+        name = info.get('name', name)
+        if isinstance(name, list):  # GBFS 3.x localized strings
+            name = next((n['text'] for n in name if n.get('language') == language), name[0]['text'] if name else system_id)
+    return System(str(system_id), name, discovery_url, urls['station_status'], urls['station_information'])
+
+
+# Define the function to discover every configured system
+def discover_all(discovery_urls=None, language='en'):
+    """Return the Systems of discovery_urls (DISCOVERY_URLS by default), skipping duplicates
+
+    A URL that cannot be discovered is logged and left out; it is an error only
+    when no system at all could be discovered.
+    """
+    discovery_urls = discovery_urls or DISCOVERY_URLS
+    systems = {}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [(url, pool.submit(discover, url, language)) for url in discovery_urls]
+        for url, future in futures:
+            try:
+                system = future.result()
+            except Exception:
+                logger.exception('Discovery of %s failed; leaving that system out', url)
+                continue
+            systems.setdefault(system.system_id, system)
+    if not systems:
+        raise RuntimeError('No bike share system could be discovered from {}'.format(', '.join(discovery_urls)))
+    return list(systems.values())
+
+
+_last_frames = {}  # Per worker process: url -> frame last returned to the parent
+_feed_pool = None  # Per worker process: downloads a system's two feeds side by side
+
+
+# Define the function that loads one system's feeds inside a worker process
+def load_system_feeds(station_status_url, station_information_url):
+    """Return (status_df, latlon_df); a frame is None when it is the one already returned
+
+    Runs in a shard process, whose own FeedCache keeps each system's validators
+    and ttl, so unchanged feeds are neither downloaded nor pickled again.
+    """
+    global _feed_pool
+    if _feed_pool is None:
+        _feed_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='feed')
+    cache = get_feed_cache()
+    status = _feed_pool.submit(cache.get, station_status_url, gbfs.parse_station_status, decode=gbfs.decode_feed)
+    latlon = _feed_pool.submit(cache.get, station_information_url, gbfs.stations_frame, decode=gbfs.decode_feed)
+    frames = (status.result(), latlon.result())
+    result = []
+    for url, frame in zip((station_status_url, station_information_url), frames):
+        result.append(None if _last_frames.get(url) is frame else frame)
+        _last_frames[url] = frame
+    return tuple(result)
+
+
+# Define the function a shard worker runs for every refresh
+def _load_in_worker(station_status_url, station_information_url):
+    return load_system_feeds(station_status_url, station_information_url), metrics.REGISTRY.take()
+
+
+SHARD_PROCESS_PREFIX = 'feed-shard'  # Names the shard workers for _worker_preparation_data
+_get_preparation_data = multiprocessing.spawn.get_preparation_data
+_spawn_lock = threading.Lock()  # One shard worker launch at a time
+
+
+# Define the function that tells a spawned child how to set itself up
+def _worker_preparation_data(name):
+    """spawn.get_preparation_data without the parent's main module for shard workers
+
+    Streamlit runs the app script as __main__, and a spawned child normally
+    imports __main__ again, re-running the whole app. A shard worker only needs
+    this module, which it imports by name to unpickle its task, so it starts
+    from the bare spawn main instead.
+    """
+    data = _get_preparation_data(name)
+    if name.startswith(SHARD_PROCESS_PREFIX):
+        data.pop('init_main_from_name', None)
+        data.pop('init_main_from_path', None)
+    return data
+
+
+class ShardProcess(multiprocessing.context.SpawnProcess):
+    """Spawned worker process that does not import the parent's __main__
+
+    The spawn Popen classes of CPython (3.8 to 3.13, POSIX and Windows) build
+    the child's preparation data by calling
+    multiprocessing.spawn.get_preparation_data(process name) from start().
+    start() swaps in _worker_preparation_data for just that call and restores
+    the original afterwards. Other processes started meanwhile from other
+    threads keep their main module, because the name check only matches shard
+    workers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = '{}-{}'.format(SHARD_PROCESS_PREFIX, self.name)
+
+    def start(self):
+        with _spawn_lock:
+            original = multiprocessing.spawn.get_preparation_data
+            multiprocessing.spawn.get_preparation_data = _worker_preparation_data
+            try:
+                super().start()
+            finally:
+                multiprocessing.spawn.get_preparation_data = original
+
+
+class ShardContext(multiprocessing.context.SpawnContext):
+    """Spawn context whose processes are ShardProcess; the app process runs threads, so it must not fork"""
+    Process = ShardProcess
+
+
+class ShardedFeedLoader:
+    """Load each system's feeds in one of `shards` single-process pools
+
+    A system always goes to the same shard, so the worker keeps its feed cache
+    warm, and a slow or very large system only holds up the systems sharing its
+    shard. With shards=0 feeds are loaded in the calling thread.
+    """
+
+    def __init__(self, shards=None):
+        self.shards = min(os.cpu_count() or 1, 4) if shards is None else shards
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, shard):
+        with self._lock:
+            pool = self._pools.get(shard)
+            if pool is None:
+                pool = self._pools[shard] = ProcessPoolExecutor(max_workers=1, mp_context=ShardContext())
+            return pool
+
+    def _submit(self, system):
+        shard = self.shard(system)
+        future = self._pool(shard).submit(_load_in_worker, system.station_status_url, system.station_information_url)
+        try:
+            frames, samples = future.result()
+            metrics.REGISTRY.merge(samples)  # Fetch and parse timings recorded in the worker
+            return frames
+        except BrokenProcessPool:
+            with self._lock:
+                self._pools.pop(shard, None)  # Start a new worker on the next refresh
+            raise
+
+    def shard(self, system):
+        digest = hashlib.sha1(system.system_id.encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], 'big') % self.shards
+
+    def fetcher(self, system):
+        """Return a StationPoller fetch() for system that keeps the previous frame objects when unchanged"""
+        previous = [None, None]
+        def fetch():
+            if self.shards == 0:
+                frames = load_system_feeds(system.station_status_url, system.station_information_url)
+            else:
+                frames = self._submit(system)
+            for i, frame in enumerate(frames):
+                if frame is not None or previous[i] is None:
+                    previous[i] = frame
+            return tuple(previous)
+        return fetch
+
+    def shutdown(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.shutdown(wait=False, cancel_futures=True)
+            self._pools.clear()
+
+
+class SystemRegistry:
+    """One StationPoller per system plus lookup of the system that serves a location
+
+    make_poller(system, fetch) returns an unstarted StationPoller for the system.
+    systems and pollers only hold the systems whose first load succeeded. They
+    are replaced, never modified, when a system comes up, so readers need no
+    lock.
+    """
+
+    def __init__(self, systems, make_poller, loader=None, retry_interval=60.0):
+        self.loader = loader or ShardedFeedLoader()
+        self.retry_interval = retry_interval
+        self._configured = list(systems)
+        self._starting = {system.system_id: make_poller(system, self.loader.fetcher(system))
+                          for system in self._configured}
+        self.systems = {}
+        self.pollers = {}
+        self._failed = set()  # Systems whose first load failed at least once
+        self._ready = threading.Condition()
+        self._stop = threading.Event()
+
+    def _publish(self, system_id):
+        with self._ready:
+            ready = set(self.systems) | {system_id}
+            self.systems = {s.system_id: s for s in self._configured if s.system_id in ready}  # Configured order
+            self.pollers = {s: self._starting[s] for s in self.systems}
+            self._ready.notify_all()
+
+    def _start_one(self, system_id):
+        poller = self._starting[system_id]
+        while not self._stop.is_set():
+            try:
+                poller.start()
+            except Exception:
+                logger.exception('First load of system %s failed; retrying in %g s', system_id, self.retry_interval)
+                with self._ready:
+                    self._failed.add(system_id)
+                    self._ready.notify_all()
+                self._stop.wait(self.retry_interval)
+                continue
+            self._publish(system_id)
+            return
+
+    def start(self, timeout=None):
+        """Start every poller in parallel and return as soon as one system is ready
+
+        Slower systems are added to systems/pollers when their first load
+        finishes; a system whose first load fails is logged and retried every
+        retry_interval seconds while the others run. Raises RuntimeError when
+        every system failed its first load (or none is ready after timeout).
+        """
+        for system_id in self._starting:
+            threading.Thread(target=self._start_one, args=(system_id,), name='start-' + system_id, daemon=True).start()
+        with self._ready:
+            self._ready.wait_for(lambda: self.systems or self._failed >= set(self._starting), timeout)
+            ready = bool(self.systems)
+        if not ready:
+            self.stop()  # No retries in the background of a registry nobody uses
+            raise RuntimeError('No bike share system could be loaded: {}'.format(', '.join(self._starting)))
+        return self
+
+    def snapshot(self, system_id):
+        return self.pollers[system_id].snapshot()
+
+    def system_for(self, lat, lon):
+        """Return the system whose closest station is nearest to (lat, lon)"""
+        best, best_km = None, None
+        for system_id, poller in self.pollers.items():
+            snapshot = poller.snapshot()
+            if snapshot is None or snapshot.index is None or len(snapshot.index) == 0:
+                continue
+            _, km = snapshot.index.nearest(lat, lon, k=1)
+            if len(km) and (best_km is None or km[0] < best_km):
+                best, best_km = self.systems[system_id], km[0]
+        return best
+
+    def stop(self):
+        self._stop.set()
+        for poller in self._starting.values():
+            poller.stop()
+        self.loader.shutdown()
+
+
+# Define the function to get the center of a system's stations
+def system_center(snapshot):
+    """Median station location of a snapshot, used to center that system's map"""
+    data = snapshot.data
+    return [float(data['lat'].median()), float(data['lon'].median())]
@@ -0,0 +1,31 @@
+import os  # Import os to point the app at the stand-in services
+import socket  # Import socket to find a free port
+import sys  # Import sys to make the app modules importable
+import tempfile  # Import tempfile for throwaway caches
+
+import pytest  # Import pytest for fixtures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    STAND_IN_PORT = s.getsockname()[1]
+STAND_IN_URL = 'http://127.0.0.1:{}'.format(STAND_IN_PORT)
+
+# Read by the app modules when they are first imported, so set before any test imports them
+os.environ.update({
+    'BIKESHARE_GBFS_URLS': STAND_IN_URL + '/gbfs/gbfs.json',
+    'BIKESHARE_NOMINATIM_URL': STAND_IN_URL,
+    'BIKESHARE_OSRM_URL': STAND_IN_URL,
+    'BIKESHARE_CACHE_DIR': tempfile.mkdtemp(prefix='bikeshare-test-'),
+})
+
+
+@pytest.fixture(scope='session')
+def stand_in_server():
+    """The stand-in the app is configured for, with slow routing"""
+    import stand_in
+    server = stand_in.StandInServer(STAND_IN_PORT, stations=500, latency_ms={'osrm': 1000}).start()
+    yield server
+    server.close()
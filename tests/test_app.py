@@ -0,0 +1,55 @@
+import os  # Import os to locate the app script
+from concurrent.futures import Future  # Import Future for a route that is still pending
+
+import streamlit as st  # Import Streamlit to stand in for older versions
+from streamlit.testing.v1 import AppTest  # Import AppTest to run the app headless
+
+import helpers  # Import the helpers the app uses
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bikeshare_app.py')
+
+
+# Define the function to read the travel time shown by the app
+def travel_time(app):
+    return next(metric.value for metric in app.metric if 'Travel Time' in metric.label)
+
+
+def test_search_shows_an_estimate_until_the_route_arrives(stand_in_server):
+    app = AppTest.from_file(APP, default_timeout=60)
+    app.run()
+    next(w for w in app.sidebar.text_input if w.label == 'Street').input('10 Queen St W')
+    next(w for w in app.sidebar.button if w.label == 'Find me a bike!').click()
+    app.run()  # The route takes a second at the stand-in; the search must not wait for it
+    assert not app.exception
+    assert travel_time(app).startswith('~')
+
+    for future, _ in list(helpers._route_jobs.values()):
+        future.result(timeout=30)
+    app.session_state['routed_rent'] = True  # What the polling fragment sets before it reruns the app
+    app.run()
+    assert not app.exception
+    assert not travel_time(app).startswith('~')
+
+
+def test_rerun_when_routed_falls_back_to_experimental_fragment(monkeypatch):
+    calls = []
+    def experimental_fragment(run_every=None):
+        calls.append(run_every)
+        return lambda function: function
+    monkeypatch.delattr(st, 'fragment', raising=False)  # Streamlit 1.33-1.36
+    monkeypatch.setattr(st, 'experimental_fragment', experimental_fragment, raising=False)
+    helpers.rerun_when_routed(Future(), 'routed_rent', interval=0.5)  # Not done: polls without rerunning
+    assert calls == [0.5]
+
+
+def test_search_without_a_free_dock_shows_a_message(stand_in_server, monkeypatch):
+    monkeypatch.setattr(helpers, 'get_dock_availability', lambda *args, **kwargs: None)  # Every station is full
+    app = AppTest.from_file(APP, default_timeout=60)
+    app.run()
+    next(w for w in app.sidebar.selectbox if w.label.startswith('Are you looking')).select('Return')
+    app.run()
+    next(w for w in app.sidebar.text_input if w.label == 'Street').input('10 Queen St W')
+    next(w for w in app.sidebar.button if w.label == 'Find me a dock!').click()
+    app.run()
+    assert not app.exception
+    assert any('No station with a free dock' in subheader.value for subheader in app.subheader)
@@ -0,0 +1,120 @@
+import json  # Import json to build feed bytes
+
+import pytest  # Import pytest for fixtures
+import requests  # Import requests for the HTTP error type
+
+import feeds  # Import the module under test
+import transport  # Import the transport the cache downloads through
+
+
+class FakeResponse:
+    """Just enough of requests.Response for FeedCache"""
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class FakeServer:
+    """One feed with an ETag that answers 304 to a matching If-None-Match"""
+
+    def __init__(self, last_updated, ttl):
+        self.document = {'last_updated': last_updated, 'ttl': ttl, 'data': {'stations': [{'station_id': '1'}]}}
+        self.etag = '"v1"'
+        self.requests = []  # Request headers, one per download
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        if (headers or {}).get('If-None-Match') == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, json.dumps(self.document).encode(), {'ETag': self.etag, 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1700000000.0]
+    monkeypatch.setattr(feeds.time, 'time', lambda: now[0])
+    return now
+
+
+# Define the function to parse a document into something comparable
+def parse(document):
+    return [station['station_id'] for station in document['data']['stations']]
+
+
+def test_feed_is_served_from_memory_until_its_ttl(monkeypatch, clock):
+    server = FakeServer(last_updated=clock[0], ttl=60)
+    monkeypatch.setattr(transport, 'get', server.get)
+    cache = feeds.FeedCache()
+    assert cache.get('http://feed', parse) == ['1']
+    clock[0] += 59
+    assert cache.get('http://feed', parse) == ['1']
+    assert len(server.requests) == 1
+    clock[0] += 2
+    cache.get('http://feed', parse)
+    assert len(server.requests) == 2
+
+
+def test_expired_feed_is_revalidated_and_304_keeps_the_frame(monkeypatch, clock):
+    server = FakeServer(last_updated=clock[0], ttl=10)
+    monkeypatch.setattr(transport, 'get', server.get)
+    cache = feeds.FeedCache()
+    frame = cache.get('http://feed', parse)
+    assert server.requests[0] == {}  # Nothing to revalidate yet
+    clock[0] += 11
+    assert cache.get('http://feed', parse) is frame
+    assert server.requests[-1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+    requests_before = len(server.requests)
+    clock[0] += 5
+    assert cache.get('http://feed', parse) is frame  # The 304 restarted the ttl
+    assert len(server.requests) == requests_before
+
+
+def test_changed_feed_is_downloaded_again(monkeypatch, clock):
+    server = FakeServer(last_updated=clock[0], ttl=10)
+    monkeypatch.setattr(transport, 'get', server.get)
+    cache = feeds.FeedCache()
+    cache.get('http://feed', parse)
+    server.etag = '"v2"'
+    server.document['data']['stations'].append({'station_id': '2'})
+    clock[0] += 11
+    assert cache.get('http://feed', parse) == ['1', '2']
+
+
+def test_ttl_zero_and_stale_last_updated_use_the_floor(monkeypatch, clock):
+    server = FakeServer(last_updated=clock[0] - 3600, ttl=0)  # Feed clock far behind ours
+    monkeypatch.setattr(transport, 'get', server.get)
+    cache = feeds.FeedCache(min_ttl=5)
+    cache.get('http://feed', parse)
+    clock[0] += 4
+    cache.get('http://feed', parse)
+    assert len(server.requests) == 1
+    clock[0] += 2
+    cache.get('http://feed', parse)
+    assert len(server.requests) == 2
+
+
+def test_cache_keeps_at_most_max_entries(monkeypatch, clock):
+    server = FakeServer(last_updated=clock[0], ttl=60)
+    monkeypatch.setattr(transport, 'get', server.get)
+    cache = feeds.FeedCache(max_entries=2)
+    for url in ('http://a', 'http://b', 'http://c'):
+        cache.get(url, parse)
+    assert [url for url, _ in cache._entries] == ['http://b', 'http://c']
+    cache.get('http://a', parse)  # Evicted, so downloaded again
+    assert len(server.requests) == 4
+
+
+def test_errors_are_raised_and_not_cached(monkeypatch, clock):
+    monkeypatch.setattr(transport, 'get', lambda url, **kwargs: FakeResponse(503))
+    cache = feeds.FeedCache()
+    with pytest.raises(requests.HTTPError):
+        cache.get('http://feed', parse)
+    server = FakeServer(last_updated=clock[0], ttl=60)
+    monkeypatch.setattr(transport, 'get', server.get)
+    assert cache.get('http://feed', parse) == ['1']
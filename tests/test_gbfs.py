@@ -0,0 +1,38 @@
+import json  # Import json to build feed bytes
+
+import pyarrow as pa  # Import pyarrow to check the decoded type
+
+import gbfs  # Import the module under test
+
+
+# Define the function to build a station_status document with n stations
+def status_feed(n):
+    stations = [{
+        'station_id': str(i),
+        'num_bikes_available': i % 7,
+        'num_bikes_available_types': {'mechanical': i % 5, 'ebike': i % 7 - i % 5 if i % 7 > i % 5 else 0},
+        'num_docks_available': i % 11,
+        'is_installed': 1,
+        'is_renting': 1,
+        'is_returning': 1,
+        'last_reported': 1700000000 + i,
+        'is_charging_station': False,
+        'status': 'IN_SERVICE',
+    } for i in range(n)]
+    return json.dumps({'last_updated': 1700000000, 'ttl': 10, 'data': {'stations': stations}}).encode('utf-8')
+
+
+def test_decode_feed_uses_arrow_for_feeds_over_one_megabyte():
+    content = status_feed(10000)
+    assert len(content) > 1 << 20
+    document = gbfs.decode_feed(content)
+    assert isinstance(document['data']['stations'], pa.Table)
+    assert document['data']['stations'].num_rows == 10000
+    assert document['ttl'] == 10
+
+
+def test_parse_station_status_from_large_arrow_feed():
+    frame = gbfs.parse_station_status(gbfs.decode_feed(status_feed(10000))).set_index('station_id')
+    assert len(frame) == 10000
+    assert frame.loc['1234', 'mechanical'] == 1234 % 5
+    assert frame.loc['1234', 'num_docks_available'] == 1234 % 11
@@ -0,0 +1,59 @@
+import numpy as np  # Import numpy for random stations and the brute-force search
+
+from geo import StationIndex, haversine_km  # Import the module under test
+
+CENTER = (40.7128, -74.0060)
+
+
+# Define the function to build an index over n random stations around CENTER
+def random_index(n, seed=0, spread=0.05):
+    rng = np.random.default_rng(seed)
+    lats = CENTER[0] + rng.uniform(-spread, spread, n)
+    lons = CENTER[1] + rng.uniform(-spread, spread, n)
+    return StationIndex(np.arange(n).astype(str), lats, lons)
+
+
+# Define the function to get the k closest stations by scanning every one
+def brute_force(index, lat, lon, k, predicate=None):
+    distances = haversine_km(lat, lon, index.lats, index.lons)
+    if predicate is not None:
+        distances = np.where(predicate, distances, np.inf)
+    best = np.argsort(distances, kind='stable')[:k]
+    return distances[best[np.isfinite(distances[best])]]
+
+
+def test_nearest_matches_brute_force():
+    index = random_index(2000)
+    rng = np.random.default_rng(1)
+    for lat, lon in rng.uniform(-0.08, 0.08, (200, 2)) + CENTER:  # Some queries fall outside the stations
+        positions, distances = index.nearest(lat, lon, k=5)
+        np.testing.assert_allclose(distances, brute_force(index, lat, lon, 5))
+        np.testing.assert_allclose(distances, haversine_km(lat, lon, index.lats[positions], index.lons[positions]))
+
+
+def test_nearest_with_mask_matches_brute_force():
+    index = random_index(2000, seed=2)
+    rng = np.random.default_rng(3)
+    status_ids = rng.permutation(np.arange(2100).astype(str))  # Status order differs; 100 ids have no location
+    values = rng.random(len(status_ids)) < 0.02  # Sparse matches exercise the fallback scan
+    positions = index.positions(status_ids)
+    predicate = index.mask(status_ids, values, positions)
+    np.testing.assert_array_equal(predicate, index.mask(status_ids, values))
+    expected = np.zeros(len(index), dtype=bool)
+    for station_id, value in zip(status_ids, values):
+        if int(station_id) < len(index):
+            expected[int(station_id)] = value
+    np.testing.assert_array_equal(predicate, expected)
+    for lat, lon in rng.uniform(-0.05, 0.05, (100, 2)) + CENTER:
+        found, distances = index.nearest(lat, lon, k=3, predicate=predicate)
+        assert predicate[found].all()
+        np.testing.assert_allclose(distances, brute_force(index, lat, lon, 3, predicate))
+
+
+def test_within_matches_brute_force():
+    index = random_index(1000, seed=4)
+    lat, lon = CENTER
+    positions, distances = index.within(lat, lon, 800)
+    everything = haversine_km(lat, lon, index.lats, index.lons)
+    assert set(positions) == set(np.flatnonzero(everything * 1000 <= 800))
+    assert np.all(np.diff(distances) >= 0)
@@ -0,0 +1,72 @@
+import datetime as dt  # Import datetime for feed times
+import os  # Import os to look at the partition folders
+
+import pandas as pd  # Import pandas to build the snapshots
+
+from history import COMPACTED_NAME, HistoryWriter, read_history  # Import the module under test
+
+HOUR = dt.datetime(2024, 5, 1, 8, tzinfo=dt.timezone.utc)
+
+
+# Define the function to build a station status snapshot at a feed time
+def status_frame(when, bikes):
+    frame = pd.DataFrame({
+        'station_id': [str(i) for i in range(len(bikes))],
+        'num_bikes_available': bikes,
+        'num_bikes_available_types': [{'ebike': 0}] * len(bikes),  # Nested, not stored
+    })
+    frame.index = pd.DatetimeIndex([pd.Timestamp(when)] * len(bikes), name='time')
+    return frame
+
+
+# Define the function to list the files of one partition
+def partition_files(root, when):
+    folder = os.path.join(root, 'date={:%Y-%m-%d}'.format(when), 'hour={:%H}'.format(when))
+    return sorted(os.listdir(folder))
+
+
+def test_append_writes_one_part_per_snapshot_into_its_hour(tmp_path):
+    writer = HistoryWriter(str(tmp_path))
+    writer.append(status_frame(HOUR, [1, 2, 3]))
+    writer.append(status_frame(HOUR + dt.timedelta(minutes=1), [4, 5, 6]))
+    writer.append(status_frame(HOUR + dt.timedelta(hours=1), [7, 8, 9]))
+    assert len(partition_files(str(tmp_path), HOUR)) == 2
+    assert len(partition_files(str(tmp_path), HOUR + dt.timedelta(hours=1))) == 1
+    history = read_history(str(tmp_path))
+    assert len(history) == 9
+    assert 'num_bikes_available_types' not in history.columns
+    assert writer.append(status_frame(HOUR, [])) is None
+
+
+def test_compact_merges_closed_hours_only(tmp_path):
+    writer = HistoryWriter(str(tmp_path))
+    for minute in range(3):
+        writer.append(status_frame(HOUR + dt.timedelta(minutes=minute), [minute] * 4))
+    writer.append(status_frame(HOUR + dt.timedelta(hours=1), [9] * 4))
+    before = read_history(str(tmp_path)).sort_values(['station_id', 'time']).reset_index(drop=True)
+    assert writer.compact(now=HOUR + dt.timedelta(hours=1, minutes=5)) == 1  # The current hour stays open
+    assert partition_files(str(tmp_path), HOUR) == [COMPACTED_NAME]
+    assert len(partition_files(str(tmp_path), HOUR + dt.timedelta(hours=1))) == 1
+    after = read_history(str(tmp_path)).sort_values(['station_id', 'time']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(after[before.columns], before)
+    writer.append(status_frame(HOUR + dt.timedelta(minutes=30), [5] * 4))  # A late part for a compacted hour
+    assert writer.compact(now=HOUR + dt.timedelta(hours=2)) == 2
+    assert partition_files(str(tmp_path), HOUR) == [COMPACTED_NAME]
+    assert len(read_history(str(tmp_path))) == 20
+
+
+def test_read_history_filters_stations_and_time_range(tmp_path):
+    writer = HistoryWriter(str(tmp_path))
+    for hours in range(0, 48, 6):
+        writer.append(status_frame(HOUR + dt.timedelta(hours=hours), [hours] * 5))
+    writer.compact(now=HOUR + dt.timedelta(days=3))
+    history = read_history(str(tmp_path), station_ids=['1', 3],
+                           start=HOUR + dt.timedelta(hours=6), end=HOUR + dt.timedelta(hours=30))
+    assert sorted(history['station_id'].unique()) == ['1', '3']
+    assert sorted(history['num_bikes_available'].unique()) == [6, 12, 18, 24]  # end is exclusive
+    naive = read_history(str(tmp_path), start=(HOUR + dt.timedelta(hours=42)).replace(tzinfo=None))
+    assert list(naive['num_bikes_available'].unique()) == [42]
+
+
+def test_read_history_of_a_missing_folder_is_empty(tmp_path):
+    assert len(read_history(str(tmp_path / 'missing'))) == 0
@@ -0,0 +1,21 @@
+import sys  # Import sys to replace the __main__ an earlier AppTest left behind
+import types  # Import types for a bare main module
+
+import loadgen  # Import the module under test
+
+
+def test_sessions_run_in_their_own_processes(stand_in_server, monkeypatch):
+    monkeypatch.setitem(sys.modules, '__main__', types.ModuleType('__main__'))  # Or the children would run the app script
+    sessions, wall = loadgen.run_sessions(2, searches=1, timeout=60)
+    assert sorted(sessions) == [0, 1]
+    for timings, errors in sessions.values():
+        assert errors == []
+        assert [kind for kind, _ in timings] == ['load', 'search']
+    assert wall > 0
+    assert loadgen.report(sessions, wall) == 0.0
+
+
+def test_report_returns_the_share_of_failed_sessions(capsys):
+    sessions = {0: ([('load', 0.5)], []), 1: ([], ['session process exited with -9'])}
+    assert loadgen.report(sessions, 1.0) == 0.5
+    assert '1 failed sessions (50%)' in capsys.readouterr().out
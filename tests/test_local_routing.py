@@ -0,0 +1,109 @@
+import heapq  # Import heapq for the reference Dijkstra
+
+import numpy as np  # Import numpy to build the graphs
+import pytest  # Import pytest for approx and parametrize
+
+from local_routing import ContractionHierarchy, largest_component  # Import the module under test
+
+CENTER = (43.65, -79.38)
+
+
+# Define the function to build a random road graph
+def random_graph(seed, n=80, oneway=0.2):
+    """Return (lat, lon, src, dst, seconds): each node joined to a few nearby nodes, some streets one-way"""
+    rng = np.random.default_rng(seed)
+    lat = CENTER[0] + rng.uniform(0, 0.02, n)
+    lon = CENTER[1] + rng.uniform(0, 0.02, n)
+    src, dst, seconds = [], [], []
+    for a in range(n):
+        nearest = np.argsort(np.hypot(lat - lat[a], lon - lon[a]))[1:4]
+        for b in rng.choice(nearest, size=rng.integers(1, 4), replace=False).tolist():
+            cost = float(rng.uniform(10, 120))
+            src.append(a); dst.append(b); seconds.append(cost)
+            if rng.random() > oneway:
+                src.append(b); dst.append(a); seconds.append(cost * rng.uniform(1.0, 1.5))
+    return lat, lon, np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64), np.array(seconds)
+
+
+# Define the function to find every shortest time from one node on the plain graph
+def dijkstra(n, src, dst, seconds, source):
+    adjacency = [[] for _ in range(n)]
+    for a, b, w in zip(src.tolist(), dst.tolist(), seconds.tolist()):
+        adjacency[a].append((b, w))
+    dist = [float('inf')] * n
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for v, w in adjacency[u]:
+            if d + w < dist[v]:
+                dist[v] = d + w
+                heapq.heappush(heap, (d + w, v))
+    return dist
+
+
+# Define the function to get the cheapest original edge between two nodes
+def edge_seconds(src, dst, seconds, a, b):
+    return min(w for x, y, w in zip(src.tolist(), dst.tolist(), seconds.tolist()) if x == a and y == b)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_routes_match_plain_dijkstra(seed):
+    lat, lon, src, dst, seconds = random_graph(seed)
+    n = len(lat)
+    ch = ContractionHierarchy.build(lat, lon, src, dst, seconds, snap_speed=1.4)
+    for s in range(0, n, 7):
+        expected = dijkstra(n, src, dst, seconds, s)
+        for t in range(n):
+            found = ch._search(s, t)
+            if expected[t] == float('inf'):
+                assert found is None
+                continue
+            assert found is not None and found[0] == pytest.approx(expected[t])
+            nodes = ch._unpack(found[1]) or [s]
+            assert nodes[0] == s and nodes[-1] == t
+            assert sum(edge_seconds(src, dst, seconds, a, b) for a, b in zip(nodes, nodes[1:])) == pytest.approx(expected[t])
+
+
+def test_route_and_table_snap_to_nodes_and_agree():
+    lat, lon, src, dst, seconds = random_graph(7, oneway=0.0)
+    ch = ContractionHierarchy.build(lat, lon, src, dst, seconds, snap_speed=1.4)
+    nodes = np.flatnonzero(ch.routable)
+    s = int(nodes[0])
+    expected = dijkstra(len(lat), src, dst, seconds, s)
+    origin = (lat[s], lon[s])
+    destinations = [(lat[t], lon[t]) for t in nodes[1:10]]
+    durations = ch.table(origin, destinations)
+    for t, destination, duration in zip(nodes[1:10], destinations, durations):
+        coordinates, route_seconds = ch.route(origin, destination)
+        assert route_seconds == pytest.approx(expected[t]) == pytest.approx(duration)
+        assert coordinates[0] == [float(lat[s]), float(lon[s])] and coordinates[-1] == list(map(float, destination))
+
+
+def test_unreachable_pairs_and_separate_components():
+    lat = np.array([CENTER[0], CENTER[0] + 0.001, CENTER[0] + 0.002, CENTER[0] + 0.5, CENTER[0] + 0.501])
+    lon = np.full(5, CENTER[1])
+    src = np.array([0, 1, 1, 3], dtype=np.int64)  # 0 <-> 1 -> 2 (a one-way dead end); 3 -> 4 apart
+    dst = np.array([1, 0, 2, 4], dtype=np.int64)
+    seconds = np.array([60.0, 60.0, 30.0, 10.0])
+    assert list(largest_component(5, src, dst)) == [True, True, True, False, False]
+    ch = ContractionHierarchy.build(lat, lon, src, dst, seconds, snap_speed=1.4)
+    assert ch._search(0, 2)[0] == pytest.approx(90.0)
+    assert ch._search(2, 0) is None
+    assert ch.route((lat[2], lon[2]), (lat[0], lon[0])) is None
+    assert ch.table((lat[2], lon[2]), [(lat[1], lon[1]), (lat[2], lon[2])]) == [None, 0.0]
+    assert ch.snap((lat[4], lon[4]))[0] == 2  # The other component is never snapped to
+
+
+def test_save_and_load_round_trip(tmp_path):
+    lat, lon, src, dst, seconds = random_graph(3)
+    ch = ContractionHierarchy.build(lat, lon, src, dst, seconds, snap_speed=4.2)
+    path = str(tmp_path / 'graphs' / 'cycling.npz')
+    ch.save(path)
+    loaded = ContractionHierarchy.load(path)
+    assert loaded.snap_speed == 4.2
+    assert (loaded.routable == ch.routable).all() and (loaded.rank == ch.rank).all()
+    for s, t in [(0, 5), (3, 40), (12, 79), (60, 1)]:
+        assert loaded._search(s, t) == ch._search(s, t)
@@ -0,0 +1,78 @@
+import json  # Import json to read the patch back out of the page
+
+import pandas as pd  # Import pandas to build the feeds
+
+from geo import StationIndex  # Import the spatial index the poller builds
+from maps import PatchedBaseMap, render_base_map  # Import the module under test
+from snapshot import StationPoller  # Import the poller that produces the change sets
+
+
+class Feeds:
+    """Status and information frames for StationPoller, changed by the test"""
+
+    def __init__(self, n):
+        self.latlon = pd.DataFrame({
+            'station_id': [str(i) for i in range(n)],
+            'lat': [43.65 + 0.001 * i for i in range(n)],
+            'lon': [-79.38 - 0.001 * i for i in range(n)],
+        })
+        self.status = self.status_frame([5] * n)
+
+    @staticmethod
+    def status_frame(bikes):
+        return pd.DataFrame({
+            'station_id': [str(i) for i in range(len(bikes))],
+            'num_bikes_available': bikes,
+            'mechanical': bikes,
+            'ebike': [0] * len(bikes),
+            'num_docks_available': [10 - b for b in bikes],
+            'last_reported': [1700000000] * len(bikes),
+        })
+
+    def poller(self):
+        return StationPoller(lambda: (self.status, self.latlon),
+                             lambda status, latlon: status.merge(latlon, how='left', on='station_id'),
+                             StationIndex.from_frame)
+
+
+# Define the function to get the patch a page applies, or None for a base page
+def page_patch(html):
+    start = html.find('var p = ')
+    if start < 0:
+        return None
+    return json.JSONDecoder().raw_decode(html, start + len('var p = '))[0]
+
+
+def test_changed_stations_are_patched_onto_the_base_page():
+    feeds = Feeds(20)
+    poller = feeds.poller()
+    renders = []
+    base_map = PatchedBaseMap(render=lambda data, center: renders.append(len(data)) or render_base_map(data, center))
+    base, _ = base_map.page(poller.refresh())
+    assert page_patch(base) is None
+    feeds.status = feeds.status_frame([5] * 3 + [0] + [5] * 16)
+    html, _ = base_map.page(poller.refresh())
+    assert html.startswith(base[:base.rfind('</script>')])  # The base page, plus the patch
+    assert page_patch(html)['row'] == [3] and page_patch(html)['c'] == [2]
+    feeds.status = feeds.status_frame([5] * 3 + [0] + [2] + [5] * 15)
+    snapshot = poller.refresh()
+    html, _ = base_map.page(snapshot)
+    assert page_patch(html)['row'] == [3, 4]  # Every change since the base page
+    assert base_map.page(snapshot)[0] is html
+    assert renders == [20]
+
+
+def test_base_page_is_rendered_again_when_stations_change_or_the_patch_grows():
+    feeds = Feeds(20)
+    poller = feeds.poller()
+    renders = []
+    base_map = PatchedBaseMap(max_patch=0.25, render=lambda data, center: renders.append(len(data)) or render_base_map(data, center))
+    base_map.page(poller.refresh())
+    feeds.status = feeds.status_frame([5] * 21)  # A new station
+    feeds.latlon = pd.concat([feeds.latlon, pd.DataFrame({'station_id': ['20'], 'lat': [43.6], 'lon': [-79.4]})],
+                             ignore_index=True)
+    html, _ = base_map.page(poller.refresh())
+    assert page_patch(html) is None and renders == [20, 21]
+    feeds.status = feeds.status_frame([0] * 6 + [5] * 15)  # More than a quarter of the stations
+    html, _ = base_map.page(poller.refresh())
+    assert page_patch(html) is None and renders == [20, 21, 21]
@@ -0,0 +1,66 @@
+import pandas as pd  # Import pandas for the station_information frame
+
+from routing import OSRM_URL, RouteCache, cell_center, decode_polyline, encode_polyline, osrm_url, snap_origin  # Import the module under test
+
+ORIGIN = cell_center(*snap_origin([43.6510, -79.3800]))  # Middle of its cell, so nearby points share it
+STATION = ['7001', 43.6555, -79.3830]
+ROUTE = [[43.6510, -79.3800], [43.6530, -79.3815], [43.6555, -79.3830]]
+
+
+def test_polyline_round_trip():
+    assert decode_polyline(encode_polyline(ROUTE)) == ROUTE
+
+
+def test_osrm_url_per_profile(monkeypatch):
+    monkeypatch.setenv('BIKESHARE_OSRM_URL_FOOT', 'http://walk.example:5000/')
+    assert osrm_url('foot') == 'http://walk.example:5000'
+    assert osrm_url('cycling') == osrm_url('driving') == OSRM_URL
+
+
+def test_snap_origin_shares_a_cell_within_a_few_meters():
+    assert snap_origin(ORIGIN) == snap_origin([ORIGIN[0] + 0.00002, ORIGIN[1]])  # ~2 m away
+    assert snap_origin(ORIGIN) != snap_origin([ORIGIN[0] + 0.001, ORIGIN[1]])  # ~110 m away
+    assert snap_origin(cell_center(*snap_origin(ORIGIN))) == snap_origin(ORIGIN)
+
+
+def test_route_cache_hit_miss_and_profile(tmp_path):
+    cache = RouteCache(str(tmp_path / 'routes.sqlite'))
+    assert cache.get(ORIGIN, STATION, 'foot') is None
+    cache.set(ORIGIN, STATION, 'foot', ROUTE, 420.0)
+    assert cache.get([ORIGIN[0] + 0.00002, ORIGIN[1]], STATION, 'foot') == (ROUTE, 420.0)  # Same snapped cell
+    assert cache.get(ORIGIN, STATION, 'driving') is None
+
+
+def test_route_cache_persists_and_survives_memory_eviction(tmp_path):
+    path = str(tmp_path / 'routes.sqlite')
+    cache = RouteCache(path, max_entries=1)
+    cache.set(ORIGIN, STATION, 'foot', ROUTE, 420.0)
+    cache.set(ORIGIN, ['7002', 43.66, -79.39], 'foot', ROUTE, 500.0)  # Evicts the first route from memory
+    assert len(cache._memory) == 1
+    assert cache.get(ORIGIN, STATION, 'foot') == (ROUTE, 420.0)  # Read back from SQLite
+    assert RouteCache(path).get(ORIGIN, STATION, 'foot') == (ROUTE, 420.0)  # And by a new process
+
+
+def test_route_cache_misses_and_invalidates_moved_stations(tmp_path):
+    path = str(tmp_path / 'routes.sqlite')
+    cache = RouteCache(path)
+    cache.set(ORIGIN, STATION, 'foot', ROUTE, 420.0)
+    cache.set(ORIGIN, ['7002', 43.66, -79.39], 'foot', ROUTE, 500.0)
+    moved = [STATION[0], STATION[1] + 0.001, STATION[2]]
+    assert cache.get(ORIGIN, moved, 'foot') is None
+    latlon = pd.DataFrame({'station_id': ['7001', '7002'], 'lat': [moved[1], 43.66], 'lon': [moved[2], -79.39]})
+    assert cache.invalidate_moved(latlon) == 1
+    assert cache.get(ORIGIN, STATION, 'foot') is None
+    assert RouteCache(path).get(ORIGIN, STATION, 'foot') is None  # Deleted on disk too
+    assert cache.get(ORIGIN, ['7002', 43.66, -79.39], 'foot') == (ROUTE, 500.0)
+
+
+def test_route_cache_samples_oldest_first(tmp_path):
+    cache = RouteCache(str(tmp_path / 'routes.sqlite'))
+    cache.set(ORIGIN, STATION, 'foot', ROUTE, 420.0)
+    cache.set(ORIGIN, ['7002', 43.66, -79.39], 'driving', ROUTE, 120.0)
+    samples = cache.samples()
+    assert [(profile, duration) for _, _, profile, duration in samples] == [('foot', 420.0), ('driving', 120.0)]
+    origin, destination, _, _ = samples[0]
+    assert snap_origin(origin) == snap_origin(ORIGIN)
+    assert destination == [STATION[1], STATION[2]]
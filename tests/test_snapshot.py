@@ -0,0 +1,115 @@
+import numpy as np  # Import numpy to check shared column buffers
+import pandas as pd  # Import pandas to build the feeds
+
+from geo import StationIndex  # Import the spatial index the poller builds
+from snapshot import StationPoller, diff_status, same_frame, update_rows  # Import the module under test
+
+
+# Define the function to build a station_status frame
+def status_frame(bikes, reported=1700000000):
+    n = len(bikes)
+    return pd.DataFrame({
+        'station_id': [str(i) for i in range(n)],
+        'num_bikes_available': bikes,
+        'ebike': [b // 2 for b in bikes],
+        'num_docks_available': [10 - b for b in bikes],
+        'last_reported': [reported] * n,
+    })
+
+
+# Define the function to build a station_information frame
+def latlon_frame(n, shift=0.0):
+    return pd.DataFrame({
+        'station_id': [str(i) for i in range(n)],
+        'name': ['Station {}'.format(i) for i in range(n)],
+        'lat': [43.65 + 0.001 * i + shift for i in range(n)],
+        'lon': [-79.38 - 0.001 * i for i in range(n)],
+    })
+
+
+# Define the function to join the two frames the way the app does
+def join(status, latlon):
+    return status.merge(latlon, how='left', on='station_id')
+
+
+def test_diff_status_reports_changed_added_and_removed():
+    previous = status_frame([1, 2, 3, 4])
+    current = status_frame([1, 5, 3, 4, 6]).drop(index=3)  # Station 3 gone, station 4 new
+    current.loc[current['station_id'] == '2', 'last_reported'] += 60  # Reported again, same counts
+    changes = diff_status(previous, current)
+    assert sorted(changes.changed) == ['1', '2']
+    assert changes.added == ['4']
+    assert changes.removed == ['3']
+
+
+def test_diff_status_of_identical_frames_is_empty():
+    changes = diff_status(status_frame([1, 2, 3]), status_frame([1, 2, 3]))
+    assert (changes.changed, changes.added, changes.removed) == ([], [], [])
+
+
+def test_update_rows_patches_changed_stations_without_touching_the_shared_frame():
+    latlon = latlon_frame(4)
+    previous = join(status_frame([1, 2, 3, 4]), latlon)
+    before = previous.copy(deep=True)
+    status = status_frame([1, 7, 3, 4]).iloc[::-1].reset_index(drop=True)  # Another row order
+    data = update_rows(previous, status, ['1'])
+    pd.testing.assert_frame_equal(previous, before)  # Shared by every session, never modified
+    pd.testing.assert_frame_equal(data, join(status_frame([1, 7, 3, 4]), latlon))
+    assert np.shares_memory(data['lat'].to_numpy(), previous['lat'].to_numpy())  # Unchanged columns are shared
+    assert np.shares_memory(data['last_reported'].to_numpy(), previous['last_reported'].to_numpy())
+    assert not np.shares_memory(data['num_bikes_available'].to_numpy(), previous['num_bikes_available'].to_numpy())
+
+
+def test_same_frame_compares_content():
+    latlon = latlon_frame(3)
+    assert same_frame(latlon, latlon.copy(deep=True))
+    renamed = latlon.assign(name=['A', 'B', 'C'])
+    assert not same_frame(latlon, renamed)
+    assert same_frame(latlon, renamed, ['station_id', 'lat', 'lon'])
+    assert not same_frame(latlon, latlon_frame(3, shift=0.001), ['station_id', 'lat', 'lon'])
+    assert not same_frame(latlon, latlon_frame(4))
+
+
+class Feeds:
+    """fetch() for StationPoller returning whatever frames the test set last"""
+
+    def __init__(self, status, latlon):
+        self.status, self.latlon = status, latlon
+        self.indexes = 0
+
+    def fetch(self):
+        return self.status, self.latlon
+
+    def build_index(self, latlon):
+        self.indexes += 1
+        return StationIndex.from_frame(latlon)
+
+
+def test_redownloaded_station_information_keeps_the_patch_path():
+    feeds = Feeds(status_frame([1, 2, 3]), latlon_frame(3))
+    poller = StationPoller(feeds.fetch, join, feeds.build_index)
+    first = poller.refresh()
+    feeds.latlon = latlon_frame(3)  # Same content, new object
+    assert poller.refresh() is first  # Nothing changed at all
+    feeds.status = status_frame([1, 0, 3])
+    second = poller.refresh()
+    assert feeds.indexes == 1
+    assert second.latlon is first.latlon and second.index is first.index
+    assert second.index_positions is first.index_positions  # Patched, not joined again
+    assert second.changes.changed == ['1']
+    assert second.changes.deltas['bikes'] == -2
+    assert np.shares_memory(second.data['lat'].to_numpy(), first.data['lat'].to_numpy())
+
+
+def test_moved_station_rebuilds_the_index_and_renamed_station_does_not():
+    feeds = Feeds(status_frame([1, 2, 3]), latlon_frame(3))
+    poller = StationPoller(feeds.fetch, join, feeds.build_index)
+    first = poller.refresh()
+    feeds.latlon = latlon_frame(3).assign(name=['A', 'B', 'C'])
+    renamed = poller.refresh()
+    assert feeds.indexes == 1 and renamed.index is first.index
+    assert list(renamed.data['name']) == ['A', 'B', 'C']
+    feeds.latlon = latlon_frame(3, shift=0.01)
+    moved = poller.refresh()
+    assert feeds.indexes == 2
+    assert moved.index.lats[0] == feeds.latlon['lat'][0]
@@ -0,0 +1,96 @@
+import multiprocessing.spawn  # Import spawn to check that it is left as it was
+import sys  # Import sys to stand in for Streamlit's __main__
+import threading  # Import threading to hold back a slow system
+import time  # Import time to wait for the slow system
+import types  # Import types for the stand-in main module
+
+import pytest  # Import pytest for fixtures
+
+import stand_in  # Import the local stand-in services
+import systems  # Import the module under test
+from geo import StationIndex  # Import the spatial index the pollers build
+from snapshot import StationPoller  # Import the poller the registry starts
+
+
+@pytest.fixture
+def server():
+    server = stand_in.StandInServer(stations=50).start()
+    yield server
+    server.close()
+
+
+def test_shard_workers_do_not_run_the_app_script(server, tmp_path, monkeypatch):
+    marker = tmp_path / 'ran'
+    script = tmp_path / 'app.py'
+    script.write_text('open({!r}, "w").close()\n'.format(str(marker)))
+    main = types.ModuleType('__main__')  # What Streamlit installs while it runs the app
+    main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, '__main__', main)
+
+    system = systems.discover(server.url('/gbfs/gbfs.json'))
+    loader = systems.ShardedFeedLoader(shards=1)
+    try:
+        status, latlon = loader.fetcher(system)()
+    finally:
+        loader.shutdown()
+    assert len(status) == 50 and len(latlon) == 50
+    assert not marker.exists()
+
+
+def test_shard_workers_leave_spawn_unpatched(server):
+    original = multiprocessing.spawn.get_preparation_data
+    system = systems.discover(server.url('/gbfs/gbfs.json'))
+    loader = systems.ShardedFeedLoader(shards=1)
+    try:
+        loader.fetcher(system)()
+        assert multiprocessing.spawn.get_preparation_data is original
+    finally:
+        loader.shutdown()
+
+
+def test_discover_all_leaves_out_systems_that_fail(server):
+    found = systems.discover_all([server.url('/missing/gbfs.json'), server.url('/gbfs/gbfs.json')])
+    assert [system.station_status_url for system in found] == [server.url('/gbfs/station_status.json')]
+    with pytest.raises(RuntimeError):
+        systems.discover_all([server.url('/missing/gbfs.json')])
+
+
+# Define the function to build a registry over the stand-in system plus a broken and a slow one
+def make_registry(server, gate):
+    good = systems.discover(server.url('/gbfs/gbfs.json'))
+    broken = good._replace(system_id='broken', station_status_url=server.url('/missing/station_status.json'))
+    slow = good._replace(system_id='slow', station_status_url=good.station_status_url + '?slow',
+                         station_information_url=good.station_information_url + '?slow')
+
+    def make_poller(system, fetch):
+        if system.system_id == 'slow':
+            fetch = lambda fetch=fetch: (gate.wait(30), fetch())[1]  # First load waits for the test
+        return StationPoller(fetch, lambda status, latlon: status.merge(latlon, on='station_id'), StationIndex.from_frame)
+    return systems.SystemRegistry([broken, slow, good], make_poller, systems.ShardedFeedLoader(shards=0), retry_interval=0.1)
+
+
+def test_registry_starts_without_waiting_for_slow_or_broken_systems(server):
+    gate = threading.Event()
+    registry = make_registry(server, gate)
+    try:
+        registry.start(timeout=30)
+        assert list(registry.systems) == [registry._configured[2].system_id]
+        gate.set()
+        for _ in range(300):
+            if 'slow' in registry.systems:
+                break
+            time.sleep(0.01)
+        assert list(registry.systems) == ['slow', registry._configured[2].system_id]  # Configured order
+        assert registry.snapshot('slow') is not None
+        assert 'broken' not in registry.pollers
+    finally:
+        registry.stop()
+
+
+def test_registry_fails_when_no_system_loads(server):
+    broken = systems.System('broken', 'Broken', None, server.url('/missing/station_status.json'),
+                            server.url('/missing/station_information.json'))
+    registry = systems.SystemRegistry([broken], lambda system, fetch: StationPoller(fetch, None, None),
+                                      systems.ShardedFeedLoader(shards=0))
+    with pytest.raises(RuntimeError):
+        registry.start(timeout=30)
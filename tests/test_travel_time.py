@@ -0,0 +1,63 @@
+import pytest  # Import pytest for approx
+
+from travel_time import SPEEDS, TravelTimeEstimator, distance_m  # Import the module under test
+
+ORIGIN = [43.6510, -79.3800]
+FAR_ORIGIN = [43.7500, -79.5000]  # Another calibration area
+
+
+# Define the function to get a point about meters east of origin
+def east(origin, meters):
+    return [origin[0], origin[1] + meters / 80500.0]  # ~80.5 km per degree of longitude in Toronto
+
+
+# Define the function to get the seconds of a route with a given detour factor
+def route_seconds(origin, destination, profile, factor):
+    return distance_m(origin, destination) * factor / SPEEDS[profile]
+
+
+def test_default_detour_until_enough_routes():
+    estimator = TravelTimeEstimator(min_samples=3)
+    destination = east(ORIGIN, 1000)
+    assert estimator.detour(ORIGIN, 'foot') == (1.4, 'default')
+    assert estimator.estimate(ORIGIN, destination, 'foot') == pytest.approx(distance_m(ORIGIN, destination) * 1.4 / 1.35)
+    for meters in (500, 800):
+        assert estimator.observe(ORIGIN, east(ORIGIN, meters), 'foot', route_seconds(ORIGIN, east(ORIGIN, meters), 'foot', 1.2))
+    assert estimator.detour(ORIGIN, 'foot') == (1.4, 'default')
+
+
+def test_area_factor_then_profile_factor():
+    estimator = TravelTimeEstimator(min_samples=3)
+    for meters, factor in ((500, 1.2), (800, 1.3), (1200, 1.6)):
+        estimator.observe(ORIGIN, east(ORIGIN, meters), 'foot', route_seconds(ORIGIN, east(ORIGIN, meters), 'foot', factor))
+    factor, source = estimator.detour(ORIGIN, 'foot')
+    assert (factor, source) == (pytest.approx(1.3), 'area')
+    factor, source = estimator.detour(FAR_ORIGIN, 'foot')  # No routes from there yet
+    assert (factor, source) == (pytest.approx(1.3), 'profile')
+    assert estimator.detour(ORIGIN, 'cycling') == (1.4, 'default')  # Other profiles keep their own factors
+
+
+def test_calibrate_from_cached_routes():
+    samples = [(ORIGIN, east(ORIGIN, meters), 'driving', route_seconds(ORIGIN, east(ORIGIN, meters), 'driving', 2.0))
+               for meters in (400, 600, 900, 1500, 2500)]
+    estimator = TravelTimeEstimator().calibrate(samples)
+    destination = east(ORIGIN, 3000)
+    assert estimator.estimate(ORIGIN, destination, 'driving') == pytest.approx(route_seconds(ORIGIN, destination, 'driving', 2.0))
+
+
+def test_implausible_and_short_routes_are_not_used():
+    estimator = TravelTimeEstimator(min_samples=1)
+    destination = east(ORIGIN, 1000)
+    car_seconds = route_seconds(ORIGIN, destination, 'driving', 1.4)
+    assert not estimator.observe(ORIGIN, destination, 'foot', car_seconds)  # A car route answering a foot request
+    assert not estimator.observe(ORIGIN, destination, 'foot', route_seconds(ORIGIN, destination, 'foot', 8.0))
+    assert not estimator.observe(ORIGIN, east(ORIGIN, 100), 'foot', 600.0)  # Too short to tell
+    assert not estimator.observe(ORIGIN, destination, 'foot', 0)
+    assert estimator.detour(ORIGIN, 'foot') == (1.4, 'default')
+
+
+def test_detour_is_never_below_one():
+    estimator = TravelTimeEstimator(default_detour=0.8)
+    destination = east(ORIGIN, 1000)
+    assert estimator.detour(ORIGIN, 'foot') == (1.0, 'default')
+    assert estimator.estimate(ORIGIN, destination, 'foot') == pytest.approx(distance_m(ORIGIN, destination) / 1.35)
@@ -0,0 +1,54 @@
+"""Shared HTTP transport for the GBFS feeds, geocoding and routing calls."""
+
+import threading  # Import threading to guard the shared session
+
+import requests  # Import requests for making HTTP requests
+from requests.adapters import HTTPAdapter  # Import HTTPAdapter for connection pooling
+from urllib3.util.retry import Retry  # Import Retry for backoff on transient failures
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+USER_AGENT = 'clicked-demo'  # Identify the app to upstream services
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Define the function to build a session with keep-alive pools and retries
+def build_session(pool_connections=16, pool_maxsize=32, retries=3, backoff_factor=0.3):
+    """Return a requests.Session with per-host connection pools, gzip and retry with backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,  # 0.3 s, 0.6 s, 1.2 s ...
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # Hand the last response back to the caller
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+
+# Define the function to get the process-wide session
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+    return _session
+
+
+# Define the function to make a GET request through the shared session
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)  # Never wait forever on an upstream
+    return get_session().get(url, **kwargs)
+
+
+# Define the function to fetch and decode a JSON document
+def get_json(url, **kwargs):
+    response = get(url, **kwargs)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,105 @@
+"""Instant travel-time estimates from straight-line distance, calibrated per area from real routes."""
+
+import statistics  # Import statistics for the median detour factor
+import threading  # Import threading to guard the shared state
+from collections import deque  # Import deque for the bounded sample windows
+
+from geo import haversine_km  # Import the great-circle distance
+from routing import get_route_cache, snap_origin  # Import the cached routes and the grid cells
+
+SPEEDS = {'foot': 1.35, 'cycling': 4.2, 'driving': 8.0}  # Meters per second along the road
+DEFAULT_DETOUR = 1.4  # Road distance over straight-line distance in a typical street grid
+AREA_METERS = 2000.0  # Detour factors are calibrated per ~2 km cell around the origin
+MIN_SAMPLES = 5  # Routes an area (or profile) needs before its own factor is used
+MAX_SAMPLES = 200  # Most recent routes kept per area
+MIN_METERS = 150.0  # Shorter trips are dominated by snapping to the road and are not used
+MIN_DETOUR = 1.0  # No road is shorter than the straight line; a lower factor means a faster profile answered
+MAX_DETOUR = 5.0  # Higher factors are ferries, closures or snapping far away, not the street layout
+
+
+class TravelTimeEstimator:
+    """Estimate seconds as straight-line meters x detour factor / profile speed
+
+    The detour factor of an area is the median of duration x speed / distance
+    over the routes seen from there, so it also absorbs the local traffic and
+    street layout. Areas with fewer than min_samples routes use the profile's
+    overall median, and DEFAULT_DETOUR until that has enough routes too.
+
+    Routes whose factor is outside [min_detour, max_detour] are not used: an
+    OSRM server built for cars answers a foot request with a car route, which
+    would make walking look several times faster than it is.
+    """
+
+    def __init__(self, speeds=SPEEDS, default_detour=DEFAULT_DETOUR, area_meters=AREA_METERS,
+                 min_samples=MIN_SAMPLES, max_samples=MAX_SAMPLES, min_detour=MIN_DETOUR, max_detour=MAX_DETOUR):
+        self.speeds = dict(speeds)
+        self.default_detour = default_detour
+        self.min_detour = min_detour
+        self.max_detour = max_detour
+        self.area_meters = area_meters
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self._areas = {}  # (profile, row, col) -> deque of detour factors
+        self._profiles = {}  # profile -> deque of detour factors
+        self._lock = threading.Lock()
+
+    def _speed(self, profile):
+        return self.speeds.get(profile, self.speeds['driving'])
+
+    def _area(self, origin, profile):
+        return (profile,) + snap_origin(origin, self.area_meters)
+
+    def observe(self, origin, destination, profile, seconds):
+        """Add the duration of one real route from origin to destination ([lat, lon]); return whether it was used"""
+        meters = distance_m(origin, destination)
+        if meters < MIN_METERS or not seconds or seconds <= 0:
+            return False
+        factor = seconds * self._speed(profile) / meters
+        if not self.min_detour <= factor <= self.max_detour:
+            return False  # An implausible speed for profile
+        with self._lock:
+            for samples, key in ((self._areas, self._area(origin, profile)), (self._profiles, profile)):
+                window = samples.get(key)
+                if window is None:
+                    window = samples[key] = deque(maxlen=self.max_samples)
+                window.append(factor)
+        return True
+
+    def calibrate(self, samples):
+        """Observe every (origin, destination, profile, seconds) of samples; return self"""
+        for origin, destination, profile, seconds in samples:
+            self.observe(origin, destination, profile, seconds)
+        return self
+
+    def detour(self, origin, profile='driving'):
+        """Return (detour factor, source) where source is 'area', 'profile' or 'default'; never below min_detour"""
+        with self._lock:
+            for source, window in (('area', self._areas.get(self._area(origin, profile))),
+                                   ('profile', self._profiles.get(profile))):
+                if window is not None and len(window) >= self.min_samples:
+                    return max(statistics.median(window), self.min_detour), source
+        return max(self.default_detour, self.min_detour), 'default'
+
+    def estimate(self, origin, destination, profile='driving'):
+        """Return the estimated seconds from origin to destination ([lat, lon])"""
+        factor, _ = self.detour(origin, profile)
+        return distance_m(origin, destination) * factor / self._speed(profile)
+
+
+# Define the function to get the straight-line distance between two points
+def distance_m(origin, destination):
+    return float(haversine_km(origin[0], origin[1], destination[0], destination[1])) * 1000.0
+
+
+_estimator = None
+_estimator_lock = threading.Lock()
+
+
+# Define the function to get the process-wide estimator
+def get_travel_time_estimator():
+    """Return the estimator, calibrated on first use from the routes in the route cache"""
+    global _estimator
+    with _estimator_lock:
+        if _estimator is None:
+            _estimator = TravelTimeEstimator().calibrate(get_route_cache().samples())
+    return _estimator